@@ -0,0 +1,992 @@
+import bisect
+import csv
+import io
+import locale
+import logging
+import math
+import mmap
+import multiprocessing
+import os
+import re
+import struct
+import sys
+from abc import ABC, abstractmethod
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from enum import Enum
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from durabilidadeUtils import (
+    aplicarRemendos,
+    recuperarArquivo,
+    removerArquivo,
+    substituirArquivo,
+)
+from indicesUtils import COMPARADORES, interpretarFiltro
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class FormatosDeArquivo(Enum):
+    CSV = "csv"
+    COLUNAR = "colunar"
+    FIXO = "fixo"
+
+
+class ModosDeArmazenamento(Enum):
+    DIRETO = "direto"
+    JOURNAL = "journal"
+
+
+def assinaturaDoArquivo(caminho: str):
+    try:
+        estado = os.stat(caminho)
+    except FileNotFoundError:
+        return None
+    return (estado.st_ino, estado.st_size, estado.st_mtime_ns)
+
+
+# Layout das colunas de Personagem no formato colunar: inteiros em arrays
+# tipados, classe e status codificados por dicionário (poucos valores
+# distintos) e nome como texto livre.
+COLUNAS_INTEIRAS = ["id", "hp", "hpMax", "mp", "mpMax"]
+COLUNAS_CATEGORICAS = ["classe", "status"]
+COLUNAS_DE_TEXTO = ["nome"]
+COLUNAS_DERIVADAS = {"hpProporcao": ("hp", "hpMax"), "mpProporcao": ("mp", "mpMax")}
+
+LIMITES_INT32 = (-(2**31), 2**31 - 1)
+LIMITES_INT64 = (-(2**63), 2**63 - 1)
+
+
+# Formatos binários guardam os inteiros em int64; valores maiores são recusados
+# na validação em vez de quebrarem a escrita.
+def validarInteiros64(personagem, campos: Iterable[str]):
+    for campo in campos:
+        valor = getattr(personagem, campo)
+        if valor is not None and not LIMITES_INT64[0] <= valor <= LIMITES_INT64[1]:
+            raise ValueError(f"O campo {campo} precisa caber em um inteiro de 64 bits")
+
+
+def criarColunaInteira(valores: Sequence[int]) -> array:
+    # int32 quando todos os valores cabem, int64 caso contrário.
+    if all(LIMITES_INT32[0] <= valor <= LIMITES_INT32[1] for valor in valores):
+        return array("i", valores)
+    return array("q", valores)
+
+
+# O dicionário é mantido em ordem, então comparar códigos equivale a comparar
+# os textos, e ordenar pela coluna não precisa decodificá-la.
+def codificarDicionario(valores: Sequence[str]) -> Tuple[List[str], array]:
+    dicionario = sorted(set(valores))
+    codigoDoValor = {valor: codigo for codigo, valor in enumerate(dicionario)}
+    return dicionario, array("I", [codigoDoValor[valor] for valor in valores])
+
+
+def escreverComFsync(caminho: str, escrever, modo: str = "w"):
+    opcoes = {"newline": ""} if "b" not in modo else {}
+    with open(caminho, mode=modo, **opcoes) as file:
+        escrever(file)
+        file.flush()
+        os.fsync(file.fileno())
+
+
+# Métodos exigidos de um formato por cada capacidade que ele declara.
+CAPACIDADES_DOS_FORMATOS = (("permiteAnexar", "anexar"), ("alteraNoLugar", "aplicar"))
+
+
+# Um formato sabe ler e gravar o arquivo base do repositório. O repositório
+# continua dono da memória, do journal e do escritor; o formato só traduz
+# personagens (qualquer objeto com os atributos de Personagem) de e para disco.
+# Todo formato lê e escreve o arquivo inteiro; anexar e aplicar só são
+# exigidos de quem declara permiteAnexar ou alteraNoLugar, e um formato
+# incompleto falha já na definição da classe ou ao ser criado.
+class FormatoDeArmazenamento(ABC):
+    colunar = False
+    permiteAnexar = False
+    alteraNoLugar = False
+    particionado = False
+    # Arquivos de texto podem ser editados à mão; nos binários uma soma que
+    # não confere é sinal de corrupção.
+    textual = False
+    # Ligado por carregar quando os dados lidos precisam ser regravados (por
+    # exemplo, partições de uma quantidade antiga).
+    precisaReescrever = False
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for capacidade, metodo in CAPACIDADES_DOS_FORMATOS:
+            herdado = getattr(FormatoDeArmazenamento, metodo)
+            if getattr(cls, capacidade) and getattr(cls, metodo) is herdado:
+                raise TypeError(
+                    f"{cls.__name__} tem {capacidade} sem implementar {metodo}"
+                )
+
+    def __init__(self, caminho: str, campos: List[str]):
+        self.caminho = caminho
+        self.campos = campos
+
+    def assinatura(self):
+        return assinaturaDoArquivo(self.caminho)
+
+    def tamanho(self, caminho: Optional[str] = None) -> int:
+        return os.path.getsize(caminho or self.caminho)
+
+    # As linhas do arquivo como tuplas na ordem de `campos`, com as colunas
+    # inteiras já convertidas.
+    @abstractmethod
+    def carregarTuplas(self) -> Iterator[Tuple]:
+        ...
+
+    @abstractmethod
+    def escrever(self, caminho: str, personagens: Iterable):
+        ...
+
+    # Só para formatos com permiteAnexar: grava os personagens no fim do
+    # arquivo.
+    def anexar(self, personagens: Iterable):
+        raise TypeError(f"{type(self).__name__} não anexa registros")
+
+    # Só para formatos com alteraNoLugar: recebe (operacao, personagem) em
+    # ordem, grava cada registro direto na posição dele e devolve quantos bytes
+    # foram escritos.
+    def aplicar(self, alteracoes: Iterable[Tuple[str, Any]]) -> int:
+        raise TypeError(f"{type(self).__name__} não altera registros no lugar")
+
+    # Recusa, antes de a memória ser alterada, personagens que o formato não
+    # consegue gravar.
+    def validar(self, personagem):
+        pass
+
+    # Troca o arquivo pelo temporário já escrito, guardando a soma de
+    # verificação do novo (durabilidadeUtils).
+    def substituir(self, caminhoTemporario: str):
+        substituirArquivo(caminhoTemporario, self.caminho)
+
+    # Confere o arquivo com a soma de verificação antes de ele ser lido e
+    # completa uma gravação que uma queda deixou pela metade; devolve se o
+    # arquivo mudou.
+    def recuperar(self) -> bool:
+        return recuperarArquivo(self.caminho, self.textual)
+
+    def reescrever(self, personagens: Iterable):
+        caminhoTemporario = self.caminho + ".tmp"
+        self.escrever(caminhoTemporario, personagens)
+        self.substituir(caminhoTemporario)
+
+
+def conversoresDosCampos(campos: List[str]) -> List[Tuple[str, Callable]]:
+    return [(campo, int if campo in COLUNAS_INTEIRAS else str) for campo in campos]
+
+
+# Decodificador de linhas do csv.reader montado uma vez a partir do cabeçalho:
+# as posições e conversores de cada campo são resolvidos antes da leitura, sem
+# o dicionário por linha do DictReader. É o único caminho de leitura de CSV.
+# Com `tipado=False` devolve um dicionário campo -> texto, só com as colunas
+# presentes no cabeçalho, para quem valida com o pydantic; como no
+# DictReader, um campo que falta na linha vem como None. Colunas a mais são
+# ignoradas e um nome repetido no cabeçalho vale pela última posição; no modo
+# tipado uma linha com colunas a menos levanta IndexError.
+def compilarDecodificador(
+    cabecalho: List[str], campos: List[str], tipado: bool = True
+) -> Callable[[List[str]], Any]:
+    posicoes = {campo: posicao for posicao, campo in enumerate(cabecalho)}
+    if not tipado:
+        presentes = [(campo, posicoes[campo]) for campo in campos if campo in posicoes]
+        return lambda linha: {
+            campo: linha[posicao] if posicao < len(linha) else None
+            for campo, posicao in presentes
+        }
+    faltando = [campo for campo in campos if campo not in posicoes]
+    if faltando:
+        raise ValueError(f"Colunas ausentes no cabeçalho: {', '.join(faltando)}")
+    colunas = [
+        (posicoes[campo], conversor)
+        for campo, conversor in conversoresDosCampos(campos)
+    ]
+    return lambda linha: tuple(
+        [conversor(linha[posicao]) for posicao, conversor in colunas]
+    )
+
+
+# Aplica o decodificador às linhas do leitor, pulando as vazias como o
+# DictReader, e aponta a linha em que a conversão falhou.
+def decodificarLinhas(leitor, decodificador: Callable, origem: str) -> Iterator:
+    try:
+        yield from map(decodificador, filter(None, leitor))
+    except IndexError:
+        raise ValueError(f"Linha {leitor.line_num} de {origem} com colunas faltando")
+    except ValueError as e:
+        raise ValueError(f"Linha {leitor.line_num} de {origem} inválida: {e}") from e
+
+
+# Leitura paralela do CSV: a partir de LIMIAR_DA_LEITURA_PARALELA bytes o
+# arquivo é dividido em trechos que começam e terminam em quebras de linha, e
+# cada trecho é lido e convertido em tuplas num processo separado, de forma
+# que a carga escala com os núcleos em vez de ficar presa ao GIL. Os
+# processos são criados com spawn porque o servidor tem threads rodando.
+LIMIAR_DA_LEITURA_PARALELA = 32 * 1024 * 1024
+TAMANHO_MINIMO_DO_TRECHO = 4 * 1024 * 1024
+TRECHOS_POR_PROCESSO = 4
+
+# 0 usa um processo por núcleo; 1 desliga a leitura paralela.
+processosDeLeitura = 0
+
+
+def configurarLeituraParalela(processos: int):
+    global processosDeLeitura
+    if processos < 0:
+        raise ValueError(f"Quantidade inválida de processos de leitura: {processos}")
+    processosDeLeitura = processos
+
+
+# Núcleos que este processo pode usar: sched_getaffinity respeita o taskset e
+# os limites do contêiner onde existe; cpu_count conta os da máquina.
+def nucleosDisponiveis() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
+# Nunca mais processos que núcleos: a conversão é presa à CPU, e com um núcleo
+# só os processos disputam o mesmo núcleo e ainda pagam o spawn e a cópia das
+# tuplas de volta (39 MB: 5,6 s com 2 processos contra 2,7 s sequencial, ver
+# o README), então a leitura fica sequencial.
+def quantidadeDeProcessosDeLeitura() -> int:
+    nucleos = nucleosDisponiveis()
+    return min(processosDeLeitura or nucleos, nucleos)
+
+
+def abrirTexto(dados: bytes) -> io.TextIOWrapper:
+    # Mesma codificação padrão do open() usado na leitura sequencial.
+    return io.TextIOWrapper(io.BytesIO(dados), newline="")
+
+
+# Roda nos processos de leitura. Além das tuplas, diz se o trecho terminou
+# dentro de um campo entre aspas: um nome com quebra de linha cortado ao meio
+# pela divisão, que o csv devolve incompleto e com a quebra no fim do último
+# campo em vez de acusar erro. Por isso cada linha só é convertida depois de
+# lida a seguinte, e a última só se não estiver cortada.
+def lerTrechoDoCSV(
+    caminho: str, inicio: int, fim: int, cabecalho: List[str], campos: List[str]
+) -> Tuple[List[Tuple], bool]:
+    with open(caminho, mode="rb") as file:
+        file.seek(inicio)
+        dados = file.read(fim - inicio)
+    decodificador = compilarDecodificador(cabecalho, campos)
+    tuplas = []
+    anterior: Optional[List[str]] = None
+    try:
+        for linha in filter(None, csv.reader(abrirTexto(dados))):
+            if anterior is not None:
+                tuplas.append(decodificador(anterior))
+            anterior = linha
+        if anterior is None:
+            return tuplas, False
+        if anterior[-1].endswith("\n"):
+            return [], True
+        tuplas.append(decodificador(anterior))
+    except (IndexError, ValueError) as e:
+        raise ValueError(
+            f"Linha inválida em {caminho}, no trecho a partir do byte {inicio}: {e}"
+        ) from e
+    return tuplas, False
+
+
+# Devolve None quando o arquivo não pode ser dividido por linhas (cabeçalho sem
+# algum dos campos ou campos com quebra de linha na divisa de dois trechos) e
+# a leitura precisa ser sequencial.
+def lerCSVEmParalelo(
+    caminho: str, campos: List[str], processos: int
+) -> Optional[List[List[Tuple]]]:
+    with open(caminho, mode="rb") as file:
+        cabecalho = next(csv.reader(abrirTexto(file.readline())), [])
+        if not set(campos) <= set(cabecalho):
+            return None
+        inicio = file.tell()
+        tamanho = os.fstat(file.fileno()).st_size
+        quantidade = max(
+            1,
+            min(
+                processos * TRECHOS_POR_PROCESSO,
+                (tamanho - inicio) // TAMANHO_MINIMO_DO_TRECHO,
+            ),
+        )
+        limites = [inicio]
+        for trecho in range(1, quantidade):
+            meio = inicio + (tamanho - inicio) * trecho // quantidade
+            file.seek(max(meio, limites[-1]))
+            file.readline()
+            limites.append(file.tell())
+        limites.append(tamanho)
+    trechos = [(a, b) for a, b in zip(limites, limites[1:]) if a < b]
+    resultados = []
+    with ProcessPoolExecutor(
+        max_workers=min(processos, len(trechos) or 1),
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as executor:
+        futuros = [
+            executor.submit(lerTrechoDoCSV, caminho, a, b, cabecalho, campos)
+            for a, b in trechos
+        ]
+        # Os trechos são conferidos em ordem: se um deles terminou no meio de
+        # um campo, o seguinte começou no lugar errado e pode ter falhado ou
+        # devolvido lixo, então nada mais é aproveitado.
+        for futuro in futuros:
+            tuplas, cortado = futuro.result()
+            if cortado:
+                for pendente in futuros:
+                    pendente.cancel()
+                return None
+            resultados.append(tuplas)
+    return resultados
+
+
+class FormatoCSV(FormatoDeArmazenamento):
+    permiteAnexar = True
+    textual = True
+
+    def carregarTuplas(self) -> Iterator[Tuple]:
+        processos = quantidadeDeProcessosDeLeitura()
+        if processos > 1 and self.tamanho() >= LIMIAR_DA_LEITURA_PARALELA:
+            trechos = lerCSVEmParalelo(self.caminho, self.campos, processos)
+            if trechos is not None:
+                for tuplas in trechos:
+                    yield from tuplas
+                return
+            logging.info(
+                f"{self.caminho} não pôde ser dividido por linhas;"
+                " lido sequencialmente"
+            )
+        with open(self.caminho, mode="r", newline="") as file:
+            leitor = csv.reader(file)
+            cabecalho = next(leitor, None)
+            if cabecalho is None:
+                return
+            decodificador = compilarDecodificador(cabecalho, self.campos)
+            yield from decodificarLinhas(leitor, decodificador, self.caminho)
+
+    def escreverLinhas(self, file, personagens: Iterable, cabecalho: bool):
+        writer = csv.writer(file)
+        if cabecalho:
+            writer.writerow(self.campos)
+        campos = self.campos
+        writer.writerows(
+            [getattr(personagem, campo) for campo in campos]
+            for personagem in personagens
+        )
+
+    def escrever(self, caminho: str, personagens: Iterable):
+        escreverComFsync(
+            caminho, lambda file: self.escreverLinhas(file, personagens, True)
+        )
+
+    # As linhas vão por aplicarRemendos, que protege o anexo contra quedas.
+    def anexar(self, personagens: Iterable):
+        texto = io.StringIO(newline="")
+        self.escreverLinhas(texto, personagens, False)
+        dados = texto.getvalue().encode(locale.getpreferredencoding(False))
+        aplicarRemendos(self.caminho, [(self.tamanho(), dados)])
+
+
+# Arquivo colunar binário (little-endian):
+#   "PERSCOL1", quantidade de linhas (uint32), quantidade de colunas (uint16)
+#   por coluna: nome (uint16 + utf-8), tipo (1 byte) e o conteúdo:
+#     b"i" inteira:     typecode do array (1 byte) + valores
+#     b"d" dicionário:  quantidade de entradas (uint32), cada entrada
+#                       (uint32 + utf-8), seguidas dos códigos uint32
+#     b"t" texto:       tamanhos uint32 de cada valor + bytes utf-8 concatenados
+class FormatoColunar(FormatoDeArmazenamento):
+    colunar = True
+    ASSINATURA = b"PERSCOL1"
+
+    def validar(self, personagem):
+        validarInteiros64(personagem, COLUNAS_INTEIRAS)
+
+    @staticmethod
+    def bytesDoArray(valores: array) -> bytes:
+        if sys.byteorder == "big":
+            valores = array(valores.typecode, valores)
+            valores.byteswap()
+        return valores.tobytes()
+
+    @staticmethod
+    def arrayDosBytes(typecode: str, dados: bytes) -> array:
+        valores = array(typecode)
+        valores.frombytes(dados)
+        if sys.byteorder == "big":
+            valores.byteswap()
+        return valores
+
+    def escrever(self, caminho: str, personagens: Iterable):
+        personagens = list(personagens)
+        partes = [
+            self.ASSINATURA,
+            struct.pack("<IH", len(personagens), len(self.campos)),
+        ]
+        for campo in self.campos:
+            nome = campo.encode("utf-8")
+            partes.append(struct.pack("<H", len(nome)) + nome)
+            valores = [getattr(personagem, campo) for personagem in personagens]
+            if campo in COLUNAS_INTEIRAS:
+                coluna = criarColunaInteira(valores)
+                partes += [b"i", coluna.typecode.encode(), self.bytesDoArray(coluna)]
+            elif campo in COLUNAS_CATEGORICAS:
+                dicionario, codigos = codificarDicionario(valores)
+                partes += [b"d", struct.pack("<I", len(dicionario))]
+                for valor in dicionario:
+                    texto = valor.encode("utf-8")
+                    partes.append(struct.pack("<I", len(texto)) + texto)
+                partes.append(self.bytesDoArray(codigos))
+            else:
+                textos = [valor.encode("utf-8") for valor in valores]
+                tamanhos = array("I", [len(texto) for texto in textos])
+                partes += [b"t", self.bytesDoArray(tamanhos), b"".join(textos)]
+        escreverComFsync(caminho, lambda file: file.write(b"".join(partes)), "wb")
+
+    def lerColunas(self) -> Tuple[int, Dict[str, list]]:
+        with open(self.caminho, mode="rb") as file:
+            dados = file.read()
+        if dados[:8] != self.ASSINATURA:
+            raise ValueError(f"{self.caminho} não é um arquivo colunar de personagens")
+        quantidade, quantidadeDeColunas = struct.unpack_from("<IH", dados, 8)
+        posicao = 14
+        colunas = {}
+        for _ in range(quantidadeDeColunas):
+            (tamanhoDoNome,) = struct.unpack_from("<H", dados, posicao)
+            posicao += 2
+            campo = dados[posicao : posicao + tamanhoDoNome].decode("utf-8")
+            posicao += tamanhoDoNome
+            tipo = dados[posicao : posicao + 1]
+            posicao += 1
+            if tipo == b"i":
+                typecode = dados[posicao : posicao + 1].decode()
+                posicao += 1
+                fim = posicao + quantidade * array(typecode).itemsize
+                colunas[campo] = self.arrayDosBytes(typecode, dados[posicao:fim]).tolist()
+                posicao = fim
+            elif tipo == b"d":
+                (tamanhoDoDicionario,) = struct.unpack_from("<I", dados, posicao)
+                posicao += 4
+                dicionario = []
+                for _ in range(tamanhoDoDicionario):
+                    (tamanho,) = struct.unpack_from("<I", dados, posicao)
+                    posicao += 4
+                    dicionario.append(dados[posicao : posicao + tamanho].decode("utf-8"))
+                    posicao += tamanho
+                fim = posicao + quantidade * 4
+                codigos = self.arrayDosBytes("I", dados[posicao:fim])
+                colunas[campo] = [dicionario[codigo] for codigo in codigos]
+                posicao = fim
+            else:
+                fim = posicao + quantidade * 4
+                tamanhos = self.arrayDosBytes("I", dados[posicao:fim])
+                posicao = fim
+                textos = []
+                for tamanho in tamanhos:
+                    textos.append(dados[posicao : posicao + tamanho].decode("utf-8"))
+                    posicao += tamanho
+                colunas[campo] = textos
+        return quantidade, colunas
+
+    def carregarTuplas(self) -> Iterator[Tuple]:
+        _, colunas = self.lerColunas()
+        faltando = [campo for campo in self.campos if campo not in colunas]
+        if faltando:
+            raise ValueError(
+                f"Colunas ausentes em {self.caminho}: {', '.join(faltando)}"
+            )
+        yield from zip(*[colunas[campo] for campo in self.campos])
+
+
+# Registros de tamanho fixo: um cabeçalho ("PERSFIX1", tamanho do registro
+# uint32, 4 bytes reservados) seguido de registros com um byte de situação
+# (1 ativo, 0 removido) e os campos em ordem, inteiros int64 e textos utf-8
+# completados com zeros até a largura da coluna. Com o mapa id -> posição,
+# alterar ou remover um personagem toca só os bytes do registro dele, e
+# registros removidos são reaproveitados pelas próximas inserções.
+class FormatoRegistrosFixos(FormatoDeArmazenamento):
+    permiteAnexar = True
+    alteraNoLugar = True
+    ASSINATURA = b"PERSFIX1"
+    TAMANHO_DO_CABECALHO = 16
+    LARGURAS_DE_TEXTO = {"nome": 64, "classe": 32, "status": 32}
+
+    def __init__(self, caminho: str, campos: List[str]):
+        super().__init__(caminho, campos)
+        self.layout = struct.Struct(
+            "<B"
+            + "".join(
+                f"{self.LARGURAS_DE_TEXTO[campo]}s"
+                if campo in self.LARGURAS_DE_TEXTO
+                else "q"
+                for campo in campos
+            )
+        )
+        self.posicaoDoId = campos.index("id")
+        self.posicoes: Optional[Dict[int, int]] = None
+        self.livres: List[int] = []
+        self.quantidadeDeRegistros = 0
+
+    # Confere antes da escrita que o personagem cabe no registro: textos até a
+    # largura da coluna e inteiros dentro de int64.
+    def validar(self, personagem):
+        for campo, largura in self.LARGURAS_DE_TEXTO.items():
+            tamanho = len(getattr(personagem, campo).encode("utf-8"))
+            if tamanho > largura:
+                raise ValueError(
+                    f"O campo {campo} tem {tamanho} bytes, o limite é {largura}"
+                )
+        validarInteiros64(
+            personagem,
+            [campo for campo in self.campos if campo not in self.LARGURAS_DE_TEXTO],
+        )
+
+    # O struct completaria com zeros, mas também cortaria em silêncio um texto
+    # maior que a coluna (às vezes no meio de um caractere), então todo
+    # registro passa por validar antes de ser empacotado.
+    def empacotar(self, personagem, ativo: bool = True) -> bytes:
+        self.validar(personagem)
+        valores = []
+        for campo in self.campos:
+            valor = getattr(personagem, campo)
+            valores.append(valor.encode("utf-8") if isinstance(valor, str) else valor)
+        try:
+            return self.layout.pack(1 if ativo else 0, *valores)
+        except struct.error as e:
+            raise ValueError(f"Personagem {personagem.id} não cabe no registro: {e}")
+
+    def desempacotar(self, dados, deslocamento: int) -> Tuple[bool, Dict[str, Any]]:
+        situacao, *valores = self.layout.unpack_from(dados, deslocamento)
+        linha = {
+            campo: valor.rstrip(b"\0").decode("utf-8")
+            if isinstance(valor, bytes)
+            else valor
+            for campo, valor in zip(self.campos, valores)
+        }
+        return situacao == 1, linha
+
+    def deslocamento(self, posicao: int) -> int:
+        return self.TAMANHO_DO_CABECALHO + posicao * self.layout.size
+
+    def cabecalho(self) -> bytes:
+        return self.ASSINATURA + struct.pack("<II", self.layout.size, 0)
+
+    # Percorre o arquivo mapeado e devolve os registros ativos, refazendo o
+    # mapa de posições e a lista de registros livres no caminho.
+    def varrer(self) -> List[Dict[str, Any]]:
+        with open(self.caminho, mode="rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as dados:
+                if dados[:8] != self.ASSINATURA:
+                    raise ValueError(
+                        f"{self.caminho} não é um arquivo de registros fixos"
+                    )
+                (tamanhoDoRegistro,) = struct.unpack_from("<I", dados, 8)
+                if tamanhoDoRegistro != self.layout.size:
+                    raise ValueError(
+                        f"{self.caminho} usa registros de {tamanhoDoRegistro} bytes,"
+                        f" esperado {self.layout.size}"
+                    )
+                quantidade = (len(dados) - self.TAMANHO_DO_CABECALHO) // self.layout.size
+                posicoes = {}
+                livres = []
+                linhas = []
+                for posicao in range(quantidade):
+                    ativo, linha = self.desempacotar(dados, self.deslocamento(posicao))
+                    if ativo:
+                        posicoes[linha["id"]] = posicao
+                        linhas.append(linha)
+                    else:
+                        livres.append(posicao)
+        self.posicoes = posicoes
+        self.livres = livres
+        self.quantidadeDeRegistros = quantidade
+        return linhas
+
+    def garantirPosicoes(self) -> Dict[int, int]:
+        if self.posicoes is None:
+            self.varrer()
+        return self.posicoes
+
+    def carregarTuplas(self) -> Iterator[Tuple]:
+        for linha in self.varrer():
+            yield tuple(linha[campo] for campo in self.campos)
+
+    def escrever(self, caminho: str, personagens: Iterable):
+        registros = b"".join(self.empacotar(personagem) for personagem in personagens)
+        escreverComFsync(
+            caminho, lambda file: file.write(self.cabecalho() + registros), "wb"
+        )
+
+    def substituir(self, caminhoTemporario: str):
+        super().substituir(caminhoTemporario)
+        self.posicoes = None
+
+    def recuperar(self) -> bool:
+        self.posicoes = None
+        return super().recuperar()
+
+    def anexar(self, personagens: Iterable):
+        self.aplicar(("I", personagem) for personagem in personagens)
+
+    # Só a última alteração de cada id importa. Registros existentes são
+    # sobrescritos no lugar, remoções só zeram o byte de situação e inserções
+    # ocupam primeiro os registros livres; o que sobrar vai para o fim do
+    # arquivo numa única escrita. Os bytes são gravados por aplicarRemendos,
+    # que protege a escrita no lugar contra quedas.
+    def aplicar(self, alteracoes: Iterable[Tuple[str, Any]]) -> int:
+        finais: Dict[int, Tuple[str, Any]] = {}
+        for operacao, personagem in alteracoes:
+            finais[personagem.id] = (operacao, personagem)
+        posicoes = self.garantirPosicoes()
+        novos = []
+        remendos: List[Tuple[int, bytes]] = []
+        try:
+            for idPersonagem, (operacao, personagem) in finais.items():
+                posicao = posicoes.get(idPersonagem)
+                if operacao == "D":
+                    if posicao is not None:
+                        remendos.append((self.deslocamento(posicao), b"\0"))
+                        del posicoes[idPersonagem]
+                        self.livres.append(posicao)
+                    continue
+                registro = self.empacotar(personagem)
+                if posicao is None and self.livres:
+                    posicao = self.livres.pop()
+                if posicao is None:
+                    novos.append((idPersonagem, registro))
+                    continue
+                remendos.append((self.deslocamento(posicao), registro))
+                posicoes[idPersonagem] = posicao
+            if novos:
+                remendos.append(
+                    (
+                        self.deslocamento(self.quantidadeDeRegistros),
+                        b"".join(registro for _, registro in novos),
+                    )
+                )
+                for idPersonagem, _ in novos:
+                    posicoes[idPersonagem] = self.quantidadeDeRegistros
+                    self.quantidadeDeRegistros += 1
+            return aplicarRemendos(self.caminho, remendos)
+        except Exception:
+            self.posicoes = None
+            raise
+
+
+TAMANHO_DO_POOL_DE_PARTICOES = 8
+
+executorDeParticoes = ThreadPoolExecutor(
+    max_workers=TAMANHO_DO_POOL_DE_PARTICOES, thread_name_prefix="particoes"
+)
+
+
+# Divide os personagens em `quantidade` arquivos pelo id (id % quantidade),
+# cada um lido e gravado pelo formato interno: personagens.parte000.csv,
+# personagens.parte001.csv, ... (ou .col e .fix). Um lote de alterações só
+# toca as partições dos ids dele, e carregar ou reescrever tudo lê e grava as
+# partições em paralelo no executorDeParticoes. `caminho` não é um arquivo:
+# serve de nome do conjunto e, com um sufixo, de nome dos temporários de
+# cada partição.
+#
+# Se a quantidade mudar, carregar lê todas as partições que encontrar e liga
+# precisaReescrever; a reescrita redistribui os registros e apaga as
+# partições que sobraram.
+class FormatoParticionado(FormatoDeArmazenamento):
+    particionado = True
+
+    def __init__(
+        self,
+        formato: FormatosDeArquivo,
+        caminhoCSV: str,
+        campos: List[str],
+        quantidade: int,
+    ):
+        if quantidade <= 0:
+            raise ValueError(f"Quantidade de partições inválida: {quantidade}")
+        self.raiz = os.path.splitext(caminhoCSV)[0]
+        super().__init__(self.raiz + ".particoes", campos)
+        self.formato = formato
+        self.quantidade = quantidade
+        self.partes = [self.criarParte(indice) for indice in range(quantidade)]
+        self.colunar = self.partes[0].colunar
+
+    def criarParte(self, indice: int) -> FormatoDeArmazenamento:
+        return criarFormato(
+            self.formato, f"{self.raiz}.parte{indice:03d}.csv", self.campos
+        )
+
+    def particao(self, idPersonagem: int) -> int:
+        return idPersonagem % self.quantidade
+
+    # Todas as partições no disco, inclusive as de uma quantidade anterior.
+    def partesExistentes(self) -> List[Tuple[int, FormatoDeArmazenamento]]:
+        diretorio, nome = os.path.split(self.raiz)
+        extensao = os.path.splitext(self.partes[0].caminho)[1]
+        padrao = re.compile(re.escape(nome) + r"\.parte(\d{3,})" + re.escape(extensao))
+        existentes = []
+        for arquivo in os.listdir(diretorio or "."):
+            encontrado = padrao.fullmatch(arquivo)
+            if encontrado is None:
+                continue
+            indice = int(encontrado.group(1))
+            parte = (
+                self.partes[indice]
+                if indice < self.quantidade
+                else self.criarParte(indice)
+            )
+            existentes.append((indice, parte))
+        return sorted(existentes, key=lambda item: item[0])
+
+    def assinatura(self):
+        assinaturas = tuple(assinaturaDoArquivo(parte.caminho) for parte in self.partes)
+        if all(assinatura is None for assinatura in assinaturas):
+            return None
+        return assinaturas
+
+    def caminhosDasPartes(self, caminho: str) -> List[str]:
+        sufixo = caminho[len(self.caminho) :]
+        return [parte.caminho + sufixo for parte in self.partes]
+
+    def tamanho(self, caminho: Optional[str] = None) -> int:
+        return sum(
+            os.path.getsize(caminhoDaParte)
+            for caminhoDaParte in self.caminhosDasPartes(caminho or self.caminho)
+            if os.path.exists(caminhoDaParte)
+        )
+
+    def distribuir(
+        self, personagens: Iterable, indices: Optional[Iterable[int]] = None
+    ) -> Dict[int, List]:
+        if indices is None:
+            indices = range(self.quantidade)
+        grupos: Dict[int, List] = {indice: [] for indice in indices}
+        for personagem in personagens:
+            grupo = grupos.get(self.particao(personagem.id))
+            if grupo is not None:
+                grupo.append(personagem)
+        return grupos
+
+    def carregarTuplas(self) -> Iterator[Tuple]:
+        existentes = self.partesExistentes()
+        self.precisaReescrever = len(existentes) != self.quantidade or any(
+            indice >= self.quantidade for indice, _ in existentes
+        )
+        posicaoDoId = self.campos.index("id")
+
+        def lerParte(item: Tuple[int, FormatoDeArmazenamento]):
+            indice, parte = item
+            linhas = list(parte.carregarTuplas())
+            foraDoLugar = any(
+                self.particao(linha[posicaoDoId]) != indice for linha in linhas
+            )
+            return linhas, foraDoLugar
+
+        for linhas, foraDoLugar in executorDeParticoes.map(lerParte, existentes):
+            if foraDoLugar:
+                self.precisaReescrever = True
+            yield from linhas
+
+    def escrever(self, caminho: str, personagens: Iterable):
+        grupos = self.distribuir(personagens)
+        destinos = self.caminhosDasPartes(caminho)
+        list(
+            executorDeParticoes.map(
+                lambda indice: self.partes[indice].escrever(
+                    destinos[indice], grupos[indice]
+                ),
+                grupos,
+            )
+        )
+
+    def substituir(self, caminhoTemporario: str):
+        for parte, temporario in zip(
+            self.partes, self.caminhosDasPartes(caminhoTemporario)
+        ):
+            parte.substituir(temporario)
+        for indice, parte in self.partesExistentes():
+            if indice >= self.quantidade:
+                removerArquivo(parte.caminho)
+        self.precisaReescrever = False
+
+    def recuperar(self) -> bool:
+        alteradas = [parte.recuperar() for _, parte in self.partesExistentes()]
+        return any(alteradas)
+
+    def validar(self, personagem):
+        self.partes[0].validar(personagem)
+
+    # Agrupa o lote por partição e grava cada uma do jeito mais barato que o
+    # formato interno permite: no lugar, anexando (lote só de inserções) ou
+    # reescrevendo a partição a partir dos personagens atuais, que só são
+    # pedidos se alguma partição precisar ser reescrita. Devolve os bytes
+    # gravados.
+    def gravarAlteracoes(
+        self,
+        alteracoes: Iterable[Tuple[str, Any]],
+        obterPersonagens: Callable[[], Iterable],
+    ) -> int:
+        porParte: Dict[int, List[Tuple[str, Any]]] = {}
+        for operacao, personagem in alteracoes:
+            porParte.setdefault(self.particao(personagem.id), []).append(
+                (operacao, personagem)
+            )
+
+        def gravacaoNoLugar(indice: int) -> bool:
+            parte = self.partes[indice]
+            if not os.path.exists(parte.caminho):
+                return False
+            return parte.alteraNoLugar or (
+                parte.permiteAnexar
+                and all(operacao == "I" for operacao, _ in porParte[indice])
+            )
+
+        aReescrever = [indice for indice in porParte if not gravacaoNoLugar(indice)]
+        grupos = self.distribuir(obterPersonagens(), aReescrever) if aReescrever else {}
+
+        def gravarParte(indice: int) -> int:
+            parte = self.partes[indice]
+            if indice in grupos:
+                parte.reescrever(grupos[indice])
+                return parte.tamanho()
+            if parte.alteraNoLugar:
+                return parte.aplicar(porParte[indice])
+            tamanhoAnterior = parte.tamanho()
+            parte.anexar([personagem for _, personagem in porParte[indice]])
+            return parte.tamanho() - tamanhoAnterior
+
+        return sum(executorDeParticoes.map(gravarParte, porParte))
+
+
+def criarFormato(
+    formato: FormatosDeArquivo,
+    caminhoCSV: str,
+    campos: List[str],
+    particoes: int = 1,
+) -> FormatoDeArmazenamento:
+    if particoes > 1:
+        return FormatoParticionado(formato, caminhoCSV, campos, particoes)
+    if formato == FormatosDeArquivo.COLUNAR:
+        return FormatoColunar(os.path.splitext(caminhoCSV)[0] + ".col", campos)
+    if formato == FormatosDeArquivo.FIXO:
+        return FormatoRegistrosFixos(os.path.splitext(caminhoCSV)[0] + ".fix", campos)
+    return FormatoCSV(caminhoCSV, campos)
+
+
+# Versão em memória do layout colunar, montada a partir do instantâneo do
+# repositório, em que filtros viram máscaras sobre colunas inteiras e a
+# ordenação é um argsort. Com numpy as máscaras são vetorizadas; sem ele as
+# mesmas operações rodam em Python sobre os arrays tipados.
+class TabelaColunar:
+    def __init__(self, registros: Sequence):
+        self.tamanho = len(registros)
+        self.colunas: Dict[str, Any] = {}
+        self.dicionarios: Dict[str, List[str]] = {}
+        for campo in COLUNAS_INTEIRAS:
+            coluna = criarColunaInteira([getattr(r, campo) for r in registros])
+            self.colunas[campo] = self.vetor(coluna)
+        for campo in COLUNAS_CATEGORICAS:
+            dicionario, codigos = codificarDicionario(
+                [getattr(r, campo) for r in registros]
+            )
+            self.dicionarios[campo] = dicionario
+            self.colunas[campo] = self.vetor(codigos)
+        for campo in COLUNAS_DE_TEXTO:
+            self.colunas[campo] = [getattr(r, campo) for r in registros]
+        for campo, (campoAtual, campoMaximo) in COLUNAS_DERIVADAS.items():
+            self.colunas[campo] = self.calcularProporcao(campoAtual, campoMaximo)
+
+    # Com numpy as colunas viram ndarrays int64 (códigos de dicionário
+    # inclusive, para que comparar com -1 seja válido).
+    @staticmethod
+    def vetor(coluna: array):
+        if np is None:
+            return coluna
+        return np.frombuffer(coluna, dtype=coluna.typecode).astype(np.int64)
+
+    # Com o máximo zerado a proporção é NaN, que nenhuma comparação seleciona,
+    # como o registro fora do índice em indicesUtils.
+    def calcularProporcao(self, campoAtual: str, campoMaximo: str):
+        atual, maximo = self.colunas[campoAtual], self.colunas[campoMaximo]
+        if np is not None:
+            proporcao = np.full(self.tamanho, np.nan, dtype=np.float64)
+            np.divide(atual, maximo, out=proporcao, where=maximo != 0)
+            return proporcao
+        return array("d", [a / m if m else math.nan for a, m in zip(atual, maximo)])
+
+    # Para colunas de dicionário a comparação é feita sobre os códigos: como o
+    # dicionário é ordenado, basta traduzir o valor para a posição dele.
+    def traduzirCategorico(self, campo: str, operador: str, valor):
+        dicionario = self.dicionarios[campo]
+        if operador == "eq":
+            posicao = bisect.bisect_left(dicionario, valor)
+            encontrado = posicao < len(dicionario) and dicionario[posicao] == valor
+            return "eq", posicao if encontrado else -1
+        if operador in ("lt", "gte"):
+            return operador, bisect.bisect_left(dicionario, valor)
+        if operador in ("lte", "gt"):
+            return {"lte": "lt", "gt": "gte"}[operador], bisect.bisect_right(dicionario, valor)
+        raise ValueError(f"Operador {operador} não suportado para o campo {campo}")
+
+    def mascara(self, campo: str, operador: str, valor):
+        if campo not in self.colunas:
+            raise ValueError(f"Campo de filtro inválido: {campo}")
+        coluna = self.colunas[campo]
+        if campo in self.dicionarios:
+            operador, valor = self.traduzirCategorico(campo, operador, valor)
+        if np is not None and campo not in COLUNAS_DE_TEXTO:
+            if operador == "between":
+                return (coluna >= valor[0]) & (coluna <= valor[1])
+            return COMPARADORES[operador](coluna, valor)
+        comparar = COMPARADORES[operador]
+        return [comparar(elemento, valor) for elemento in coluna]
+
+    def selecionar(self, filtros: Dict[str, Any]) -> List[int]:
+        mascaraFinal = None
+        for chave, valor in filtros.items():
+            mascara = self.mascara(*interpretarFiltro(chave, valor))
+            if np is not None:
+                mascara = np.asarray(mascara, dtype=bool)
+                mascaraFinal = mascara if mascaraFinal is None else mascaraFinal & mascara
+            else:
+                mascaraFinal = (
+                    mascara
+                    if mascaraFinal is None
+                    else [a and b for a, b in zip(mascaraFinal, mascara)]
+                )
+        if mascaraFinal is None:
+            return list(range(self.tamanho))
+        if np is not None:
+            return np.flatnonzero(mascaraFinal).tolist()
+        return [posicao for posicao, atende in enumerate(mascaraFinal) if atende]
+
+    # Ordena por (campo, id) no sentido pedido, a mesma chave da paginação por
+    # cursor, então empates no campo saem com o id no mesmo sentido.
+    def ordenar(self, posicoes: List[int], campo: str, descendente: bool) -> List[int]:
+        coluna = self.colunas[campo]
+        ids = self.colunas["id"]
+        if np is not None and campo not in COLUNAS_DE_TEXTO:
+            indices = np.asarray(posicoes, dtype=np.int64)
+            valores = coluna[indices]
+            idsSelecionados = ids[indices]
+            if descendente:
+                valores, idsSelecionados = -valores, -idsSelecionados
+            ordem = np.lexsort((idsSelecionados, valores))
+            return indices[ordem].tolist()
+        return sorted(
+            posicoes,
+            key=lambda posicao: (coluna[posicao], ids[posicao]),
+            reverse=descendente,
+        )
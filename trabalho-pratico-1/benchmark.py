@@ -0,0 +1,410 @@
+import argparse
+import csv
+import datetime
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+import exportacaoUtils
+import persistUtils
+from armazenamentoUtils import (
+    FormatoCSV,
+    FormatosDeArquivo,
+    ModosDeArmazenamento,
+    configurarLeituraParalela,
+    lerCSVEmParalelo,
+    nucleosDisponiveis,
+)
+from durabilidadeUtils import ModosDeDurabilidade, configurarDurabilidade
+from estatisticasUtils import percentil
+from persistUtils import DirecoesDeOrdenacao, Personagem
+
+CLASSES = ["Mago", "Guerreiro", "Arqueiro", "Clerigo", "Ladino"]
+STATUS = ["Vivo", "Morto", "Envenenado", "Paralisado"]
+
+
+# Elenco sintético determinístico (mesma semente, mesmo arquivo), para que os
+# números de commits diferentes sejam comparáveis.
+def gerarCSV(caminho: str, quantidade: int, semente: int):
+    aleatorio = random.Random(semente)
+    with open(caminho, mode="w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(persistUtils.CAMPOS_PERSONAGEM)
+        for idPersonagem in range(1, quantidade + 1):
+            hpMax = aleatorio.randint(50, 500)
+            mpMax = aleatorio.randint(0, 300)
+            writer.writerow(
+                [
+                    idPersonagem,
+                    f"Personagem {idPersonagem}",
+                    aleatorio.choice(CLASSES),
+                    aleatorio.randint(0, hpMax),
+                    hpMax,
+                    aleatorio.randint(0, mpMax),
+                    mpMax,
+                    aleatorio.choice(STATUS),
+                ]
+            )
+
+
+def personagemAleatorio(aleatorio: random.Random, idPersonagem=None) -> Personagem:
+    hpMax = aleatorio.randint(50, 500)
+    mpMax = aleatorio.randint(0, 300)
+    return Personagem(
+        id=idPersonagem,
+        nome=f"Novo {aleatorio.randint(0, 10**9)}",
+        classe=aleatorio.choice(CLASSES),
+        hp=aleatorio.randint(0, hpMax),
+        hpMax=hpMax,
+        mp=aleatorio.randint(0, mpMax),
+        mpMax=mpMax,
+        status=aleatorio.choice(STATUS),
+    )
+
+
+def resumirTempos(tempos: List[float], duracaoTotal: float) -> Dict:
+    ordenados = sorted(tempos)
+    return {
+        "operacoes": len(tempos),
+        "opsPorSegundo": len(tempos) / duracaoTotal if duracaoTotal else None,
+        "latenciaMs": {
+            "media": sum(tempos) / len(tempos) * 1000,
+            "p50": percentil(ordenados, 50) * 1000,
+            "p95": percentil(ordenados, 95) * 1000,
+            "p99": percentil(ordenados, 99) * 1000,
+            "maximo": ordenados[-1] * 1000,
+        },
+    }
+
+
+def medir(operacao: Callable[[int], object], repeticoes: int) -> Dict:
+    tempos = []
+    inicio = time.perf_counter()
+    for repeticao in range(repeticoes):
+        antes = time.perf_counter()
+        operacao(repeticao)
+        tempos.append(time.perf_counter() - antes)
+    return resumirTempos(tempos, time.perf_counter() - inicio)
+
+
+def consumir(pedacos) -> int:
+    return sum(len(pedaco) for pedaco in pedacos)
+
+
+def calcularHashSemCache(_):
+    exportacaoUtils.cacheDeHashes.clear()
+    return exportacaoUtils.calcularHashSHA256(persistUtils.caminhoCSVConsolidado())
+
+
+def compactarSemCache(_):
+    exportacaoUtils.cacheDeArtefatos.clear()
+    caminho = persistUtils.caminhoCSVConsolidado()
+    return consumir(
+        exportacaoUtils.gerarArquivoCompactado(
+            caminho, exportacaoUtils.FormatosDeCompactacao.ZIP, 6
+        )
+    )
+
+
+# Roda todas as operações sobre um elenco de `tamanho` personagens guardado no
+# formato e modo pedidos, num diretório temporário próprio.
+def executarCenario(
+    tamanho: int,
+    formato: FormatosDeArquivo,
+    modo: ModosDeArmazenamento,
+    repeticoes: int,
+    repeticoesPesadas: int,
+    semente: int,
+    particoes: int = 1,
+    durabilidade: ModosDeDurabilidade = ModosDeDurabilidade.ESTRITO,
+) -> Dict[str, Dict]:
+    configurarDurabilidade(durabilidade, 0.05)
+    diretorio = tempfile.mkdtemp(prefix="benchmark-personagens-")
+    caminho = os.path.join(diretorio, "personagens.csv")
+    aleatorio = random.Random(semente)
+    try:
+        gerarCSV(caminho, tamanho, semente)
+        repositorio = persistUtils.repositorio
+        antes = time.perf_counter()
+        repositorio.configurar(modo, 1000, formato, caminho, particoes)
+        repositorio.sincronizar()
+        resultados = {"carregar": resumirTempos([time.perf_counter() - antes], 0)}
+        persistUtils.iniciarAlocadorDeIds(tamanho + 1, 100)
+
+        idsParaRemover = aleatorio.sample(range(1, tamanho + 1), min(repeticoes, tamanho))
+
+        def idAleatorio(_=None) -> int:
+            return aleatorio.randint(1, tamanho)
+
+        resultados["criar"] = medir(
+            lambda _: persistUtils.inserirPersonagemNoCSV(
+                personagemAleatorio(aleatorio, persistUtils.alocarProximoId())
+            ),
+            repeticoes,
+        )
+        resultados["ler"] = medir(
+            lambda _: persistUtils.lerPersonagemCSV(idAleatorio()), repeticoes
+        )
+        resultados["atualizar"] = medir(
+            lambda _: persistUtils.atualizarPersonagemNoCSV(
+                idAleatorio(), personagemAleatorio(aleatorio)
+            ),
+            repeticoes,
+        )
+        resultados["contar"] = medir(
+            lambda _: persistUtils.contarPersonagensDoCSV(), repeticoes
+        )
+        resultados["listarComFiltros"] = medir(
+            lambda _: persistUtils.listarPersonagensDoCSVComFiltrosEOrdenacao(
+                {"classe": "Mago", "hp_lt": 100}, "hp", DirecoesDeOrdenacao.DESCENTENDE
+            ),
+            repeticoesPesadas,
+        )
+        resultados["listarPagina"] = medir(
+            lambda _: persistUtils.listarPaginaDePersonagens(
+                {"status": "Vivo"}, "nome", DirecoesDeOrdenacao.ASCENDENTE, 100
+            ),
+            repeticoesPesadas,
+        )
+        resultados["listarTodos"] = medir(
+            lambda _: persistUtils.listarPersonagensDoCSV(), repeticoesPesadas
+        )
+        resultados["hash"] = medir(calcularHashSemCache, repeticoesPesadas)
+        resultados["zip"] = medir(compactarSemCache, repeticoesPesadas)
+        resultados["remover"] = medir(
+            lambda repeticao: persistUtils.deletarPersonagemDoCSV(
+                idsParaRemover[repeticao]
+            ),
+            len(idsParaRemover),
+        )
+        # Espera uma eventual compactação do journal antes de apagar os arquivos.
+        repositorio.compactar()
+        return resultados
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+# Mede só a leitura do CSV base em tuplas, com 1 processo (a leitura
+# sequencial de FormatoCSV) ou com lerCSVEmParalelo chamado direto, sem o
+# limiar de tamanho nem o limite de núcleos, para que o custo do caminho
+# paralelo apareça também onde o servidor não o escolheria.
+def medirLeituraDoCSV(
+    tamanho: int, processos: int, repeticoes: int, semente: int
+) -> Dict[str, Dict]:
+    diretorio = tempfile.mkdtemp(prefix="benchmark-leitura-")
+    caminho = os.path.join(diretorio, "personagens.csv")
+    try:
+        gerarCSV(caminho, tamanho, semente)
+        if processos == 1:
+            formato = FormatoCSV(caminho, persistUtils.CAMPOS_PERSONAGEM)
+            configurarLeituraParalela(1)
+            try:
+                resultado = medir(
+                    lambda _: consumir(formato.carregarTuplas()), repeticoes
+                )
+            finally:
+                configurarLeituraParalela(0)
+        else:
+            resultado = medir(
+                lambda _: lerCSVEmParalelo(
+                    caminho, persistUtils.CAMPOS_PERSONAGEM, processos
+                ),
+                repeticoes,
+            )
+        resultado["bytes"] = os.path.getsize(caminho)
+        return {f"lerCSV{processos}Processos": resultado}
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+def commitAtual() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def chaveDoResultado(resultado: Dict) -> tuple:
+    return (
+        resultado["tamanho"],
+        resultado["formato"],
+        resultado["modo"],
+        resultado.get("particoes", 1),
+        resultado.get("durabilidade", ModosDeDurabilidade.ESTRITO.value),
+        resultado["operacao"],
+    )
+
+
+# Compara a latência mediana com a de um relatório anterior e lista o que
+# ficou mais lento do que o limiar (1.2 = 20% mais lento).
+def compararComAnterior(atual: Dict, anterior: Dict, limiar: float) -> List[Dict]:
+    anteriores = {chaveDoResultado(r): r for r in anterior["resultados"]}
+    regressoes = []
+    for resultado in atual["resultados"]:
+        base = anteriores.get(chaveDoResultado(resultado))
+        if base is None:
+            continue
+        razao = resultado["latenciaMs"]["p50"] / max(base["latenciaMs"]["p50"], 1e-9)
+        if razao > limiar:
+            regressoes.append(
+                {
+                    "tamanho": resultado["tamanho"],
+                    "formato": resultado["formato"],
+                    "modo": resultado["modo"],
+                    "particoes": resultado.get("particoes", 1),
+                    "durabilidade": resultado.get(
+                        "durabilidade", ModosDeDurabilidade.ESTRITO.value
+                    ),
+                    "operacao": resultado["operacao"],
+                    "p50Anterior": base["latenciaMs"]["p50"],
+                    "p50Atual": resultado["latenciaMs"]["p50"],
+                    "razao": razao,
+                }
+            )
+    return regressoes
+
+
+def listaDe(tipo):
+    return lambda valor: [tipo(item.strip()) for item in valor.split(",") if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark do armazenamento de personagens. Gera elencos sintéticos "
+        "e mede latência e vazão das operações de cada formato e modo, em JSON."
+    )
+    parser.add_argument("--tamanhos", type=listaDe(int), default=[1000, 10000, 100000])
+    parser.add_argument(
+        "--formatos", type=listaDe(FormatosDeArquivo), default=list(FormatosDeArquivo)
+    )
+    parser.add_argument(
+        "--modos", type=listaDe(ModosDeArmazenamento), default=list(ModosDeArmazenamento)
+    )
+    parser.add_argument("--particoes", type=listaDe(int), default=[1])
+    parser.add_argument(
+        "--durabilidades",
+        type=listaDe(ModosDeDurabilidade),
+        default=[ModosDeDurabilidade.ESTRITO],
+    )
+    parser.add_argument(
+        "--processosDeLeitura",
+        type=listaDe(int),
+        default=[],
+        help="mede só a leitura do CSV com cada quantidade de processos (1 = "
+        "sequencial) em vez das operações do armazenamento",
+    )
+    parser.add_argument("--repeticoes", type=int, default=100)
+    parser.add_argument("--repeticoesPesadas", type=int, default=5)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--saida", help="arquivo JSON de saída (padrão: stdout)")
+    parser.add_argument("--comparar", help="relatório JSON anterior para comparação")
+    parser.add_argument("--limiar", type=float, default=1.2)
+    argumentos = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    relatorio = {
+        "commit": commitAtual(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "nucleos": nucleosDisponiveis(),
+        "inicio": datetime.datetime.now().isoformat(timespec="seconds"),
+        "parametros": {
+            "repeticoes": argumentos.repeticoes,
+            "repeticoesPesadas": argumentos.repeticoesPesadas,
+            "semente": argumentos.semente,
+        },
+        "resultados": [],
+    }
+    for tamanho, processos in itertools.product(
+        argumentos.tamanhos, argumentos.processosDeLeitura
+    ):
+        print(
+            f"Medindo a leitura de {tamanho} personagens com {processos}"
+            " processo(s)",
+            file=sys.stderr,
+        )
+        resultados = medirLeituraDoCSV(
+            tamanho, processos, argumentos.repeticoesPesadas, argumentos.semente
+        )
+        for operacao, medidas in resultados.items():
+            relatorio["resultados"].append(
+                {
+                    "tamanho": tamanho,
+                    "formato": FormatosDeArquivo.CSV.value,
+                    "modo": ModosDeArmazenamento.DIRETO.value,
+                    "operacao": operacao,
+                    **medidas,
+                }
+            )
+    cenarios = itertools.product(
+        argumentos.tamanhos,
+        argumentos.formatos,
+        argumentos.modos,
+        argumentos.particoes,
+        argumentos.durabilidades,
+    )
+    if argumentos.processosDeLeitura:
+        cenarios = []
+    for tamanho, formato, modo, particoes, durabilidade in cenarios:
+        print(
+            f"Medindo {tamanho} personagens, formato {formato.value}, modo {modo.value},"
+            f" {particoes} partição(ões), durabilidade {durabilidade.value}",
+            file=sys.stderr,
+        )
+        resultados = executarCenario(
+            tamanho,
+            formato,
+            modo,
+            argumentos.repeticoes,
+            argumentos.repeticoesPesadas,
+            argumentos.semente,
+            particoes,
+            durabilidade,
+        )
+        for operacao, medidas in resultados.items():
+            relatorio["resultados"].append(
+                {
+                    "tamanho": tamanho,
+                    "formato": formato.value,
+                    "modo": modo.value,
+                    "particoes": particoes,
+                    "durabilidade": durabilidade.value,
+                    "operacao": operacao,
+                    **medidas,
+                }
+            )
+
+    if argumentos.comparar:
+        with open(argumentos.comparar, "r") as file:
+            anterior = json.load(file)
+        relatorio["comparacao"] = {
+            "commitAnterior": anterior.get("commit"),
+            "limiar": argumentos.limiar,
+            "regressoes": compararComAnterior(relatorio, anterior, argumentos.limiar),
+        }
+
+    saida = json.dumps(relatorio, indent=2, ensure_ascii=False)
+    if argumentos.saida:
+        with open(argumentos.saida, "w") as file:
+            file.write(saida + "\n")
+    else:
+        print(saida)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+import bisect
+import heapq
+import itertools
+import math
+import unicodedata
+from collections import Counter
+from enum import Enum
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+SIMILARIDADE_MINIMA = 0.4
+LIMITE_PADRAO_DA_BUSCA = 20
+LIMITE_MAXIMO_DA_BUSCA = 1000
+
+
+class ModosDeBusca(Enum):
+    PREFIXO = "prefixo"
+    SUBSTRING = "substring"
+    APROXIMADO = "aproximado"
+
+
+# Busca sem diferenciar maiúsculas, acentos ou espaços repetidos: "Éowyn  da
+# Silva" e "eowyn da silva" têm o mesmo texto normalizado.
+def normalizarTexto(texto: str) -> str:
+    decomposto = unicodedata.normalize("NFKD", texto)
+    semAcentos = "".join(
+        caractere for caractere in decomposto if not unicodedata.combining(caractere)
+    )
+    return " ".join(semAcentos.casefold().split())
+
+
+# Trigramas da palavra com dois espaços antes e um depois, como no pg_trgm: o
+# começo da palavra pesa mais na similaridade e mesmo palavras de uma letra
+# têm trigramas.
+def trigramasDaPalavra(palavra: str) -> Set[str]:
+    palavra = f"  {palavra} "
+    return {palavra[posicao : posicao + 3] for posicao in range(len(palavra) - 2)}
+
+
+def trigramasInternos(texto: str) -> Set[str]:
+    return {texto[posicao : posicao + 3] for posicao in range(len(texto) - 2)}
+
+
+# Índice de texto sobre um campo (o nome do personagem), mantido junto com os
+# demais índices a cada alteração. Nomes repetem muitas palavras, então o
+# índice trabalha sobre o vocabulário e não sobre os ids:
+#   - textos: texto normalizado de cada id, usado na confirmação e na ordem;
+#   - palavras: palavra -> ids dos nomes que a contêm;
+#   - vocabulario: palavras distintas em ordem, para prefixos com bisect;
+#   - trigramas: trigrama -> palavras que o contêm, para substrings e buscas
+#     aproximadas. São listas e não conjuntos porque ocupam bem menos memória
+#     e só mudam quando uma palavra entra ou sai do vocabulário.
+# O índice só é montado na primeira busca (e de novo depois de descartado),
+# então quem nunca busca por nome não paga a memória nem o tempo de carga.
+class IndiceDeTexto:
+    def __init__(self, campo: str):
+        self.campo = campo
+        self.descartar()
+
+    def descartar(self):
+        self.construido = False
+        self.textos: Dict[int, str] = {}
+        self.palavras: Dict[str, Set[int]] = {}
+        self.vocabulario: List[str] = []
+        self.trigramas: Dict[str, List[str]] = {}
+
+    def reconstruir(self, registros: Iterable):
+        self.construido = True
+        self.textos = {}
+        self.palavras = {}
+        for registro in registros:
+            texto = normalizarTexto(getattr(registro, self.campo))
+            self.textos[registro.id] = texto
+            for palavra in texto.split():
+                self.palavras.setdefault(palavra, set()).add(registro.id)
+        self.vocabulario = sorted(self.palavras)
+        self.trigramas = {}
+        for palavra in self.vocabulario:
+            for trigrama in trigramasDaPalavra(palavra):
+                self.trigramas.setdefault(trigrama, []).append(palavra)
+
+    def adicionar(self, registro):
+        if not self.construido:
+            return
+        texto = normalizarTexto(getattr(registro, self.campo))
+        self.textos[registro.id] = texto
+        for palavra in texto.split():
+            ids = self.palavras.get(palavra)
+            if ids is None:
+                ids = self.palavras[palavra] = set()
+                bisect.insort(self.vocabulario, palavra)
+                for trigrama in trigramasDaPalavra(palavra):
+                    self.trigramas.setdefault(trigrama, []).append(palavra)
+            ids.add(registro.id)
+
+    def remover(self, registro):
+        if not self.construido:
+            return
+        texto = self.textos.pop(registro.id, None)
+        if texto is None:
+            return
+        for palavra in set(texto.split()):
+            ids = self.palavras[palavra]
+            ids.discard(registro.id)
+            if ids:
+                continue
+            del self.palavras[palavra]
+            del self.vocabulario[bisect.bisect_left(self.vocabulario, palavra)]
+            for trigrama in trigramasDaPalavra(palavra):
+                palavrasDoTrigrama = self.trigramas[trigrama]
+                palavrasDoTrigrama.remove(palavra)
+                if not palavrasDoTrigrama:
+                    del self.trigramas[trigrama]
+
+    # Devolve os ids encontrados, do mais relevante para o menos, e quantos
+    # nomes foram considerados (verificados no texto ou, nas buscas por uma
+    # palavra, atendidos pelo vocabulário).
+    def buscar(
+        self, consulta: str, modo: ModosDeBusca, limite: int
+    ) -> Tuple[List[int], int]:
+        consulta = normalizarTexto(consulta)
+        if not consulta:
+            return [], 0
+        if modo == ModosDeBusca.PREFIXO:
+            return self.buscarPrefixo(consulta, limite)
+        if modo == ModosDeBusca.SUBSTRING:
+            return self.buscarSubstring(consulta, limite)
+        return self.buscarAproximado(consulta, limite)
+
+    def palavrasComPrefixo(self, prefixo: str) -> Iterator[str]:
+        vocabulario = self.vocabulario
+        posicao = bisect.bisect_left(vocabulario, prefixo)
+        while posicao < len(vocabulario) and vocabulario[posicao].startswith(prefixo):
+            yield vocabulario[posicao]
+            posicao += 1
+
+    def palavrasComTrecho(self, trecho: str) -> List[str]:
+        listas = sorted(
+            (
+                self.trigramas.get(trigrama, ())
+                for trigrama in trigramasInternos(trecho)
+            ),
+            key=len,
+        )
+        if not listas:
+            # Trechos com menos de três letras não têm trigrama próprio.
+            return [palavra for palavra in self.vocabulario if trecho in palavra]
+        candidatas = set(listas[0])
+        for palavras in listas[1:]:
+            if not candidatas:
+                break
+            candidatas.intersection_update(palavras)
+        return [palavra for palavra in candidatas if trecho in palavra]
+
+    def idsDasPalavras(self, palavras: Iterable[str]) -> Set[int]:
+        ids = set()
+        for palavra in palavras:
+            ids |= self.palavras[palavra]
+        return ids
+
+    # Ordena as confirmações pela posição do trecho no nome e pelo tamanho do
+    # nome, de forma que "Mar" venha antes de "Marcos" e de "Almar". Com
+    # `borda` o trecho precisa começar no início de uma palavra.
+    def confirmar(
+        self, candidatos: Iterable[int], trecho: str, limite: int, borda: bool = False
+    ) -> Tuple[List[int], int]:
+        if borda:
+            trecho = " " + trecho
+        verificados = 0
+        encontrados = []
+        for idRegistro in candidatos:
+            verificados += 1
+            texto = self.textos[idRegistro]
+            posicao = (" " + texto).find(trecho) if borda else texto.find(trecho)
+            if posicao != -1:
+                encontrados.append((posicao, len(texto), idRegistro))
+        return (
+            [entrada[2] for entrada in heapq.nsmallest(limite, encontrados)],
+            verificados,
+        )
+
+    # Junta os ids das palavras já ordenadas por relevância, cada palavra com
+    # os seus em ordem de id, até o limite. Devolve também quantos nomes
+    # atendem a consulta, não só os que couberam no limite.
+    def idsDasPalavrasEmOrdem(
+        self, palavras: List[str], limite: int
+    ) -> Tuple[List[int], int]:
+        encontrados: Dict[int, None] = {}
+        for palavra in palavras:
+            if len(encontrados) == limite:
+                break
+            for idRegistro in sorted(self.palavras[palavra]):
+                encontrados[idRegistro] = None
+                if len(encontrados) == limite:
+                    break
+        return list(encontrados), len(self.idsDasPalavras(palavras))
+
+    # Uma palavra: as palavras do vocabulário com o prefixo são ordenadas como
+    # em buscarSubstring, a igual à consulta primeiro e depois as mais curtas,
+    # e os ids saem delas até o limite. Várias palavras: as anteriores à
+    # última precisam aparecer inteiras e a última como prefixo, então os
+    # candidatos saem da mais rara delas e a sequência é confirmada no texto.
+    def buscarPrefixo(self, consulta: str, limite: int) -> Tuple[List[int], int]:
+        palavrasDaConsulta = consulta.split()
+        if len(palavrasDaConsulta) == 1:
+            palavras = sorted(
+                self.palavrasComPrefixo(consulta),
+                key=lambda palavra: (len(palavra), palavra),
+            )
+            return self.idsDasPalavrasEmOrdem(palavras, limite)
+        candidatos = min(
+            (self.palavras.get(palavra, set()) for palavra in palavrasDaConsulta[:-1]),
+            key=len,
+        )
+        # A união dos ids do prefixo só é usada se ficar menor que a palavra
+        # inteira mais rara.
+        idsDoPrefixo: Set[int] = set()
+        for palavra in self.palavrasComPrefixo(palavrasDaConsulta[-1]):
+            idsDoPrefixo |= self.palavras[palavra]
+            if len(idsDoPrefixo) >= len(candidatos):
+                break
+        else:
+            candidatos = idsDoPrefixo
+        return self.confirmar(candidatos, consulta, limite, borda=True)
+
+    # Uma palavra: toda palavra do vocabulário que contém o trecho serve, então
+    # elas são ordenadas pela posição do trecho e pelo tamanho e os ids saem
+    # delas até o limite, sem olhar os nomes. Várias palavras: os candidatos
+    # vêm das palavras que contêm a mais longa da consulta e o trecho inteiro,
+    # que pode atravessar palavras, é confirmado no texto de cada um.
+    def buscarSubstring(self, consulta: str, limite: int) -> Tuple[List[int], int]:
+        palavrasDaConsulta = consulta.split()
+        if len(palavrasDaConsulta) > 1:
+            candidatos = self.idsDasPalavras(
+                self.palavrasComTrecho(max(palavrasDaConsulta, key=len))
+            )
+            return self.confirmar(candidatos, consulta, limite)
+        palavras = sorted(
+            self.palavrasComTrecho(consulta),
+            key=lambda palavra: (palavra.find(consulta), len(palavra), palavra),
+        )
+        return self.idsDasPalavrasEmOrdem(palavras, limite)
+
+    # Similaridade de trigramas (comuns / união) entre uma palavra da consulta
+    # e as do vocabulário. Uma palavra com similaridade de pelo menos
+    # SIMILARIDADE_MINIMA precisa ter no mínimo esse tanto dos trigramas da
+    # consulta, o que descarta a maior parte da contagem antes do cálculo.
+    def palavrasParecidas(self, palavra: str) -> Dict[str, float]:
+        trigramas = trigramasDaPalavra(palavra)
+        necessarios = math.ceil(SIMILARIDADE_MINIMA * len(trigramas))
+        contagem = Counter(
+            itertools.chain.from_iterable(
+                self.trigramas.get(trigrama, ()) for trigrama in trigramas
+            )
+        )
+        parecidas = {}
+        for candidata, comuns in contagem.items():
+            if comuns < necessarios:
+                continue
+            uniao = len(trigramas) + len(trigramasDaPalavra(candidata)) - comuns
+            nota = comuns / uniao
+            if nota >= SIMILARIDADE_MINIMA:
+                parecidas[candidata] = nota
+        return parecidas
+
+    # Cada palavra da consulta precisa de uma palavra parecida no nome; a nota
+    # do nome é a média das melhores similaridades. Os candidatos saem da
+    # palavra da consulta com menos ids e as demais são conferidas nas
+    # palavras de cada candidato.
+    def buscarAproximado(self, consulta: str, limite: int) -> Tuple[List[int], int]:
+        parecidasPorPalavra = sorted(
+            (self.palavrasParecidas(palavra) for palavra in consulta.split()),
+            key=lambda parecidas: sum(
+                len(self.palavras[palavra]) for palavra in parecidas
+            ),
+        )
+        notas: Dict[int, float] = {}
+        for palavra, nota in parecidasPorPalavra[0].items():
+            for idRegistro in self.palavras[palavra]:
+                if nota > notas.get(idRegistro, 0.0):
+                    notas[idRegistro] = nota
+        verificados = len(notas)
+        encontrados = []
+        for idRegistro, nota in notas.items():
+            texto = self.textos[idRegistro]
+            total = nota
+            for parecidas in parecidasPorPalavra[1:]:
+                melhor = max(
+                    (parecidas.get(palavra, 0.0) for palavra in texto.split()),
+                    default=0.0,
+                )
+                if not melhor:
+                    break
+                total += melhor
+            else:
+                media = total / len(parecidasPorPalavra)
+                encontrados.append((-media, len(texto), idRegistro))
+        return (
+            [entrada[2] for entrada in heapq.nsmallest(limite, encontrados)],
+            verificados,
+        )
@@ -0,0 +1,111 @@
+import logging
+import threading
+from typing import Callable, List, Optional
+
+import yaml
+from pydantic import BaseModel, Field, ValidationError
+
+from armazenamentoUtils import FormatosDeArquivo, ModosDeArmazenamento, assinaturaDoArquivo
+from durabilidadeUtils import ModosDeDurabilidade
+
+INTERVALO_DE_VERIFICACAO = 2.0
+
+
+class ConfiguracaoDeDados(BaseModel):
+    file: str = "personagens.csv"
+    format: FormatosDeArquivo = FormatosDeArquivo.CSV
+    modo: ModosDeArmazenamento = ModosDeArmazenamento.DIRETO
+    limiteCompactacao: int = Field(default=1000, gt=0)
+    proximoId: int = Field(default=1, gt=0)
+    blocoDeIds: int = Field(default=100, gt=0)
+    threadsDeIO: int = Field(default=64, gt=0)
+    # Com mais de uma partição os personagens são divididos pelo id entre
+    # vários arquivos do formato escolhido.
+    particoes: int = Field(default=1, gt=0)
+    # Processos que leem um CSV grande em paralelo na carga (0 = um por núcleo,
+    # 1 = leitura sequencial), nunca mais que os núcleos disponíveis: com um
+    # núcleo só a leitura é sempre sequencial.
+    processosDeLeitura: int = Field(default=0, ge=0)
+    # estrito: cada gravação só é confirmada depois do fsync do arquivo e do
+    # diretório; agrupado: os fsyncs são feitos juntos a cada
+    # intervaloDeSincronizacaoMs, e uma queda do sistema pode perder as
+    # alterações desse intervalo.
+    durabilidade: ModosDeDurabilidade = ModosDeDurabilidade.ESTRITO
+    intervaloDeSincronizacaoMs: int = Field(default=50, gt=0)
+
+
+class ConfiguracaoDeLog(BaseModel):
+    file: str = "app.log"
+    format: str = "%(asctime)s - %(levelname)s - %(message)s"
+    level: str = "INFO"
+
+
+class Configuracao(BaseModel):
+    data: ConfiguracaoDeDados = ConfiguracaoDeDados()
+    logging: ConfiguracaoDeLog = ConfiguracaoDeLog()
+
+
+def carregarYaml(nomeDoArquivo: str):
+    print("Carregando dados de configuração")
+    with open(nomeDoArquivo, "r") as file:
+        dadosCarregados = yaml.safe_load(file)
+        print("Dados de configuração carregados")
+        return dadosCarregados
+
+
+# Lê o config.yaml uma única vez e guarda a configuração validada em `atual`.
+# Uma thread confere a assinatura do arquivo a cada INTERVALO_DE_VERIFICACAO
+# segundos e, quando ele muda, valida a versão nova e avisa os ouvintes com a
+# configuração anterior e a nova. Um arquivo inválido é ignorado (com um
+# aviso no log) e a configuração anterior continua valendo.
+class ObservadorDeConfiguracao:
+    def __init__(self, caminho: str, intervalo: float = INTERVALO_DE_VERIFICACAO):
+        self.caminho = caminho
+        self.intervalo = intervalo
+        self.atual: Optional[Configuracao] = None
+        self.assinatura = None
+        self.ouvintes: List[Callable[[Configuracao, Configuracao], None]] = []
+        self.parar = threading.Event()
+        self.thread = None
+
+    def carregar(self) -> Configuracao:
+        assinatura = assinaturaDoArquivo(self.caminho)
+        self.atual = Configuracao.model_validate(carregarYaml(self.caminho) or {})
+        self.assinatura = assinatura
+        return self.atual
+
+    def aoAlterar(self, ouvinte: Callable[[Configuracao, Configuracao], None]):
+        self.ouvintes.append(ouvinte)
+
+    def iniciar(self):
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(
+            target=self.executar, name="observador-configuracao", daemon=True
+        )
+        self.thread.start()
+
+    def executar(self):
+        while not self.parar.wait(self.intervalo):
+            self.verificar()
+
+    def verificar(self) -> bool:
+        assinatura = assinaturaDoArquivo(self.caminho)
+        if assinatura is None or assinatura == self.assinatura:
+            return False
+        anterior = self.atual
+        try:
+            nova = self.carregar()
+        except (OSError, yaml.YAMLError, ValidationError) as e:
+            self.assinatura = assinatura
+            logging.warning(f"Configuração inválida em {self.caminho} ignorada: {e}")
+            return False
+        if nova == anterior:
+            return False
+        logging.info(f"Configuração recarregada de {self.caminho}")
+        for ouvinte in self.ouvintes:
+            try:
+                ouvinte(anterior, nova)
+            except Exception as e:
+                logging.error(f"Erro ao aplicar a configuração nova: {e}")
+        return True
@@ -0,0 +1,623 @@
+import atexit
+import logging
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from enum import Enum
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+TAMANHO_DO_BLOCO = 64 * 1024
+INTERVALO_PADRAO_DE_SINCRONIZACAO = 0.05
+
+
+class ModosDeDurabilidade(Enum):
+    ESTRITO = "estrito"
+    AGRUPADO = "agrupado"
+
+
+# No Windows os descritores abrem em modo texto sem O_BINARY e o fsync (que lá
+# é o _commit) exige o arquivo aberto para escrita.
+O_BINARIO = getattr(os, "O_BINARY", 0)
+MODO_DE_SINCRONIZACAO = os.O_RDWR | O_BINARIO if os.name == "nt" else os.O_RDONLY
+
+
+def sincronizarCaminho(caminho: str):
+    try:
+        descritor = os.open(caminho, MODO_DE_SINCRONIZACAO)
+    except FileNotFoundError:
+        return
+    try:
+        os.fsync(descritor)
+    finally:
+        os.close(descritor)
+
+
+# Grava `dados` a partir de `deslocamento` sem depender da posição do
+# descritor. Onde não há os.pwrite (Windows) a posição é ajustada antes do
+# write, o que basta porque cada descritor é usado por uma única thread.
+def escreverEm(descritor: int, dados: bytes, deslocamento: int) -> int:
+    restante = memoryview(dados)
+    while restante:
+        if hasattr(os, "pwrite"):
+            escritos = os.pwrite(descritor, restante, deslocamento)
+        else:
+            os.lseek(descritor, deslocamento, os.SEEK_SET)
+            escritos = os.write(descritor, restante)
+        restante = restante[escritos:]
+        deslocamento += escritos
+    return len(dados)
+
+
+# Decide quando os dados gravados vão de fato para o disco. No modo estrito
+# cada gravação só termina depois do fsync do arquivo e, quando um arquivo é
+# criado, trocado ou removido, do diretório dele: uma alteração confirmada
+# sobrevive a uma queda de energia. No modo agrupado (group commit) esses
+# fsyncs são anotados e feitos juntos por uma thread a cada `intervalo`
+# segundos; uma queda do sistema pode perder as alterações desse intervalo,
+# mas a queda só do processo não perde nada, porque os dados já estão com o
+# sistema operacional. Temporários que vão substituir um arquivo e o
+# .remendos de aplicarRemendos não passam por aqui: são sincronizados na hora
+# nos dois modos, porque sem eles uma queda deixaria um arquivo pela metade em
+# vez de só perder as últimas alterações.
+class Sincronizador:
+    def __init__(self):
+        self.modo = ModosDeDurabilidade.ESTRITO
+        self.intervalo = INTERVALO_PADRAO_DE_SINCRONIZACAO
+        self.pendentes: Set[str] = set()
+        self.acoes: List[Callable[[], None]] = []
+        self.trava = threading.Lock()
+        self.thread = None
+
+    def configurar(self, modo: ModosDeDurabilidade, intervalo: float):
+        if intervalo <= 0:
+            raise ValueError(f"Intervalo de sincronização inválido: {intervalo}")
+        self.intervalo = intervalo
+        self.modo = modo
+        if modo == ModosDeDurabilidade.ESTRITO:
+            self.sincronizarPendentes()
+        elif self.thread is None:
+            self.thread = threading.Thread(
+                target=self.executar, name="sincronizador-disco", daemon=True
+            )
+            self.thread.start()
+
+    # `caminho` é o nome final do arquivo, quando ele ainda vai ser renomeado.
+    def arquivo(self, file, caminho: Optional[str] = None):
+        file.flush()
+        self.descritor(file.fileno(), caminho or file.name)
+
+    def descritor(self, descritor: int, caminho: str):
+        if self.modo == ModosDeDurabilidade.AGRUPADO:
+            with self.trava:
+                self.pendentes.add(caminho)
+        else:
+            os.fsync(descritor)
+
+    def diretorio(self, caminho: str):
+        # No Windows um diretório não pode ser aberto para o fsync.
+        if os.name == "nt":
+            return
+        diretorio = os.path.dirname(os.path.abspath(caminho))
+        if self.modo == ModosDeDurabilidade.AGRUPADO:
+            with self.trava:
+                self.pendentes.add(diretorio)
+        else:
+            sincronizarCaminho(diretorio)
+
+    # Executa `acao` só depois que tudo o que já foi anotado estiver no disco:
+    # na hora no modo estrito, ao fim da próxima sincronização no agrupado.
+    def depoisDeSincronizar(self, acao: Callable[[], None]):
+        if self.modo == ModosDeDurabilidade.AGRUPADO:
+            with self.trava:
+                self.acoes.append(acao)
+        else:
+            acao()
+
+    def sincronizarPendentes(self):
+        with self.trava:
+            pendentes, self.pendentes = self.pendentes, set()
+            acoes, self.acoes = self.acoes, []
+        falhou = False
+        # Os arquivos antes dos diretórios que os contêm.
+        for caminho in sorted(pendentes, key=len, reverse=True):
+            try:
+                sincronizarCaminho(caminho)
+            except OSError as e:
+                falhou = True
+                logging.error(f"Erro ao sincronizar {caminho} com o disco: {e}")
+        if falhou:
+            # As ações esperam uma sincronização que dê certo.
+            with self.trava:
+                self.pendentes |= pendentes
+                self.acoes[:0] = acoes
+            return
+        for acao in acoes:
+            try:
+                acao()
+            except OSError as e:
+                logging.error(f"Erro depois de sincronizar com o disco: {e}")
+
+    def executar(self):
+        while True:
+            time.sleep(self.intervalo)
+            self.sincronizarPendentes()
+
+
+sincronizador = Sincronizador()
+atexit.register(sincronizador.sincronizarPendentes)
+
+
+def configurarDurabilidade(modo: ModosDeDurabilidade, intervalo: float):
+    sincronizador.configurar(modo, intervalo)
+    logging.info(f"Durabilidade configurada: modo {modo.value}")
+
+
+# CRC32 de um registro de texto, para reconhecer uma linha gravada pela metade.
+def somaDoRegistro(campos: Iterable[str]) -> str:
+    return format(zlib.crc32("\x1f".join(campos).encode("utf-8")), "08x")
+
+
+def crcsDosBlocos(file, inicio: int, fim: Optional[int] = None) -> Tuple[array, int]:
+    blocos = array("I")
+    file.seek(inicio)
+    posicao = inicio
+    while fim is None or posicao < fim:
+        quantidade = TAMANHO_DO_BLOCO
+        if fim is not None:
+            quantidade = min(quantidade, fim - posicao)
+        dados = file.read(quantidade)
+        if not dados:
+            break
+        blocos.append(zlib.crc32(dados))
+        posicao += len(dados)
+    return blocos, posicao
+
+
+# Soma de verificação de um arquivo: o tamanho dele e o CRC32 de cada bloco de
+# TAMANHO_DO_BLOCO bytes, guardada em "<arquivo>.soma" (little-endian):
+#   "PERSSOMA", tamanho do bloco (uint32), tamanho do arquivo (uint64), o CRC
+#   de cada bloco (uint32) e, por fim, o CRC32 de tudo o que vem antes.
+# Por blocos para que um anexo ou uma escrita no lugar recalculem só os blocos
+# que tocaram.
+class SomaDoArquivo:
+    ASSINATURA = b"PERSSOMA"
+    CABECALHO = struct.Struct("<8sIQ")
+
+    def __init__(self, tamanho: int, blocos: array):
+        self.tamanho = tamanho
+        self.blocos = blocos
+
+    def __eq__(self, outra) -> bool:
+        return (
+            isinstance(outra, SomaDoArquivo)
+            and self.tamanho == outra.tamanho
+            and self.blocos == outra.blocos
+        )
+
+    # Soma dos primeiros `limite` bytes do arquivo (de todos, sem limite).
+    @classmethod
+    def calcular(cls, caminho: str, limite: Optional[int] = None) -> "SomaDoArquivo":
+        with open(caminho, mode="rb") as file:
+            blocos, tamanho = crcsDosBlocos(file, 0, limite)
+        return cls(tamanho, blocos)
+
+    # A soma que o arquivo terá depois de receber os remendos (deslocamento,
+    # bytes), sem escrevê-los: só os blocos tocados são lidos e remendados em
+    # memória.
+    def comRemendos(
+        self, caminho: str, remendos: List[Tuple[int, bytes]]
+    ) -> "SomaDoArquivo":
+        tamanho = max(
+            [self.tamanho]
+            + [deslocamento + len(dados) for deslocamento, dados in remendos]
+        )
+        quantidade = -(-tamanho // TAMANHO_DO_BLOCO)
+        porBloco: Dict[int, List[Tuple[int, bytes]]] = {
+            # Se o arquivo cresceu, o antigo último bloco também muda.
+            indice: []
+            for indice in range(self.tamanho // TAMANHO_DO_BLOCO, quantidade)
+        }
+        for deslocamento, dados in remendos:
+            ultimo = (deslocamento + len(dados) - 1) // TAMANHO_DO_BLOCO
+            for indice in range(deslocamento // TAMANHO_DO_BLOCO, ultimo + 1):
+                porBloco.setdefault(indice, []).append((deslocamento, dados))
+        blocos = array("I", self.blocos)
+        blocos.extend([0] * (quantidade - len(blocos)))
+        with open(caminho, mode="rb") as file:
+            for indice, doBloco in porBloco.items():
+                inicio = indice * TAMANHO_DO_BLOCO
+                fim = min(inicio + TAMANHO_DO_BLOCO, tamanho)
+                file.seek(inicio)
+                bloco = bytearray(file.read(fim - inicio))
+                bloco.extend(bytes(fim - inicio - len(bloco)))
+                for deslocamento, dados in doBloco:
+                    de = max(deslocamento, inicio)
+                    ate = min(deslocamento + len(dados), fim)
+                    bloco[de - inicio : ate - inicio] = dados[
+                        de - deslocamento : ate - deslocamento
+                    ]
+                blocos[indice] = zlib.crc32(bloco)
+        return SomaDoArquivo(tamanho, blocos)
+
+    # Primeiro byte a partir do qual o arquivo descrito por `outra` diverge.
+    def divergencia(self, outra: "SomaDoArquivo") -> int:
+        for indice, (crc, outro) in enumerate(zip(self.blocos, outra.blocos)):
+            if crc != outro:
+                return indice * TAMANHO_DO_BLOCO
+        return min(self.tamanho, outra.tamanho)
+
+    def serializar(self) -> bytes:
+        blocos = self.blocos
+        if sys.byteorder == "big":
+            blocos = array("I", blocos)
+            blocos.byteswap()
+        corpo = (
+            self.CABECALHO.pack(self.ASSINATURA, TAMANHO_DO_BLOCO, self.tamanho)
+            + blocos.tobytes()
+        )
+        return corpo + struct.pack("<I", zlib.crc32(corpo))
+
+    # None se os bytes não forem uma soma completa e íntegra.
+    @classmethod
+    def desserializar(cls, dados: bytes) -> Optional["SomaDoArquivo"]:
+        if len(dados) < cls.CABECALHO.size + 4:
+            return None
+        corpo = dados[:-4]
+        if struct.unpack("<I", dados[-4:])[0] != zlib.crc32(corpo):
+            return None
+        assinatura, tamanhoDoBloco, tamanho = cls.CABECALHO.unpack_from(corpo)
+        if assinatura != cls.ASSINATURA or tamanhoDoBloco != TAMANHO_DO_BLOCO:
+            return None
+        blocos = array("I")
+        blocos.frombytes(corpo[cls.CABECALHO.size :])
+        if sys.byteorder == "big":
+            blocos.byteswap()
+        if len(blocos) != -(-tamanho // TAMANHO_DO_BLOCO):
+            return None
+        return cls(tamanho, blocos)
+
+    @classmethod
+    def ler(cls, caminho: str) -> Optional["SomaDoArquivo"]:
+        try:
+            with open(caminho, mode="rb") as file:
+                return cls.desserializar(file.read())
+        except FileNotFoundError:
+            return None
+
+
+def caminhoDaSoma(caminho: str) -> str:
+    return caminho + ".soma"
+
+
+def caminhoDosRemendos(caminho: str) -> str:
+    return caminho + ".remendos"
+
+
+# Somas dos arquivos já conferidos ou gravados por este processo.
+somasConhecidas: Dict[str, SomaDoArquivo] = {}
+
+
+def escreverSoma(caminho: str, soma: SomaDoArquivo, destino: str):
+    with open(caminho, mode="wb") as file:
+        file.write(soma.serializar())
+        sincronizador.arquivo(file, destino)
+
+
+def gravarSoma(caminho: str, soma: SomaDoArquivo):
+    destino = caminhoDaSoma(caminho)
+    escreverSoma(destino + ".tmp", soma, destino)
+    os.replace(destino + ".tmp", destino)
+    sincronizador.diretorio(destino)
+    somasConhecidas[caminho] = soma
+
+
+# A soma do arquivo como ele está. Se o tamanho não bate com a soma guardada,
+# o arquivo mudou fora do servidor depois da última conferência e a soma é
+# refeita.
+def somaDe(caminho: str) -> SomaDoArquivo:
+    soma = somasConhecidas.get(caminho)
+    if soma is None:
+        soma = SomaDoArquivo.ler(caminhoDaSoma(caminho))
+    if soma is None or soma.tamanho != os.path.getsize(caminho):
+        soma = SomaDoArquivo.calcular(caminho)
+        gravarSoma(caminho, soma)
+    somasConhecidas[caminho] = soma
+    return soma
+
+
+# Troca `caminho` pelo temporário, já gravado e sincronizado. A soma nova vai
+# para "<arquivo>.soma.tmp" antes da troca, então uma queda entre a troca do
+# arquivo e a da soma ainda deixa uma soma que confere com ele.
+def substituirArquivo(temporario: str, caminho: str):
+    soma = SomaDoArquivo.calcular(temporario)
+    somaTemporaria = caminhoDaSoma(caminho) + ".tmp"
+    escreverSoma(somaTemporaria, soma, caminhoDaSoma(caminho))
+    os.replace(temporario, caminho)
+    os.replace(somaTemporaria, caminhoDaSoma(caminho))
+    sincronizador.diretorio(caminho)
+    somasConhecidas[caminho] = soma
+
+
+# "<arquivo>.remendos" (little-endian) guarda uma ou mais entradas, uma por
+# lote ainda não sincronizado, cada uma com "PERSREM2", a soma do arquivo
+# antes dos remendos e a esperada depois deles (cada uma como tamanho
+# (uint32) e soma), quantidade de remendos (uint32), cada remendo como
+# deslocamento (uint64), tamanho (uint32) e bytes, e o CRC32 de tudo o que
+# vem antes na entrada.
+ASSINATURA_DOS_REMENDOS = b"PERSREM2"
+
+Remendos = List[Tuple[int, bytes]]
+
+
+def serializarRemendos(
+    anterior: SomaDoArquivo,
+    esperada: SomaDoArquivo,
+    remendos: Remendos,
+) -> bytes:
+    partes = [ASSINATURA_DOS_REMENDOS]
+    for soma in (anterior, esperada):
+        somaSerializada = soma.serializar()
+        partes += [struct.pack("<I", len(somaSerializada)), somaSerializada]
+    partes.append(struct.pack("<I", len(remendos)))
+    for deslocamento, dados in remendos:
+        partes += [struct.pack("<QI", deslocamento, len(dados)), dados]
+    corpo = b"".join(partes)
+    return corpo + struct.pack("<I", zlib.crc32(corpo))
+
+
+# As entradas inteiras do .remendos, na ordem em que foram escritas. A leitura
+# para na primeira entrada cortada ou que não confere: ela é de um lote que a
+# queda interrompeu antes de os bytes dele irem para o arquivo.
+def lerRemendos(
+    caminho: str,
+) -> List[Tuple[SomaDoArquivo, SomaDoArquivo, Remendos]]:
+    try:
+        with open(caminho, mode="rb") as file:
+            dados = file.read()
+    except FileNotFoundError:
+        return []
+    entradas = []
+    inicio = 0
+    while True:
+        lido = lerEntradaDeRemendos(dados, inicio)
+        if lido is None:
+            return entradas
+        entrada, inicio = lido
+        entradas.append(entrada)
+
+
+def lerEntradaDeRemendos(
+    dados: bytes, inicio: int
+) -> Optional[Tuple[Tuple[SomaDoArquivo, SomaDoArquivo, Remendos], int]]:
+    if dados[inicio : inicio + 8] != ASSINATURA_DOS_REMENDOS:
+        return None
+    posicao = inicio + 8
+    try:
+        somas = []
+        for _ in range(2):
+            (tamanhoDaSoma,) = struct.unpack_from("<I", dados, posicao)
+            posicao += 4
+            soma = SomaDoArquivo.desserializar(
+                dados[posicao : posicao + tamanhoDaSoma]
+            )
+            if soma is None:
+                return None
+            somas.append(soma)
+            posicao += tamanhoDaSoma
+        (quantidade,) = struct.unpack_from("<I", dados, posicao)
+        posicao += 4
+        remendos = []
+        for _ in range(quantidade):
+            deslocamento, tamanho = struct.unpack_from("<QI", dados, posicao)
+            posicao += 12
+            remendos.append((deslocamento, dados[posicao : posicao + tamanho]))
+            posicao += tamanho
+        (crc,) = struct.unpack_from("<I", dados, posicao)
+    except struct.error:
+        return None
+    if crc != zlib.crc32(dados[inicio:posicao]):
+        return None
+    return (somas[0], somas[1], remendos), posicao + 4
+
+
+# Esvazia o .remendos de uma escrita que terminou ou que a recuperação já
+# tratou. Esvaziar em vez de remover poupa o fsync do diretório a cada lote.
+def descartarRemendos(caminho: str):
+    try:
+        os.truncate(caminhoDosRemendos(caminho), 0)
+    except FileNotFoundError:
+        pass
+
+
+# Cada entrada escrita no .remendos ganha uma geração nova, para que um
+# descarte adiado não apague as entradas de um lote seguinte. Enquanto o
+# .remendos não é descartado, `finaisDosRemendos` guarda a soma esperada da
+# última entrada dele: um lote que parte dela entra no fim do mesmo .remendos.
+geracoesDosRemendos: Dict[str, int] = {}
+finaisDosRemendos: Dict[str, SomaDoArquivo] = {}
+travaDosRemendos = threading.Lock()
+
+
+# Abre a geração de um lote que vai de `anterior` a `esperada` e devolve se a
+# entrada dele deve ir para o fim do .remendos em vez de substituí-lo.
+def novaGeracaoDeRemendos(
+    caminho: str, anterior: SomaDoArquivo, esperada: SomaDoArquivo
+) -> bool:
+    with travaDosRemendos:
+        geracoesDosRemendos[caminho] = geracoesDosRemendos.get(caminho, 0) + 1
+        anexar = finaisDosRemendos.get(caminho) == anterior
+        finaisDosRemendos[caminho] = esperada
+    return anexar
+
+
+# Um .remendos aceito na recuperação vale até a soma dele ir para o disco, e
+# o próximo lote parte da soma esperada por ele.
+def continuarRemendos(caminho: str, esperada: SomaDoArquivo):
+    with travaDosRemendos:
+        finaisDosRemendos[caminho] = esperada
+
+
+# O .remendos só pode sumir depois que o arquivo e a .soma que ele protege
+# estiverem no disco. No modo agrupado o fsync deles fica para a sincronização
+# em grupo, e uma queda antes dela deixaria dados antigos, a .soma nova e
+# nenhum .remendos para refazer a escrita, então o descarte espera por ela.
+def descartarRemendosDepoisDeSincronizar(caminho: str):
+    with travaDosRemendos:
+        geracao = geracoesDosRemendos.get(caminho, 0)
+
+    def descartar():
+        with travaDosRemendos:
+            if geracoesDosRemendos.get(caminho, 0) == geracao:
+                descartarRemendos(caminho)
+                finaisDosRemendos.pop(caminho, None)
+
+    sincronizador.depoisDeSincronizar(descartar)
+
+
+# Escrita à prova de queda, no lugar ou no fim do arquivo: os remendos
+# (deslocamento, bytes), a soma do arquivo antes deles e a que ele terá depois
+# vão antes para "<arquivo>.remendos", sincronizado nos dois modos, e só então
+# os bytes são escritos no arquivo. Uma escrita interrompida por uma queda é
+# refeita a partir dele na recuperação. Depois que a soma nova é gravada e
+# sincronizada o .remendos é esvaziado; até lá os lotes seguintes são
+# anexados a ele. Devolve os bytes escritos no arquivo.
+def aplicarRemendos(caminho: str, remendos: Remendos) -> int:
+    if not remendos:
+        return 0
+    anterior = somaDe(caminho)
+    nova = anterior.comRemendos(caminho, remendos)
+    caminhoDeRemendos = caminhoDosRemendos(caminho)
+    novoArquivo = not os.path.exists(caminhoDeRemendos)
+    anexar = novaGeracaoDeRemendos(caminho, anterior, nova)
+    with open(caminhoDeRemendos, mode="ab" if anexar else "wb") as file:
+        file.write(serializarRemendos(anterior, nova, remendos))
+        file.flush()
+        os.fsync(file.fileno())
+    if novoArquivo and os.name != "nt":
+        sincronizarCaminho(os.path.dirname(os.path.abspath(caminho)))
+    escritos = 0
+    descritor = os.open(caminho, os.O_RDWR | O_BINARIO)
+    try:
+        for deslocamento, dados in remendos:
+            escritos += escreverEm(descritor, dados, deslocamento)
+        sincronizador.descritor(descritor, caminho)
+    finally:
+        os.close(descritor)
+    gravarSoma(caminho, nova)
+    descartarRemendosDepoisDeSincronizar(caminho)
+    return escritos
+
+
+# Refaz escritas interrompidas, recebendo a soma `atual` do arquivo e
+# devolvendo se ele foi alterado e a soma dele depois disso. As entradas do
+# .remendos precisam formar uma sequência (cada uma parte da esperada pela
+# anterior) e a .soma precisa ser um dos estados dessa sequência: no modo
+# agrupado ela pode já ser a nova sem que os bytes tenham chegado ao arquivo.
+# Os remendos de todas as entradas são reaplicados em ordem, e só se levarem
+# o arquivo exatamente à soma esperada pela última. Um .remendos que não
+# combina com a .soma é de lotes já gravados e é ignorado, mesmo que o arquivo
+# tenha voltado ao conteúdo anterior por um git checkout ou uma edição à mão.
+# Se o arquivo já está como o .remendos descreve, as escritas terminaram e só
+# a soma é gravada.
+def refazerRemendos(
+    caminho: str, atual: SomaDoArquivo
+) -> Tuple[bool, SomaDoArquivo]:
+    entradas = lerRemendos(caminhoDosRemendos(caminho))
+    if not entradas:
+        return False, atual
+    for (_, esperadaAntes, _), (anterior, _, _) in zip(entradas, entradas[1:]):
+        if anterior != esperadaAntes:
+            return False, atual
+    esperada = entradas[-1][1]
+    estados = [entradas[0][0]] + [entrada[1] for entrada in entradas]
+    gravada = SomaDoArquivo.ler(caminhoDaSoma(caminho))
+    if gravada not in estados:
+        return False, atual
+    if atual == esperada:
+        # Os bytes chegaram ao arquivo, só a soma nova não foi gravada.
+        if gravada != esperada:
+            gravarSoma(caminho, esperada)
+        continuarRemendos(caminho, esperada)
+        return False, atual
+    remendos = [remendo for entrada in entradas for remendo in entrada[2]]
+    if atual.comRemendos(caminho, remendos) != esperada:
+        return False, atual
+    descritor = os.open(caminho, os.O_RDWR | O_BINARIO)
+    try:
+        for deslocamento, dados in remendos:
+            escreverEm(descritor, dados, deslocamento)
+        os.fsync(descritor)
+    finally:
+        os.close(descritor)
+    gravarSoma(caminho, esperada)
+    continuarRemendos(caminho, esperada)
+    logging.warning(
+        f"Escrita interrompida em {caminho} refeita a partir de"
+        f" {caminhoDosRemendos(caminho)}"
+    )
+    return True, esperada
+
+
+# Confere o arquivo com a soma gravada ao lado dele antes de ele ser lido.
+# Só uma gravação do próprio servidor interrompida no meio é desfeita, e só
+# quando há prova dela:
+#   - um .remendos que leva o arquivo exatamente à soma que ele guarda é uma
+#     escrita (anexo ou no lugar) interrompida, e é completada;
+#   - uma soma em .soma.tmp que confere é a de uma troca interrompida.
+# Com `aceitarAlteracoes` (arquivos de texto), qualquer outra divergência,
+# como um arquivo editado à mão, anexado por fora ou trocado por um git
+# checkout, é aceita como está e ganha uma soma nova, na partida ou numa
+# recarga. Sem ele (formatos binários) a divergência é corrupção: a soma
+# antiga fica como prova e ValueError recusa a carga. O resultado nunca volta
+# para um estado anterior à última gravação sincronizada. Um arquivo sem soma
+# (gravado por uma versão anterior) também é aceito. Devolve se o arquivo foi
+# alterado.
+def recuperarArquivo(caminho: str, aceitarAlteracoes: bool = True) -> bool:
+    somasConhecidas.pop(caminho, None)
+    with travaDosRemendos:
+        finaisDosRemendos.pop(caminho, None)
+    if not os.path.exists(caminho):
+        return False
+    alterado, atual = refazerRemendos(caminho, SomaDoArquivo.calcular(caminho))
+    # Aplicado ou não, o .remendos já foi tratado e não vale para a próxima
+    # carga, assim que a soma gravada aqui estiver no disco.
+    descartarRemendosDepoisDeSincronizar(caminho)
+    soma = SomaDoArquivo.ler(caminhoDaSoma(caminho))
+    if atual == soma:
+        somasConhecidas[caminho] = soma
+        return alterado
+    pendente = SomaDoArquivo.ler(caminhoDaSoma(caminho) + ".tmp")
+    if pendente is not None and atual == pendente:
+        os.replace(caminhoDaSoma(caminho) + ".tmp", caminhoDaSoma(caminho))
+        somasConhecidas[caminho] = pendente
+        return alterado
+    if soma is not None:
+        if not aceitarAlteracoes:
+            raise ValueError(
+                f"{caminho} não confere com {caminhoDaSoma(caminho)} a partir do"
+                f" byte {atual.divergencia(soma)}: o arquivo está corrompido e não"
+                " será carregado"
+            )
+        logging.warning(
+            f"{caminho} foi alterado fora do servidor a partir do byte"
+            f" {atual.divergencia(soma)}; aceito como está e com a soma refeita"
+        )
+    gravarSoma(caminho, atual)
+    return alterado
+
+
+# Remove o arquivo com a soma e os remendos dele.
+def removerArquivo(caminho: str):
+    for arquivo in (caminho, caminhoDaSoma(caminho), caminhoDosRemendos(caminho)):
+        try:
+            os.remove(arquivo)
+        except FileNotFoundError:
+            pass
+    somasConhecidas.pop(caminho, None)
+    with travaDosRemendos:
+        finaisDosRemendos.pop(caminho, None)
+    sincronizador.diretorio(caminho)
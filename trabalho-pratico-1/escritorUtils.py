@@ -0,0 +1,75 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Tuple
+
+
+# Fila de escrita com uma única thread consumidora. Quem altera os dados
+# enfileira uma lista de alterações (uma só, ou todas as de uma operação em
+# lote) e espera o Future; a thread junta tudo o que chegou enquanto a escrita
+# anterior acontecia e entrega o lote de uma vez para a função de
+# persistência, então rajadas de alterações viram uma só escrita.
+class EscritorSerializado:
+    def __init__(
+        self,
+        persistirLote: Callable[[List[Any]], None],
+        tamanhoMaximoLote: int = 1000,
+        janelaDeAgrupamento: float = 0.0,
+        nome: str = "escritor-csv",
+    ):
+        self.persistirLote = persistirLote
+        self.tamanhoMaximoLote = tamanhoMaximoLote
+        self.janelaDeAgrupamento = janelaDeAgrupamento
+        self.nome = nome
+        self.fila: "queue.Queue[Tuple[List[Any], Future]]" = queue.Queue()
+        self.thread = None
+        self.travaDeInicio = threading.Lock()
+
+    def enviar(self, alteracoes: List[Any]) -> Future:
+        if self.thread is None:
+            self.iniciar()
+        pendente = Future()
+        self.fila.put((alteracoes, pendente))
+        return pendente
+
+    def iniciar(self):
+        with self.travaDeInicio:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(
+                target=self.executar, name=self.nome, daemon=True
+            )
+            self.thread.start()
+
+    def proximoLote(self) -> List[Tuple[List[Any], Future]]:
+        lote = [self.fila.get()]
+        if self.janelaDeAgrupamento > 0:
+            time.sleep(self.janelaDeAgrupamento)
+        quantidade = len(lote[0][0])
+        while quantidade < self.tamanhoMaximoLote:
+            try:
+                lote.append(self.fila.get_nowait())
+            except queue.Empty:
+                break
+            quantidade += len(lote[-1][0])
+        return lote
+
+    def executar(self):
+        while True:
+            lote = self.proximoLote()
+            alteracoes = [
+                alteracao for enviadas, _ in lote for alteracao in enviadas
+            ]
+            try:
+                self.persistirLote(alteracoes)
+            except Exception as e:
+                logging.error(
+                    f"Erro ao persistir lote de {len(alteracoes)} alterações: {e}"
+                )
+                for _, pendente in lote:
+                    pendente.set_exception(e)
+            else:
+                for _, pendente in lote:
+                    pendente.set_result(None)
@@ -0,0 +1,84 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+CAMPOS_DE_AGRUPAMENTO = ["classe", "status"]
+CAMPOS_DE_ESTATISTICA = ["hp", "hpMax", "mp", "mpMax"]
+PERCENTIS_PADRAO = (50.0, 90.0, 99.0)
+
+
+def interpretarAgrupamento(agruparPor: Optional[str]) -> Tuple[str, ...]:
+    if not agruparPor:
+        return ()
+    campos = tuple(campo.strip() for campo in agruparPor.split(",") if campo.strip())
+    for campo in campos:
+        if campo not in CAMPOS_DE_AGRUPAMENTO:
+            raise ValueError(
+                f"Campo de agrupamento inválido: {campo}, use {CAMPOS_DE_AGRUPAMENTO}"
+            )
+    if len(set(campos)) != len(campos):
+        raise ValueError(f"Campo de agrupamento repetido: {agruparPor}")
+    return campos
+
+
+def interpretarPercentis(percentis: Optional[str]) -> Tuple[float, ...]:
+    if not percentis:
+        return PERCENTIS_PADRAO
+    try:
+        valores = tuple(float(valor) for valor in percentis.split(","))
+    except ValueError:
+        raise ValueError(f"Percentis inválidos: {percentis}, use números entre 0 e 100")
+    if any(not 0 <= valor <= 100 for valor in valores):
+        raise ValueError(f"Percentis inválidos: {percentis}, use números entre 0 e 100")
+    return valores
+
+
+# Percentil com interpolação linear entre as duas posições vizinhas, o mesmo
+# critério padrão do numpy.
+def percentil(valoresOrdenados: Sequence[int], p: float) -> float:
+    posicao = (len(valoresOrdenados) - 1) * p / 100
+    anterior = int(posicao)
+    proximo = min(anterior + 1, len(valoresOrdenados) - 1)
+    fracao = posicao - anterior
+    return (
+        valoresOrdenados[anterior]
+        + (valoresOrdenados[proximo] - valoresOrdenados[anterior]) * fracao
+    )
+
+
+def resumir(valores: List[int], percentis: Sequence[float]) -> Dict[str, Any]:
+    valores.sort()
+    resumo = {
+        "minimo": valores[0],
+        "maximo": valores[-1],
+        "media": sum(valores) / len(valores),
+    }
+    for p in percentis:
+        resumo[f"p{p:g}"] = percentil(valores, p)
+    return resumo
+
+
+# Uma única passada pelos registros separa os valores de cada campo por grupo;
+# os resumos (mínimo, máximo, média e percentis) saem depois, grupo a grupo,
+# da lista ordenada de cada campo.
+def calcularEstatisticas(
+    registros: Iterable,
+    agrupamento: Tuple[str, ...],
+    percentis: Sequence[float] = PERCENTIS_PADRAO,
+) -> Dict[str, Any]:
+    grupos: Dict[Tuple, Dict[str, List[int]]] = {}
+    for registro in registros:
+        chave = tuple(getattr(registro, campo) for campo in agrupamento)
+        valores = grupos.get(chave)
+        if valores is None:
+            valores = grupos[chave] = {campo: [] for campo in CAMPOS_DE_ESTATISTICA}
+        for campo in CAMPOS_DE_ESTATISTICA:
+            valores[campo].append(getattr(registro, campo))
+
+    resultado = []
+    for chave in sorted(grupos):
+        valores = grupos[chave]
+        grupo: Dict[str, Any] = dict(zip(agrupamento, chave))
+        grupo["quantidade"] = len(valores[CAMPOS_DE_ESTATISTICA[0]])
+        for campo in CAMPOS_DE_ESTATISTICA:
+            grupo[campo] = resumir(valores[campo], percentis)
+        resultado.append(grupo)
+    return {"agruparPor": list(agrupamento), "grupos": resultado}
@@ -0,0 +1,271 @@
+import hashlib
+import io
+import mmap
+import os
+import threading
+import time
+import zipfile
+import zlib
+from enum import Enum
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from metricasUtils import registrarLeitura
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+TAMANHO_DO_BUFFER = 1024 * 1024
+LIMITE_DO_CACHE = 16
+LIMITE_DO_CACHE_DE_ARTEFATOS = 64 * 1024 * 1024
+
+cacheDeHashes: Dict[Tuple, object] = {}
+cacheDeArtefatos: Dict[Tuple, bytes] = {}
+travaDoCache = threading.Lock()
+
+
+class FormatosDeCompactacao(Enum):
+    ZIP = "zip"
+    GZIP = "gzip"
+    ZSTD = "zstd"
+
+
+TIPOS_DE_CONTEUDO = {
+    FormatosDeCompactacao.ZIP: "application/zip",
+    FormatosDeCompactacao.GZIP: "application/gzip",
+    FormatosDeCompactacao.ZSTD: "application/zstd",
+}
+NIVEIS_DE_COMPACTACAO = {
+    FormatosDeCompactacao.ZIP: (0, 9, 6),
+    FormatosDeCompactacao.GZIP: (0, 9, 6),
+    FormatosDeCompactacao.ZSTD: (1, 22, 3),
+}
+
+
+# A chave do cache é (caminho, inode, tamanho, mtime) lida com fstat do próprio
+# descritor aberto, então o conteúdo calculado sempre corresponde à chave mesmo
+# que o arquivo seja substituído durante a leitura.
+def chaveDoArquivo(
+    caminho: str, file, estado: Optional[os.stat_result] = None
+) -> Tuple:
+    estado = estado or os.fstat(file.fileno())
+    return (caminho, estado.st_ino, estado.st_size, estado.st_mtime_ns)
+
+
+def consultarCache(chave: Tuple):
+    with travaDoCache:
+        return cacheDeHashes.get(chave)
+
+
+def guardarNoCache(chave: Tuple, valor):
+    with travaDoCache:
+        if len(cacheDeHashes) >= LIMITE_DO_CACHE:
+            cacheDeHashes.clear()
+        cacheDeHashes[chave] = valor
+    return valor
+
+
+# Mapeia os primeiros `tamanho` bytes (por padrão, o arquivo todo), para que
+# um anexo feito durante a leitura não entre no que foi calculado para a chave.
+def mapearArquivo(file, tamanho: Optional[int] = None):
+    if tamanho is None:
+        tamanho = os.fstat(file.fileno()).st_size
+    if tamanho == 0:
+        return b""
+    return mmap.mmap(file.fileno(), tamanho, access=mmap.ACCESS_READ)
+
+
+def calcularHashSHA256(caminho: str) -> str:
+    with open(caminho, "rb") as file:
+        estado = os.fstat(file.fileno())
+        chave = chaveDoArquivo(caminho, file, estado) + ("sha256",)
+        hashEmCache = consultarCache(chave)
+        if hashEmCache is not None:
+            return hashEmCache
+        conteudo = mapearArquivo(file, estado.st_size)
+        sha256_hash = hashlib.sha256()
+        visao = memoryview(conteudo)
+        for inicio in range(0, len(conteudo), TAMANHO_DO_BUFFER):
+            sha256_hash.update(visao[inicio : inicio + TAMANHO_DO_BUFFER])
+        visao.release()
+        registrarLeitura("hash", len(conteudo))
+        if isinstance(conteudo, mmap.mmap):
+            conteudo.close()
+        return guardarNoCache(chave, sha256_hash.hexdigest())
+
+
+# Hash em dois níveis ao estilo Merkle: o arquivo é dividido em blocos de
+# linhasPorBloco linhas (o cabeçalho conta como a linha 0), cada bloco tem seu
+# SHA-256 e a raiz é o SHA-256 da concatenação dos hashes dos blocos. Um
+# cliente que guardou a lista anterior descobre quais blocos mudaram sem
+# baixar o arquivo inteiro.
+def calcularHashPorBlocos(caminho: str, linhasPorBloco: int) -> Dict[str, object]:
+    if linhasPorBloco <= 0:
+        raise ValueError(f"Quantidade de linhas por bloco inválida: {linhasPorBloco}")
+    with open(caminho, "rb") as file:
+        chave = chaveDoArquivo(caminho, file) + ("blocos", linhasPorBloco)
+        blocosEmCache = consultarCache(chave)
+        if blocosEmCache is not None:
+            return blocosEmCache
+        conteudo = mapearArquivo(file)
+        blocos: List[Dict[str, object]] = []
+        raiz = hashlib.sha256()
+        inicio = 0
+        linha = 0
+        while inicio < len(conteudo):
+            fim = inicio
+            for _ in range(linhasPorBloco):
+                fim = conteudo.find(b"\n", fim) + 1
+                if fim == 0:
+                    fim = len(conteudo)
+                    break
+            digest = hashlib.sha256(conteudo[inicio:fim]).digest()
+            raiz.update(digest)
+            blocos.append(
+                {
+                    "linhaInicial": linha,
+                    "byteInicial": inicio,
+                    "tamanho": fim - inicio,
+                    "hash": digest.hex(),
+                }
+            )
+            linha += linhasPorBloco
+            inicio = fim
+        registrarLeitura("hashPorBlocos", len(conteudo))
+        if isinstance(conteudo, mmap.mmap):
+            conteudo.close()
+        resultado = {
+            "raiz": raiz.hexdigest(),
+            "linhasPorBloco": linhasPorBloco,
+            "blocos": blocos,
+        }
+        return guardarNoCache(chave, resultado)
+
+
+def validarCompactacao(formato: FormatosDeCompactacao, nivel: int | None) -> int:
+    if formato == FormatosDeCompactacao.ZSTD and zstandard is None:
+        raise ValueError("Compactação zstd indisponível: instale o pacote zstandard")
+    minimo, maximo, padrao = NIVEIS_DE_COMPACTACAO[formato]
+    if nivel is None:
+        return padrao
+    if not minimo <= nivel <= maximo:
+        raise ValueError(
+            f"Nível de compactação inválido para {formato.value}: use de {minimo} a {maximo}"
+        )
+    return nivel
+
+
+# O ZIP é um contêiner e substitui a extensão (personagens.zip); gzip e zstd
+# compactam o próprio csv e só acrescentam a sua (personagens.csv.gz).
+def nomeDoArquivoCompactado(caminho: str, formato: FormatosDeCompactacao) -> str:
+    nome = os.path.basename(caminho)
+    if formato == FormatosDeCompactacao.ZIP:
+        return os.path.splitext(nome)[0] + ".zip"
+    if formato == FormatosDeCompactacao.GZIP:
+        return nome + ".gz"
+    return nome + ".zst"
+
+
+# Buffer só de escrita onde o compactador deposita os bytes; o gerador esvazia
+# o buffer a cada pedaço lido do CSV, então nada é escrito em arquivo temporário.
+class BufferDeSaida(io.RawIOBase):
+    def __init__(self):
+        self.partes: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, dados) -> int:
+        self.partes.append(bytes(dados))
+        return len(dados)
+
+    def esvaziar(self) -> bytes:
+        dados = b"".join(self.partes)
+        self.partes = []
+        return dados
+
+
+def compactarZIP(file, nomeNoArquivo: str, nivel: int) -> Iterator[bytes]:
+    saida = BufferDeSaida()
+    infoDoArquivo = zipfile.ZipInfo(
+        nomeNoArquivo, time.localtime(os.fstat(file.fileno()).st_mtime)[:6]
+    )
+    infoDoArquivo.compress_type = zipfile.ZIP_DEFLATED
+    with zipfile.ZipFile(saida, "w", zipfile.ZIP_DEFLATED, compresslevel=nivel) as zipf:
+        with zipf.open(infoDoArquivo, "w", force_zip64=True) as destino:
+            for pedaco in iter(lambda: file.read(TAMANHO_DO_BUFFER), b""):
+                destino.write(pedaco)
+                yield saida.esvaziar()
+    yield saida.esvaziar()
+
+
+def compactarGZIP(file, nivel: int) -> Iterator[bytes]:
+    # wbits = 31 faz o zlib emitir o cabeçalho e o rodapé do formato gzip.
+    compactador = zlib.compressobj(nivel, zlib.DEFLATED, 31)
+    for pedaco in iter(lambda: file.read(TAMANHO_DO_BUFFER), b""):
+        yield compactador.compress(pedaco)
+    yield compactador.flush()
+
+
+def compactarZSTD(file, nivel: int) -> Iterator[bytes]:
+    compactador = zstandard.ZstdCompressor(level=nivel).compressobj()
+    for pedaco in iter(lambda: file.read(TAMANHO_DO_BUFFER), b""):
+        yield compactador.compress(pedaco)
+    yield compactador.flush()
+
+
+# Gera o CSV compactado em pedaços para um StreamingResponse. O resultado fica
+# em cache, se couber em LIMITE_DO_CACHE_DE_ARTEFATOS, sob a mesma chave
+# (inode, tamanho, mtime) usada pelo hash, então downloads seguintes do mesmo
+# conteúdo só repetem os bytes já compactados.
+def gerarArquivoCompactado(
+    caminho: str, formato: FormatosDeCompactacao, nivel: int
+) -> Iterator[bytes]:
+    with open(caminho, "rb") as file:
+        chave = chaveDoArquivo(caminho, file) + (formato.value, nivel)
+        with travaDoCache:
+            artefato = cacheDeArtefatos.get(chave)
+        if artefato is not None:
+            yield artefato
+            return
+
+        if formato == FormatosDeCompactacao.ZIP:
+            pedacos = compactarZIP(file, os.path.basename(caminho), nivel)
+        elif formato == FormatosDeCompactacao.GZIP:
+            pedacos = compactarGZIP(file, nivel)
+        else:
+            pedacos = compactarZSTD(file, nivel)
+
+        # Os pedaços só são guardados enquanto o artefato couber no cache;
+        # passado o limite, o download segue só em streaming.
+        partes: Optional[List[bytes]] = []
+        tamanho = 0
+        for pedaco in pedacos:
+            if pedaco:
+                tamanho += len(pedaco)
+                if partes is not None:
+                    if tamanho > LIMITE_DO_CACHE_DE_ARTEFATOS:
+                        partes = None
+                    else:
+                        partes.append(pedaco)
+                yield pedaco
+        registrarLeitura("compactacao", file.tell())
+
+    if partes is None:
+        return
+    artefato = b"".join(partes)
+    with travaDoCache:
+        tamanhoEmCache = sum(len(dados) for dados in cacheDeArtefatos.values())
+        if tamanhoEmCache + len(artefato) > LIMITE_DO_CACHE_DE_ARTEFATOS:
+            cacheDeArtefatos.clear()
+        cacheDeArtefatos[chave] = artefato
+
+
+def etagCorresponde(cabecalhoIfNoneMatch: Optional[str], etag: str) -> bool:
+    if not cabecalhoIfNoneMatch:
+        return False
+    etiquetas = [etiqueta.strip() for etiqueta in cabecalhoIfNoneMatch.split(",")]
+    return "*" in etiquetas or etag in [
+        etiqueta.removeprefix("W/") for etiqueta in etiquetas
+    ]
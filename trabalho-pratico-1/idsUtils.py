@@ -0,0 +1,132 @@
+import itertools
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Tuple
+
+from durabilidadeUtils import sincronizador
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+# Trava exclusiva entre processos sobre `caminho`, criado se não existir. É
+# um arquivo à parte porque a marca é trocada com os.replace, e uma trava no
+# arquivo antigo não valeria para o novo.
+@contextmanager
+def travarArquivo(caminho: str) -> Iterator[None]:
+    with open(caminho, mode="a+b") as file:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+            else:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# Entrega ids sem ler ou escrever o config.yaml. Os ids saem de um
+# itertools.count, cujo next() é atômico no CPython, então o caminho comum não
+# usa trava nenhuma. Só quando o contador ultrapassa o bloco reservado é que
+# uma nova marca d'água (o primeiro id ainda não reservado) é gravada em disco,
+# garantindo que um id entregue nunca volte a ser entregue depois de reiniciar.
+# A reserva relê e grava a marca sob uma trava de arquivo, então processos
+# que compartilham a marca (vários workers, o benchmark) recebem blocos
+# disjuntos.
+class AlocadorDeIds:
+    def __init__(self, caminhoMarca: str, tamanhoBloco: int = 100):
+        self.caminhoMarca = caminhoMarca
+        self.tamanhoBloco = tamanhoBloco
+        self.trava = threading.Lock()
+        self.iniciado = False
+        # Contador e limite ficam numa única tupla para serem lidos juntos.
+        self.estado = (itertools.count(1), 1)
+
+    def lerMarca(self) -> int:
+        try:
+            with open(self.caminhoMarca, mode="r") as file:
+                return int(file.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def gravarMarca(self, marca: int):
+        caminhoTemporario = self.caminhoMarca + ".tmp"
+        with open(caminhoTemporario, mode="w") as file:
+            file.write(str(marca))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(caminhoTemporario, self.caminhoMarca)
+        sincronizador.diretorio(self.caminhoMarca)
+
+    # Reserva `quantidade` ids a partir de `inicio` e mais um bloco. Se outro
+    # processo gravou uma marca depois do nosso `limiteAtual`, os ids até ela
+    # são dele e a reserva começa na marca. Devolve (inicio, limite novo).
+    def reservar(
+        self, inicio: int, limiteAtual: int, quantidade: int
+    ) -> Tuple[int, int]:
+        with travarArquivo(self.caminhoMarca + ".trava"):
+            marca = self.lerMarca()
+            if marca > limiteAtual:
+                inicio = max(inicio, marca)
+            limite = inicio + quantidade + self.tamanhoBloco
+            self.gravarMarca(limite)
+        return inicio, limite
+
+    # Na inicialização o próximo id é o maior entre a marca gravada e o mínimo
+    # informado (maior id do CSV + 1), o que recupera o alocador mesmo que a
+    # marca tenha se perdido.
+    def iniciar(self, minimo: int, tamanhoBloco: int | None = None):
+        with self.trava:
+            if tamanhoBloco is not None:
+                self.tamanhoBloco = tamanhoBloco
+            proximoId = max(minimo, self.lerMarca())
+            self.estado = (itertools.count(proximoId), proximoId)
+            self.iniciado = True
+        logging.info(f"Alocador de ids iniciado a partir do id {proximoId}")
+
+    def alocar(self) -> int:
+        while True:
+            contador, limite = self.estado
+            idAlocado = next(contador)
+            if idAlocado < limite and self.estado[0] is contador:
+                return idAlocado
+            with self.trava:
+                contadorAtual, limiteAtual = self.estado
+                if contador is not contadorAtual:
+                    continue
+                if idAlocado >= limiteAtual:
+                    inicio, limiteAtual = self.reservar(idAlocado, limiteAtual, 1)
+                    if inicio != idAlocado:
+                        # Quem ainda usa o contador antigo vê a troca e tenta
+                        # de novo pela trava.
+                        contador = itertools.count(inicio + 1)
+                        idAlocado = inicio
+                    self.estado = (contador, limiteAtual)
+                return idAlocado
+
+    # O intervalo começa no id atual do contador (ou na marca de outro
+    # processo, ver reservar) e só grava uma marca nova quando passa do bloco
+    # reservado. O estado é trocado antes de o início
+    # sair do contador: quem tirar um id do contador antigo depois disso vê a
+    # troca e tenta de novo pela trava, então nenhum id do intervalo é
+    # entregue também por alocar().
+    def alocarIntervalo(self, quantidade: int) -> range:
+        with self.trava:
+            contador, limite = self.estado
+            self.estado = (itertools.count(), 0)
+            inicio = next(contador)
+            if inicio + quantidade > limite:
+                inicio, limite = self.reservar(inicio, limite, quantidade)
+            fim = inicio + quantidade
+            self.estado = (itertools.count(fim), limite)
+        return range(inicio, fim)
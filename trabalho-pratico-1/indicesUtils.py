@@ -0,0 +1,236 @@
+import bisect
+import operator
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from buscaUtils import IndiceDeTexto
+
+CAMPOS_INDICE_HASH = ["nome", "classe", "status"]
+CAMPOS_INDICE_ORDENADO = ["hp", "hpMax", "mp", "mpMax"]
+
+# Campos calculados que também podem ser filtrados e indexados, como a
+# proporção de hp em relação ao hpMax ("hp abaixo de 20% do máximo"). Com o
+# máximo zerado a proporção não existe (None): o registro fica fora do índice
+# e nenhum filtro sobre o campo o seleciona.
+CAMPOS_DERIVADOS: Dict[str, Callable[[Any], Optional[float]]] = {
+    "hpProporcao": lambda registro: (
+        registro.hp / registro.hpMax if registro.hpMax else None
+    ),
+    "mpProporcao": lambda registro: (
+        registro.mp / registro.mpMax if registro.mpMax else None
+    ),
+}
+
+COMPARADORES: Dict[str, Callable[[Any, Any], bool]] = {
+    "eq": operator.eq,
+    "lt": operator.lt,
+    "lte": operator.le,
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "between": lambda valor, intervalo: intervalo[0] <= valor <= intervalo[1],
+}
+OPERADORES_DE_INTERVALO = ["lt", "lte", "gt", "gte", "between"]
+
+INFINITO = float("inf")
+
+
+def valorDoCampo(registro, campo: str):
+    extrator = CAMPOS_DERIVADOS.get(campo)
+    if extrator is not None:
+        return extrator(registro)
+    return getattr(registro, campo)
+
+
+def interpretarIntervalo(valor) -> Tuple[float, float]:
+    if isinstance(valor, str):
+        valor = valor.split(",")
+    if len(valor) != 2:
+        raise ValueError(f"Intervalo inválido: {valor}, use o formato minimo,maximo")
+    minimo, maximo = float(valor[0]), float(valor[1])
+    if minimo > maximo:
+        raise ValueError(f"Intervalo inválido: {minimo} é maior que {maximo}")
+    return minimo, maximo
+
+
+# Converte uma chave de filtro como "hp_lt" em (campo, operador, valor). Chaves
+# sem sufixo de operador continuam sendo filtros de igualdade.
+def interpretarFiltro(chave: str, valor) -> Tuple[str, str, Any]:
+    campo, separador, operador = chave.rpartition("_")
+    if not separador or operador not in OPERADORES_DE_INTERVALO:
+        return chave, "eq", valor
+    if operador == "between":
+        valor = interpretarIntervalo(valor)
+    return campo, operador, valor
+
+
+def atendeFiltro(registro, campo: str, operador: str, valor) -> bool:
+    valorDoRegistro = valorDoCampo(registro, campo)
+    if valorDoRegistro is None:
+        return False
+    return COMPARADORES[operador](valorDoRegistro, valor)
+
+
+# Índice de igualdade: valor do campo -> conjunto de ids.
+class IndiceHash:
+    def __init__(self, campo: str):
+        self.campo = campo
+        self.ids: Dict[Any, Set[int]] = {}
+
+    def reconstruir(self, registros: Iterable):
+        self.ids = {}
+        for registro in registros:
+            self.adicionar(registro)
+
+    def adicionar(self, registro):
+        self.ids.setdefault(getattr(registro, self.campo), set()).add(registro.id)
+
+    def remover(self, registro):
+        valor = getattr(registro, self.campo)
+        ids = self.ids.get(valor)
+        if ids is None:
+            return
+        ids.discard(registro.id)
+        if not ids:
+            del self.ids[valor]
+
+    def suporta(self, operador: str) -> bool:
+        return operador == "eq"
+
+    def estimar(self, operador: str, valor) -> int:
+        return len(self.ids.get(valor, ()))
+
+    def buscar(self, operador: str, valor) -> Set[int]:
+        return set(self.ids.get(valor, ()))
+
+
+# Índice ordenado: lista de pares (valor, id) mantida em ordem com bisect, o que
+# responde igualdades e intervalos em O(log n + k). Registros sem valor no
+# campo (None, como uma proporção sem máximo) ficam fora.
+class IndiceOrdenado:
+    def __init__(self, campo: str):
+        self.campo = campo
+        self.entradas: List[Tuple[Any, int]] = []
+
+    def reconstruir(self, registros: Iterable):
+        entradas = (
+            (valorDoCampo(registro, self.campo), registro.id) for registro in registros
+        )
+        self.entradas = sorted(
+            entrada for entrada in entradas if entrada[0] is not None
+        )
+
+    def adicionar(self, registro):
+        valor = valorDoCampo(registro, self.campo)
+        if valor is not None:
+            bisect.insort(self.entradas, (valor, registro.id))
+
+    def remover(self, registro):
+        entrada = (valorDoCampo(registro, self.campo), registro.id)
+        if entrada[0] is None:
+            return
+        posicao = bisect.bisect_left(self.entradas, entrada)
+        if posicao < len(self.entradas) and self.entradas[posicao] == entrada:
+            del self.entradas[posicao]
+
+    def suporta(self, operador: str) -> bool:
+        return operador in COMPARADORES
+
+    # (valor,) fica antes de qualquer (valor, id) e (valor, INFINITO) depois de
+    # todos eles, então os limites saem direto do bisect.
+    def limites(self, operador: str, valor) -> Tuple[int, int]:
+        entradas = self.entradas
+        if operador == "eq":
+            return (
+                bisect.bisect_left(entradas, (valor,)),
+                bisect.bisect_left(entradas, (valor, INFINITO)),
+            )
+        if operador == "lt":
+            return 0, bisect.bisect_left(entradas, (valor,))
+        if operador == "lte":
+            return 0, bisect.bisect_left(entradas, (valor, INFINITO))
+        if operador == "gt":
+            return bisect.bisect_left(entradas, (valor, INFINITO)), len(entradas)
+        if operador == "gte":
+            return bisect.bisect_left(entradas, (valor,)), len(entradas)
+        minimo, maximo = valor
+        return (
+            bisect.bisect_left(entradas, (minimo,)),
+            bisect.bisect_left(entradas, (maximo, INFINITO)),
+        )
+
+    def estimar(self, operador: str, valor) -> int:
+        inicio, fim = self.limites(operador, valor)
+        return max(0, fim - inicio)
+
+    def buscar(self, operador: str, valor) -> Set[int]:
+        inicio, fim = self.limites(operador, valor)
+        return {idRegistro for _, idRegistro in self.entradas[inicio:fim]}
+
+
+class IndicesPersonagem:
+    def __init__(self):
+        self.indices = {campo: IndiceHash(campo) for campo in CAMPOS_INDICE_HASH}
+        self.indices.update(
+            {campo: IndiceOrdenado(campo) for campo in CAMPOS_INDICE_ORDENADO}
+        )
+        self.indices.update(
+            {campo: IndiceOrdenado(campo) for campo in CAMPOS_DERIVADOS}
+        )
+        # Fica fora de self.indices porque não responde filtros, só buscas, e é
+        # montado sob demanda pelo repositório.
+        self.texto = IndiceDeTexto("nome")
+
+    def reconstruir(self, registros: Iterable):
+        registros = list(registros)
+        for indice in self.indices.values():
+            indice.reconstruir(registros)
+        self.texto.descartar()
+
+    def adicionar(self, registro):
+        for indice in self.indices.values():
+            indice.adicionar(registro)
+        self.texto.adicionar(registro)
+
+    def remover(self, registro):
+        for indice in self.indices.values():
+            indice.remover(registro)
+        self.texto.remover(registro)
+
+    def substituir(self, antigo, novo):
+        for indice in self.indices.values():
+            indice.remover(antigo)
+            indice.adicionar(novo)
+        if antigo.nome != novo.nome:
+            self.texto.remover(antigo)
+            self.texto.adicionar(novo)
+
+    # Planejador de consultas: ordena os filtros indexados pela quantidade
+    # estimada de ids e intersecta a partir do mais seletivo, parando assim que
+    # o resultado fica vazio. Filtros sem índice são devolvidos ao chamador,
+    # já interpretados como (campo, operador, valor), para serem aplicados
+    # sobre os candidatos.
+    def planejar(
+        self, filtros: Dict[str, Any]
+    ) -> Tuple[Optional[Set[int]], List[Tuple[str, str, Any]]]:
+        indexados = []
+        restantes = []
+        for chave, valor in filtros.items():
+            campo, operador, valor = interpretarFiltro(chave, valor)
+            indice = self.indices.get(campo)
+            if indice is None or not indice.suporta(operador):
+                restantes.append((campo, operador, valor))
+            else:
+                indexados.append(
+                    (indice.estimar(operador, valor), indice, operador, valor)
+                )
+
+        if not indexados:
+            return None, restantes
+
+        indexados.sort(key=lambda item: item[0])
+        _, indice, operador, valor = indexados[0]
+        ids = indice.buscar(operador, valor)
+        for _, indice, operador, valor in indexados[1:]:
+            if not ids:
+                break
+            ids &= indice.buscar(operador, valor)
+        return ids, restantes
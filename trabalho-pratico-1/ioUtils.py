@@ -0,0 +1,54 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Iterable
+
+# Executor dedicado ao I/O do armazenamento. Os endpoints são async e mandam
+# para cá tudo o que pode bloquear (carregar, gravar, consolidar e ler o csv),
+# então um disco lento ocupa threads deste pool, cujo tamanho vem de
+# data.threadsDeIO, e não o laço de eventos nem o pool padrão do Starlette.
+TAMANHO_PADRAO_DO_EXECUTOR = 64
+
+executorDeIO = ThreadPoolExecutor(
+    max_workers=TAMANHO_PADRAO_DO_EXECUTOR, thread_name_prefix="io-csv"
+)
+FIM = object()
+
+
+def configurarExecutorDeIO(tamanho: int):
+    global executorDeIO
+    if tamanho <= 0:
+        raise ValueError(f"Tamanho inválido para o executor de I/O: {tamanho}")
+    anterior = executorDeIO
+    executorDeIO = ThreadPoolExecutor(max_workers=tamanho, thread_name_prefix="io-csv")
+    anterior.shutdown(wait=False)
+    logging.info(f"Executor de I/O configurado com {tamanho} threads")
+
+
+async def executarIO(funcao: Callable, *args, **kwargs) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executorDeIO, functools.partial(funcao, *args, **kwargs)
+    )
+
+
+# Consome um iterador bloqueante (leitura de arquivo, compactação) pedaço a
+# pedaço no executor de I/O, para ser transmitido por uma StreamingResponse.
+async def iterarIO(iteravel: Iterable) -> AsyncIterator:
+    iterador = iter(iteravel)
+    try:
+        while True:
+            item = await executarIO(next, iterador, FIM)
+            if item is FIM:
+                return
+            yield item
+    finally:
+        # Se a resposta foi cancelada no meio de um next() o gerador ainda está
+        # rodando no executor e será coletado quando terminar.
+        fechar = getattr(iterador, "close", None)
+        if fechar is not None:
+            try:
+                fechar()
+            except ValueError:
+                pass
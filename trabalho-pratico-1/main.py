@@ -1,17 +1,33 @@
-from typing import List, Dict, Optional
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    List,
+    Dict,
+    Optional,
+    Tuple,
+)
 from http import HTTPStatus
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import FileResponse, StreamingResponse
+import json
 import logging
+import exportacaoUtils
+import ioUtils
+import metricasUtils
 import persistUtils
+import respostasUtils
+from buscaUtils import LIMITE_PADRAO_DA_BUSCA, ModosDeBusca
 from persistUtils import Personagem
-import zipfile 
+from pydantic import ValidationError
 import os
-import hashlib 
 
 app = FastAPI()
+app.add_middleware(metricasUtils.MiddlewareDeMetricas)
 CONFIG_FILE = "config.yaml"
-CSV_FILE = persistUtils.configuracaoInicialServidor(CONFIG_FILE)
+persistUtils.configuracaoInicialServidor(CONFIG_FILE)
 
 
 @app.get(
@@ -66,21 +82,126 @@ async def exemplo_endpoint() -> Dict[str, int | str | Dict[str, bool | str]]:
     description="Recebe um json para inserer um persoangem no csv",
     summary="Criar personagem",
 )
-def criarPersonagem(personagem: Personagem):
-    proximoId = persistUtils.obterProximoId(CONFIG_FILE)
-    personagem.id = proximoId
-    persistUtils.inserirPersonagemNoCSV(personagem)
-    persistUtils.incrementarProximoId(CONFIG_FILE)
+async def criarPersonagem(personagem: Personagem):
+    personagem.id = await ioUtils.executarIO(persistUtils.alocarProximoId)
+    try:
+        await ioUtils.executarIO(persistUtils.inserirPersonagemNoCSV, personagem)
+    except ValueError as e:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=str(e))
     return personagem
 
 
+@app.post(
+    "/personagens/bulk",
+    response_model=List[Personagem],
+    status_code=HTTPStatus.CREATED,
+    description="Recebe vários personagens de uma vez, como array JSON, NDJSON "
+    "(Content-Type application/x-ndjson) ou CSV com cabeçalho (Content-Type text/csv), "
+    "e insere todos no csv com ids contíguos em uma única escrita",
+    summary="Criar personagens em lote",
+)
+async def criarPersonagensEmLote(request: Request) -> List[Personagem]:
+    personagens = await lerCorpoEmLote(request)
+    try:
+        return await ioUtils.executarIO(
+            persistUtils.inserirPersonagensNoCSV, personagens
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=str(e))
+
+
+@app.put(
+    "/personagens/bulk",
+    response_model=Dict[str, List[Personagem] | List[int]],
+    status_code=HTTPStatus.OK,
+    description="Recebe vários personagens com id, nos mesmos formatos do POST em lote, "
+    "e atualiza todos os que existirem no csv em uma única escrita",
+    summary="Atualizar personagens em lote",
+)
+async def atualizarPersonagensEmLote(
+    request: Request,
+) -> Dict[str, List[Personagem] | List[int]]:
+    personagens = await lerCorpoEmLote(request)
+    try:
+        atualizados, naoEncontrados = await ioUtils.executarIO(
+            persistUtils.atualizarPersonagensNoCSV, personagens
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=str(e))
+    return {"atualizados": atualizados, "naoEncontrados": naoEncontrados}
+
+
+async def lerCorpoEmLote(request: Request) -> List[Personagem]:
+    conteudo = await request.body()
+    try:
+        return await ioUtils.executarIO(
+            persistUtils.lerPersonagensEmLote,
+            conteudo,
+            request.headers.get("content-type", "application/json"),
+        )
+    except ValidationError as e:
+        logging.error(f"Lote de personagens inválido: {len(e.errors())} erros")
+        raise RequestValidationError(e.errors())
+    except ValueError as e:
+        logging.error(f"Lote de personagens inválido: {str(e)}")
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=str(e))
+
+
+PARAMETROS_DE_LISTAGEM = [
+    "campoOrdenacao",
+    "direcaoOrdenacao",
+    "limit",
+    "cursor",
+    "formato",
+    "requisicao",
+]
+
+
+# Leituras condicionais: o ETag vem da versão dos dados e do recurso pedido
+# (caminho e parâmetros da requisição), e corpos já serializados nesta versão
+# saem do cacheDeRespostas pela mesma chave. O recurso é resolvido antes do
+# If-None-Match, então um id inexistente ou uma consulta inválida nunca
+# recebem 304; com o ETag atual a resposta é 304 sem corpo.
+async def responderComCache(
+    requisicao: Request,
+    gerarCorpo: Callable[[], Awaitable[Tuple[bytes, Dict[str, str]]]],
+) -> Response:
+    versao = await ioUtils.executarIO(persistUtils.versaoDosDados)
+    chave = (requisicao.url.path, tuple(sorted(requisicao.query_params.multi_items())))
+    resposta = respostasUtils.cacheDeRespostas.obter(versao, chave)
+    if resposta is None:
+        resposta = await gerarCorpo()
+        respostasUtils.cacheDeRespostas.guardar(versao, chave, *resposta)
+    corpo, cabecalhos = resposta
+    etag = respostasUtils.etagDoRecurso(versao, chave)
+    if exportacaoUtils.etagCorresponde(requisicao.headers.get("if-none-match"), etag):
+        respostasUtils.registrarNaoModificado()
+        return Response(
+            status_code=HTTPStatus.NOT_MODIFIED, headers={"ETag": etag, **cabecalhos}
+        )
+    return Response(
+        corpo, media_type="application/json", headers={"ETag": etag, **cabecalhos}
+    )
+
+
 @app.get(
     "/personagens/listar",
     response_model=List[Personagem],
-    description="Listar todos os personagens do csv utilizando filtros e ordenação",
+    description="Listar todos os personagens do csv utilizando filtros e ordenação. "
+    "Os campos numéricos aceitam os sufixos _lt, _lte, _gt e _gte e o sufixo _between "
+    "com dois valores separados por vírgula (ex.: mp_between=50,100). "
+    "hpProporcao e mpProporcao filtram pela razão hp/hpMax e mp/mpMax (ex.: hpProporcao_lt=0.2); "
+    "personagens com hpMax ou mpMax igual a 0 não têm a razão e nunca atendem esses filtros. "
+    "Com limit e cursor a listagem é paginada e o cursor da próxima página volta no "
+    "cabeçalho X-Proximo-Cursor; formato=ndjson transmite um personagem por linha, "
+    "sem limit na ordem do armazenamento a menos que campoOrdenacao ou "
+    "direcaoOrdenacao seja informado. "
+    "A resposta JSON traz um ETag da versão dos dados e da consulta: If-None-Match com o "
+    "mesmo ETag devolve 304 sem corpo enquanto nada for alterado",
     summary="Listar personagens com filtros e odrenação",
 )
-def listarPersonagensComFiltrosEOrdenacao(
+async def listarPersonagensComFiltrosEOrdenacao(
+    requisicao: Request,
     id: Optional[int] = None,
     nome: Optional[str] = None,
     classe: Optional[str] = None,
@@ -89,14 +210,46 @@ def listarPersonagensComFiltrosEOrdenacao(
     mp: Optional[int] = None,
     mpMax: Optional[int] = None,
     status: Optional[str] = None,
+    hp_lt: Optional[int] = None,
+    hp_lte: Optional[int] = None,
+    hp_gt: Optional[int] = None,
+    hp_gte: Optional[int] = None,
+    hp_between: Optional[str] = None,
+    hpMax_lt: Optional[int] = None,
+    hpMax_lte: Optional[int] = None,
+    hpMax_gt: Optional[int] = None,
+    hpMax_gte: Optional[int] = None,
+    hpMax_between: Optional[str] = None,
+    mp_lt: Optional[int] = None,
+    mp_lte: Optional[int] = None,
+    mp_gt: Optional[int] = None,
+    mp_gte: Optional[int] = None,
+    mp_between: Optional[str] = None,
+    mpMax_lt: Optional[int] = None,
+    mpMax_lte: Optional[int] = None,
+    mpMax_gt: Optional[int] = None,
+    mpMax_gte: Optional[int] = None,
+    mpMax_between: Optional[str] = None,
+    hpProporcao_lt: Optional[float] = None,
+    hpProporcao_lte: Optional[float] = None,
+    hpProporcao_gt: Optional[float] = None,
+    hpProporcao_gte: Optional[float] = None,
+    hpProporcao_between: Optional[str] = None,
+    mpProporcao_lt: Optional[float] = None,
+    mpProporcao_lte: Optional[float] = None,
+    mpProporcao_gt: Optional[float] = None,
+    mpProporcao_gte: Optional[float] = None,
+    mpProporcao_between: Optional[str] = None,
     campoOrdenacao: Optional[str] = None,
     direcaoOrdenacao: Optional[persistUtils.DirecoesDeOrdenacao] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    formato: Optional[persistUtils.FormatosDeListagem] = None,
 ) -> List[Personagem]:
     filtros = {
         k: v
         for k, v in locals().items()
-        if k in ["id", "nome", "classe", "hp", "hpMax", "mp", "mpMax", "status"]
-        and v is not None
+        if k not in PARAMETROS_DE_LISTAGEM and v is not None
     }
 
     request = {
@@ -106,43 +259,111 @@ def listarPersonagensComFiltrosEOrdenacao(
         or persistUtils.DirecoesDeOrdenacao.ASCENDENTE,
     }
 
-    return persistUtils.listarPersonagensDoCSVComFiltrosEOrdenacao(
-        request["filtros"], request["campoOrdenacao"], request["direcaoOrdenacao"]
+    async def listar() -> Tuple[List[Personagem], Dict[str, str]]:
+        try:
+            proximoCursor = None
+            if limit is not None or cursor is not None:
+                personagens, proximoCursor = await ioUtils.executarIO(
+                    persistUtils.listarPaginaDePersonagens,
+                    request["filtros"],
+                    request["campoOrdenacao"],
+                    request["direcaoOrdenacao"],
+                    100 if limit is None else limit,
+                    cursor,
+                )
+            else:
+                personagens = await ioUtils.executarIO(
+                    persistUtils.listarPersonagensDoCSVComFiltrosEOrdenacao,
+                    request["filtros"],
+                    request["campoOrdenacao"],
+                    request["direcaoOrdenacao"],
+                )
+        except ValueError as e:
+            logging.error(f"Filtros inválidos na listagem de personagens: {str(e)}")
+            raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=str(e))
+        cabecalhos = {"X-Proximo-Cursor": proximoCursor} if proximoCursor else {}
+        return personagens, cabecalhos
+
+    if formato == persistUtils.FormatosDeListagem.NDJSON:
+        if limit is None and cursor is None:
+            return await transmitirListagem(
+                request["filtros"], campoOrdenacao, direcaoOrdenacao
+            )
+        personagens, cabecalhos = await listar()
+        return StreamingResponse(
+            gerarNDJSON(personagens),
+            media_type="application/x-ndjson",
+            headers=cabecalhos,
+        )
+
+    async def gerarCorpo() -> Tuple[bytes, Dict[str, str]]:
+        personagens, cabecalhos = await listar()
+        return persistUtils.serializarPersonagens(personagens), cabecalhos
+
+    return await responderComCache(requisicao, gerarCorpo)
+
+
+# A listagem NDJSON completa é transmitida do gerador da consulta, sem montar a
+# lista de personagens; só uma ordenação pedida explicitamente passa pelo heap.
+async def transmitirListagem(
+    filtros: Dict[str, int | str],
+    campoOrdenacao: Optional[str],
+    direcaoOrdenacao: Optional[persistUtils.DirecoesDeOrdenacao],
+) -> StreamingResponse:
+    if campoOrdenacao is None and direcaoOrdenacao is not None:
+        campoOrdenacao = "id"
+    try:
+        pedacos = await ioUtils.executarIO(
+            persistUtils.transmitirPersonagensEmNDJSON,
+            filtros,
+            campoOrdenacao,
+            direcaoOrdenacao or persistUtils.DirecoesDeOrdenacao.ASCENDENTE,
+        )
+    except ValueError as e:
+        logging.error(f"Filtros inválidos na listagem de personagens: {str(e)}")
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=str(e))
+    return StreamingResponse(
+        ioUtils.iterarIO(pedacos), media_type="application/x-ndjson"
     )
 
 
+async def gerarNDJSON(personagens: Iterable[Personagem]) -> AsyncIterator[str]:
+    for personagem in personagens:
+        yield personagem.model_dump_json() + "\n"
+
+
 @app.get(
     "/personagens/details/{personagem_id}",
     status_code=HTTPStatus.OK,
     response_model=Personagem | Dict[str, int | str | Dict[str, int | str]],
-    description="Utilizar o id do personagem para resgatar ele do csv",
+    description="Utilizar o id do personagem para resgatar ele do csv. A resposta traz "
+    "um ETag da versão dos dados e do personagem: If-None-Match com o mesmo ETag devolve "
+    "304 sem corpo",
     summary="Ler personagem",
 )
-def lerPersonagem(personagem_id: int) -> Personagem:
-    try:
-        personagem = persistUtils.lerPersonagemCSV(personagem_id)
+async def lerPersonagem(personagem_id: int, requisicao: Request) -> Personagem:
+    async def gerarCorpo() -> Tuple[bytes, Dict[str, str]]:
+        personagem = await ioUtils.executarIO(persistUtils.lerPersonagemCSV, personagem_id)
         if personagem is None:
             raise HTTPException(
                 status_code=HTTPStatus.NOT_FOUND,
                 detail="Personagem não encontrado",
             )
-        return personagem
-    except Exception as e:
+        return personagem.model_dump_json().encode(), {}
+
+    try:
+        return await responderComCache(requisicao, gerarCorpo)
+    except HTTPException as e:
         logging.error(f"Erro ao ler personagem de id {personagem_id}: {str(e.detail)}")
-        if isinstance(e, HTTPException):
-            return {
-                "erro": {
-                    "status": e.status_code,
-                    "mensagem": str(e.detail),
-                }
-            }
-        else:
-            return {
-                "erro": {
-                    "status": HTTPStatus.INTERNAL_SERVER_ERROR,
-                    "mensagem": "Erro interno do servidor, tente novamente",
-                }
+        return {"erro": {"status": e.status_code, "mensagem": str(e.detail)}}
+    except Exception as e:
+        logging.error(f"Erro ao ler personagem de id {personagem_id}: {str(e)}")
+        return {
+            "erro": {
+                "status": HTTPStatus.INTERNAL_SERVER_ERROR,
+                "mensagem": "Erro interno do servidor, tente novamente",
             }
+        }
 
 
 @app.put(
@@ -152,12 +373,12 @@ def lerPersonagem(personagem_id: int) -> Personagem:
     description="Utilizar o id do personagem e um personagem no body para atualizar um personagem do csv",
     summary="Atualizar personagem",
 )
-def atualizarPersonagem(
+async def atualizarPersonagem(
     personagem_id: int, personagem_atualizado: Personagem
 ) -> Personagem:
     try:
-        personagem = persistUtils.atualizarPersonagemNoCSV(
-            personagem_id, personagem_atualizado
+        personagem = await ioUtils.executarIO(
+            persistUtils.atualizarPersonagemNoCSV, personagem_id, personagem_atualizado
         )
         if personagem is None:
             raise HTTPException(
@@ -165,6 +386,8 @@ def atualizarPersonagem(
                 detail="Personagem não encontrado",
             )
         return personagem
+    except ValueError as e:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=str(e))
     except Exception as e:
         logging.error(f"Erro ao atualizar personagem de id {personagem_id}: {str(e)}")
         if isinstance(e, HTTPException):
@@ -185,11 +408,13 @@ def atualizarPersonagem(
     description="Utilizar o id do personagem para remover ele do csv",
     summary="Remover personagem",
 )
-def removerPersonagem(
+async def removerPersonagem(
     personagem_id: int,
 ) -> Personagem:
     try:
-        personagem = persistUtils.deletarPersonagemDoCSV(personagem_id)
+        personagem = await ioUtils.executarIO(
+            persistUtils.deletarPersonagemDoCSV, personagem_id
+        )
         if personagem is None:
             raise HTTPException(
                 status_code=HTTPStatus.NOT_FOUND,
@@ -212,70 +437,161 @@ def removerPersonagem(
 @app.get(
     "/personagens/count",
     status_code=HTTPStatus.OK,
-    description="Retorna a quantidade de personagens",
+    description="Retorna a quantidade de personagens. A resposta traz um ETag da versão "
+    "dos dados: If-None-Match com o mesmo ETag devolve 304 sem corpo",
     summary="Contar personagens",
 )
-def contarPersonagens() -> Dict[str, str | int | Dict]:
-    resultado = persistUtils.contarPersonagensDoCSV()
-    resultado = {"quantidade": resultado}
-    return resultado
+async def contarPersonagens(requisicao: Request) -> Dict[str, str | int | Dict]:
+    async def gerarCorpo() -> Tuple[bytes, Dict[str, str]]:
+        resultado = await ioUtils.executarIO(persistUtils.contarPersonagensDoCSV)
+        resultado = {"quantidade": resultado}
+        return json.dumps(resultado, separators=(",", ":")).encode(), {}
+
+    return await responderComCache(requisicao, gerarCorpo)
+
+
+@app.get(
+    "/personagens/stats",
+    status_code=HTTPStatus.OK,
+    description="Retorna quantidade, mínimo, máximo, média e percentis de hp, hpMax, mp e "
+    "mpMax, opcionalmente agrupados por classe e/ou status (agruparPor=classe,status). Os "
+    "percentis padrão são 50, 90 e 99 e podem ser trocados com percentis=25,50,75. O "
+    "resultado é calculado numa única passada e reaproveitado até a próxima alteração",
+    summary="Estatísticas dos personagens",
+)
+async def estatisticasPersonagens(
+    agruparPor: Optional[str] = None, percentis: Optional[str] = None
+) -> Dict[str, List[str] | List[Dict]]:
+    try:
+        return await ioUtils.executarIO(
+            persistUtils.calcularEstatisticasDosPersonagens, agruparPor, percentis
+        )
+    except ValueError as e:
+        logging.error(f"Erro ao calcular estatísticas: {str(e)}")
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=str(e))
+
+
+@app.get(
+    "/personagens/search",
+    response_model=List[Personagem],
+    description="Busca personagens pelo nome sem diferenciar maiúsculas nem acentos. "
+    "modo=prefixo encontra nomes com alguma palavra começando pelo texto, "
+    "modo=substring nomes que contêm o texto e modo=aproximado nomes parecidos, "
+    "tolerando erros de digitação (similaridade de trigramas). Os resultados vêm do "
+    "mais relevante para o menos, até o limite",
+    summary="Buscar personagens pelo nome",
+)
+async def buscarPersonagens(
+    q: str,
+    modo: ModosDeBusca = ModosDeBusca.SUBSTRING,
+    limite: int = LIMITE_PADRAO_DA_BUSCA,
+) -> List[Personagem]:
+    try:
+        return await ioUtils.executarIO(
+            persistUtils.buscarPersonagensPorNome, q, modo, limite
+        )
+    except ValueError as e:
+        logging.error(f"Busca inválida de personagens: {str(e)}")
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=str(e))
 
 
 @app.get(
     "/personagens/download",
     status_code=HTTPStatus.OK,
-    description="Faz o download do csv",
+    description="Faz o download do csv. A resposta traz um ETag com o hash SHA-256 do "
+    "arquivo: If-None-Match com o mesmo ETag devolve 304 sem corpo, e o cabeçalho Range "
+    "(intervalos em bytes, opcionalmente condicionado por If-Range) devolve só os trechos "
+    "pedidos, permitindo retomar downloads interrompidos",
     summary="Download CSV",
 )
-def downloadCSV() -> FileResponse:
-    pass
+async def downloadCSV(request: Request) -> Response:
+    caminho_csv, caminhoDaCopia = await ioUtils.executarIO(
+        persistUtils.copiaDoCSVParaDownload
+    )
+    hashDoArquivo = await ioUtils.executarIO(
+        exportacaoUtils.calcularHashSHA256, caminhoDaCopia
+    )
+    etag = f'"{hashDoArquivo}"'
+    cabecalhos = {"ETag": etag, "Accept-Ranges": "bytes"}
+    if exportacaoUtils.etagCorresponde(request.headers.get("if-none-match"), etag):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=cabecalhos)
+
+    # A cópia nunca muda, então o FileResponse pode reabri-la pelo caminho
+    # (inclusive com pathsend) e Range e If-Range (comparado com este ETag)
+    # sempre valem para os bytes do hash.
+    return FileResponse(
+        caminhoDaCopia,
+        media_type="text/csv",
+        filename=os.path.basename(caminho_csv),
+        headers=cabecalhos,
+    )
 
-def calcular_hash_sha256(caminho_csv: str) -> str:
-    sha256_hash = hashlib.sha256()
-    with open(caminho_csv, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
-            sha256_hash.update(byte_block)
-    return sha256_hash.hexdigest()
 
 @app.get(
     "/personagens/hash",
     status_code=HTTPStatus.OK,
-    description="Retorna o hash do csv",
+    description="Retorna o hash SHA-256 do csv. Com blocos=true retorna também o hash de "
+    "cada bloco de linhasPorBloco linhas e a raiz calculada sobre eles, para que o cliente "
+    "descubra quais trechos mudaram",
     summary="Hash CSV",
 )
-def hashCSV() -> Dict[str, str]:
-    caminho_csv = CSV_FILE
-    hash_sha256 = calcular_hash_sha256(caminho_csv)
-    return {"hash": hash_sha256}
-
-
-def compactarCSVParaZIP(caminho_csv: str, caminho_zip: str):
-    with zipfile.ZipFile(caminho_zip, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        zipf.write(caminho_csv, os.path.basename(caminho_csv))
+async def hashCSV(
+    blocos: bool = False, linhasPorBloco: int = 1000
+) -> Dict[str, str | int | List[Dict[str, str | int]]]:
+    caminho_csv = await ioUtils.executarIO(persistUtils.caminhoCSVConsolidado)
+    resultado = {
+        "hash": await ioUtils.executarIO(exportacaoUtils.calcularHashSHA256, caminho_csv)
+    }
+    if blocos:
+        try:
+            resultado.update(
+                await ioUtils.executarIO(
+                    exportacaoUtils.calcularHashPorBlocos, caminho_csv, linhasPorBloco
+                )
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=str(e))
+    return resultado
 
 
 @app.get(
     "/personagens/download_zip",
     status_code=HTTPStatus.OK,
-    description="Faz o download do csv compactado em um arquivo ZIP",
+    description="Faz o download do csv compactado, em ZIP por padrão. O formato (zip, gzip "
+    "ou zstd, se disponível) e o nível de compactação podem ser escolhidos; o arquivo "
+    "compactado é transmitido sem arquivo temporário e reaproveitado enquanto o csv não muda",
     summary="Download CSV ZIP",
 )
-def downloadCSVZIP() -> FileResponse:
-    caminho_csv = CSV_FILE
-    caminho_zip = "personagens.zip"
-    
-    # Adicionando logs
-    logging.info(f"Compactando o arquivo CSV: {caminho_csv}")
-    
-    compactarCSVParaZIP(caminho_csv, caminho_zip)
-    
-    logging.info(f"Arquivo ZIP criado: {caminho_zip}")
-    
-    if os.path.exists(caminho_zip):
-        logging.info(f"Arquivo ZIP encontrado: {caminho_zip}")
-        return FileResponse(caminho_zip, media_type='application/zip', filename=caminho_zip)
-    else:
-        logging.error(f"Arquivo ZIP não encontrado: {caminho_zip}")
-        raise HTTPException(status_code=404, detail="Arquivo ZIP não encontrado")
+async def downloadCSVZIP(
+    formato: exportacaoUtils.FormatosDeCompactacao = exportacaoUtils.FormatosDeCompactacao.ZIP,
+    nivel: Optional[int] = None,
+) -> StreamingResponse:
+    try:
+        nivel = exportacaoUtils.validarCompactacao(formato, nivel)
+    except ValueError as e:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=str(e))
 
+    caminho_csv = await ioUtils.executarIO(persistUtils.caminhoCSVConsolidado)
+    nomeDoArquivo = exportacaoUtils.nomeDoArquivoCompactado(caminho_csv, formato)
+    logging.info(f"Compactando o arquivo CSV {caminho_csv} em {formato.value}")
+    return StreamingResponse(
+        ioUtils.iterarIO(
+            exportacaoUtils.gerarArquivoCompactado(caminho_csv, formato, nivel)
+        ),
+        media_type=exportacaoUtils.TIPOS_DE_CONTEUDO[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nomeDoArquivo}"'},
+    )
 
+
+@app.get(
+    "/metrics",
+    status_code=HTTPStatus.OK,
+    description="Métricas no formato texto do Prometheus: histogramas de latência por "
+    "rota e por operação de persistência, linhas varridas, bytes lidos e gravados e "
+    "quantidade de gravações por tipo (reescrita completa, anexo, no lugar e journal)",
+    summary="Métricas",
+)
+async def metricas() -> Response:
+    return Response(
+        metricasUtils.registro.exportar(), media_type=metricasUtils.TIPO_DE_CONTEUDO
+    )
@@ -0,0 +1,240 @@
+import bisect
+import functools
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+BUCKETS_PADRAO = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def escaparRotulo(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def formatarRotulos(rotulos: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    partes = [f'{nome}="{escaparRotulo(valor)}"' for nome, valor in rotulos]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def formatarNumero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+    tipo = "counter"
+
+    def __init__(self, nome: str, ajuda: str):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.valores: Dict[Tuple, float] = {}
+        self.trava = threading.Lock()
+
+    def incrementar(self, quantidade: float = 1, **rotulos):
+        chave = tuple(sorted(rotulos.items()))
+        with self.trava:
+            self.valores[chave] = self.valores.get(chave, 0) + quantidade
+
+    def exportar(self) -> List[str]:
+        with self.trava:
+            valores = sorted(self.valores.items())
+        return [
+            f"{self.nome}{formatarRotulos(rotulos)} {formatarNumero(valor)}"
+            for rotulos, valor in valores
+        ]
+
+
+# Histograma cumulativo no formato do Prometheus: cada série guarda a contagem
+# por bucket, a soma e o total de observações.
+class Histograma:
+    tipo = "histogram"
+
+    def __init__(
+        self, nome: str, ajuda: str, buckets: Tuple[float, ...] = BUCKETS_PADRAO
+    ):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.buckets = tuple(sorted(buckets))
+        self.series: Dict[Tuple, List] = {}
+        self.trava = threading.Lock()
+
+    def observar(self, valor: float, **rotulos):
+        chave = tuple(sorted(rotulos.items()))
+        posicao = bisect.bisect_left(self.buckets, valor)
+        with self.trava:
+            serie = self.series.get(chave)
+            if serie is None:
+                serie = self.series[chave] = [[0] * len(self.buckets), 0.0, 0]
+            if posicao < len(self.buckets):
+                serie[0][posicao] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def exportar(self) -> List[str]:
+        with self.trava:
+            series = sorted(
+                (rotulos, (list(contagens), soma, total))
+                for rotulos, (contagens, soma, total) in self.series.items()
+            )
+        linhas = []
+        infinito = 'le="+Inf"'
+        for rotulos, (contagens, soma, total) in series:
+            acumulado = 0
+            for limite, contagem in zip(self.buckets, contagens):
+                acumulado += contagem
+                le = f'le="{formatarNumero(limite)}"'
+                linhas.append(
+                    f"{self.nome}_bucket{formatarRotulos(rotulos, le)} {acumulado}"
+                )
+            linhas.append(
+                f"{self.nome}_bucket{formatarRotulos(rotulos, infinito)} {total}"
+            )
+            linhas.append(
+                f"{self.nome}_sum{formatarRotulos(rotulos)} {formatarNumero(soma)}"
+            )
+            linhas.append(f"{self.nome}_count{formatarRotulos(rotulos)} {total}")
+        return linhas
+
+
+class RegistroDeMetricas:
+    def __init__(self):
+        self.metricas: Dict[str, Contador | Histograma] = {}
+
+    def registrar(self, metrica):
+        self.metricas[metrica.nome] = metrica
+        return metrica
+
+    def exportar(self) -> str:
+        linhas = []
+        for metrica in self.metricas.values():
+            linhas.append(f"# HELP {metrica.nome} {metrica.ajuda}")
+            linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            linhas.extend(metrica.exportar())
+        return "\n".join(linhas) + "\n"
+
+
+TIPO_DE_CONTEUDO = "text/plain; version=0.0.4; charset=utf-8"
+
+registro = RegistroDeMetricas()
+duracaoDasRequisicoes = registro.registrar(
+    Histograma(
+        "personagens_http_requisicao_segundos",
+        "Duração das requisições HTTP por método, rota e status",
+    )
+)
+duracaoDasOperacoes = registro.registrar(
+    Histograma(
+        "personagens_operacao_segundos",
+        "Duração das operações de persistência por operação",
+    )
+)
+errosDasOperacoes = registro.registrar(
+    Contador(
+        "personagens_operacao_erros_total",
+        "Operações de persistência que terminaram com exceção",
+    )
+)
+linhasVarridas = registro.registrar(
+    Contador(
+        "personagens_linhas_varridas_total",
+        "Linhas examinadas por consultas, listagens, estatísticas e cargas",
+    )
+)
+bytesLidos = registro.registrar(
+    Contador("personagens_bytes_lidos_total", "Bytes lidos de arquivos por origem")
+)
+bytesEscritos = registro.registrar(
+    Contador(
+        "personagens_bytes_escritos_total", "Bytes gravados em arquivos por tipo"
+    )
+)
+gravacoes = registro.registrar(
+    Contador(
+        "personagens_gravacoes_total",
+        "Gravações em disco por tipo (reescrita completa, anexo, no lugar ou journal)",
+    )
+)
+
+
+# Decorador para as funções do persistUtils: mede a duração de cada chamada e
+# conta as que falharam, rotuladas pelo nome da operação.
+def medirOperacao(operacao: str) -> Callable:
+    def decorar(funcao: Callable) -> Callable:
+        @functools.wraps(funcao)
+        def medida(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return funcao(*args, **kwargs)
+            except Exception:
+                errosDasOperacoes.incrementar(operacao=operacao)
+                raise
+            finally:
+                duracaoDasOperacoes.observar(
+                    time.perf_counter() - inicio, operacao=operacao
+                )
+
+        return medida
+
+    return decorar
+
+
+# Middleware ASGI: mede cada requisição até o fim da resposta (inclusive as
+# transmitidas) e rotula pela rota declarada, não pelo caminho, para que
+# /personagens/{personagem_id} seja uma única série.
+class MiddlewareDeMetricas:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        inicio = time.perf_counter()
+        status = [500]
+
+        async def enviar(mensagem):
+            if mensagem["type"] == "http.response.start":
+                status[0] = mensagem["status"]
+            await send(mensagem)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            rota = scope.get("route")
+            duracaoDasRequisicoes.observar(
+                time.perf_counter() - inicio,
+                metodo=scope["method"],
+                rota=getattr(rota, "path", "desconhecida"),
+                status=status[0],
+            )
+
+
+def registrarGravacao(tipo: str, quantidadeDeBytes: int):
+    gravacoes.incrementar(tipo=tipo)
+    bytesEscritos.incrementar(quantidadeDeBytes, tipo=tipo)
+
+
+def registrarLeitura(origem: str, quantidadeDeBytes: int):
+    bytesLidos.incrementar(quantidadeDeBytes, origem=origem)
+
+
+def registrarVarredura(operacao: str, linhas: int):
+    linhasVarridas.incrementar(linhas, operacao=operacao)
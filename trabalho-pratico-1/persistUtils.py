@@ -1,9 +1,50 @@
+import base64
 import csv
+import heapq
+import io
+import json
 import logging
-from typing import Dict, List, Optional
-from pydantic import BaseModel, Field
-import yaml
+import operator
+import os
+import shutil
+import threading
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from pydantic import BaseModel, Field, TypeAdapter
 from enum import Enum
+from armazenamentoUtils import (
+    COLUNAS_INTEIRAS,
+    FormatoCSV,
+    FormatosDeArquivo,
+    ModosDeArmazenamento,
+    TabelaColunar,
+    assinaturaDoArquivo,
+    compilarDecodificador,
+    configurarLeituraParalela,
+    criarFormato,
+    escreverComFsync,
+)
+from buscaUtils import LIMITE_MAXIMO_DA_BUSCA, ModosDeBusca
+from configuracaoUtils import (
+    Configuracao,
+    ConfiguracaoDeLog,
+    ObservadorDeConfiguracao,
+)
+from durabilidadeUtils import configurarDurabilidade, sincronizador, somaDoRegistro
+from escritorUtils import EscritorSerializado
+from estatisticasUtils import (
+    calcularEstatisticas,
+    interpretarAgrupamento,
+    interpretarPercentis,
+)
+from idsUtils import AlocadorDeIds
+from ioUtils import configurarExecutorDeIO
+from metricasUtils import (
+    medirOperacao,
+    registrarGravacao,
+    registrarLeitura,
+    registrarVarredura,
+)
+from indicesUtils import IndicesPersonagem, atendeFiltro
 
 
 class Personagem(BaseModel):
@@ -22,27 +63,17 @@ class DirecoesDeOrdenacao(Enum):
     DESCENTENDE = "DESCENDENTE"
 
 
-def carregarYaml(nomeDoArquivo: str):
-    print("Carregando dados de configuração")
-    with open(nomeDoArquivo, "r") as file:
-        dadosCarregados = yaml.safe_load(file)
-        print("Dados de configuração carregados")
-        return dadosCarregados
+class FormatosDeListagem(Enum):
+    JSON = "json"
+    NDJSON = "ndjson"
 
 
-def salvarYaml(nomeDoArquivo: str, dados: Dict):
-    print("Salvando dados de configuração")
-    with open(nomeDoArquivo, "w") as file:
-        yaml.safe_dump(dados, file)
-        print("Dados de configuração salvos")
-
-
-def configurarLog(configuracao):
+def configurarLog(configuracao: ConfiguracaoDeLog):
     print("Configurando log")
     logging.basicConfig(
-        level=configuracao["level"],
-        filename=configuracao["file"],
-        format=configuracao["format"],
+        level=configuracao.level,
+        filename=configuracao.file,
+        format=configuracao.format,
     )
     print("Log configurado com sucesso!")
     logging.info(
@@ -50,112 +81,1090 @@ def configurarLog(configuracao):
     )
 
 
+observadorDeConfiguracao: Optional[ObservadorDeConfiguracao] = None
+
+
+def obterConfiguracao() -> Configuracao:
+    if observadorDeConfiguracao is None or observadorDeConfiguracao.atual is None:
+        return Configuracao()
+    return observadorDeConfiguracao.atual
+
+
+# O config.yaml é lido só aqui; depois disso o observador recarrega o arquivo
+# quando ele muda e aplicarConfiguracao ajusta só o que foi alterado.
 def configuracaoInicialServidor(arquivoDeConfiguracao: str) -> str:
-    dadosDeConfiguracao = carregarYaml(arquivoDeConfiguracao)
-    nomeArquivoCSV = dadosDeConfiguracao["data"]["file"]
-    configurarLog(dadosDeConfiguracao["logging"])
-    return nomeArquivoCSV
+    global observadorDeConfiguracao
+    observadorDeConfiguracao = ObservadorDeConfiguracao(arquivoDeConfiguracao)
+    configuracao = observadorDeConfiguracao.carregar()
+    configurarLog(configuracao.logging)
+    aplicarConfiguracao(None, configuracao)
+    observadorDeConfiguracao.aoAlterar(aplicarConfiguracao)
+    observadorDeConfiguracao.iniciar()
+    return configuracao.data.file
+
+
+def aplicarConfiguracao(anterior: Optional[Configuracao], nova: Configuracao):
+    dados = nova.data
+    if anterior is not None and anterior.logging.level != nova.logging.level:
+        logging.getLogger().setLevel(nova.logging.level)
+    if anterior is None or anterior.data.threadsDeIO != dados.threadsDeIO:
+        configurarExecutorDeIO(dados.threadsDeIO)
+    configurarLeituraParalela(dados.processosDeLeitura)
+    configurarDurabilidade(dados.durabilidade, dados.intervaloDeSincronizacaoMs / 1000)
+    armazenamento = (
+        dados.file,
+        dados.format,
+        dados.modo,
+        dados.limiteCompactacao,
+        dados.particoes,
+    )
+    if anterior is None or armazenamento != (
+        anterior.data.file,
+        anterior.data.format,
+        anterior.data.modo,
+        anterior.data.limiteCompactacao,
+        anterior.data.particoes,
+    ):
+        repositorio.configurar(
+            dados.modo,
+            dados.limiteCompactacao,
+            dados.format,
+            dados.file,
+            dados.particoes,
+        )
+        repositorio.sincronizar()
+    if anterior is None or anterior.data.file != dados.file:
+        iniciarAlocadorDeIds(dados.proximoId, dados.blocoDeIds)
+    else:
+        alocadorDeIds.tamanhoBloco = dados.blocoDeIds
+
+
+ARQUIVO_CSV = "personagens.csv"
+CAMPOS_PERSONAGEM = list(Personagem.model_fields.keys())
+
+# A partir deste tamanho um lote de inserções ou atualizações reconstrói os
+# índices com uma ordenação em vez de tirar e pôr cada registro nas listas do
+# IndiceOrdenado, O(n) por registro. O ponto de virada medido ficou perto de
+# 2500 registros tanto com 20 mil quanto com 800 mil personagens (com 800
+# mil, 3,6 ms por registro contra 8,9 s para reconstruir tudo).
+LOTE_PARA_RECONSTRUIR_INDICES = 2000
+# Cópias do CSV mantidas para downloads: a atual e a anterior.
+COPIAS_PARA_DOWNLOAD = 2
+
+
+class OperacoesDoJournal(Enum):
+    INSERCAO = "I"
+    ATUALIZACAO = "U"
+    REMOCAO = "D"
+
+
+VALORES_DAS_OPERACOES = {operacao.value for operacao in OperacoesDoJournal}
+
+
+# Cada registro do journal começa pela soma (somaDoRegistro) do resto da
+# linha; os de versões anteriores, sem soma, começam pela operação. Devolve a
+# linha sem a soma, ou None se ela não confere (registro gravado pela metade).
+def conferirRegistroDoJournal(row: List[str]) -> Optional[List[str]]:
+    if row[0] in VALORES_DAS_OPERACOES:
+        return row
+    if len(row) > 1 and row[0] == somaDoRegistro(row[1:]):
+        return row[1:]
+    return None
+
+
+# Linha interna do repositório: uma tupla nomeada, bem mais leve que um
+# Personagem do pydantic. Carga, índices, filtros, contagens e ordenações
+# trabalham só com ela; apenas os personagens devolvidos viram Personagem.
+class RegistroPersonagem(NamedTuple):
+    id: int
+    nome: str
+    classe: str
+    hp: int
+    hpMax: int
+    mp: int
+    mpMax: int
+    status: str
+
+    @classmethod
+    def dePersonagem(cls, personagem: Personagem) -> "RegistroPersonagem":
+        return cls(*(getattr(personagem, campo) for campo in CAMPOS_PERSONAGEM))
+
+    def paraPersonagem(self) -> Personagem:
+        return Personagem(**self._asdict())
+
+
+def paraPersonagens(registros: Iterable[RegistroPersonagem]) -> List[Personagem]:
+    return [registro.paraPersonagem() for registro in registros]
+
+
+class Alteracao(NamedTuple):
+    operacao: OperacoesDoJournal
+    personagem: RegistroPersonagem
+    versao: int
+
+
+# Mantém os personagens do CSV em memória, indexados por id, para que leituras
+# e contagens não precisem varrer o arquivo. O arquivo é recarregado sempre que
+# sua assinatura (inode, tamanho e mtime) muda fora deste processo.
+#
+# No modo journal as alterações não reescrevem o CSV: cada uma é anexada como
+# um registro de atualização ou de remoção no arquivo "<csv>.journal", e uma
+# thread de compactação incorpora o journal ao CSV quando ele cresce demais.
+#
+# As alterações são aplicadas na memória sob a trava e enfileiradas para um
+# único escritor, que grava os lotes em disco; a requisição só retorna depois
+# que o lote dela foi gravado. As listagens leem de um instantâneo imutável
+# (uma tupla) que só é refeito quando a versão dos dados muda.
+#
+# O arquivo base é lido e gravado por um formato plugável (data.format): CSV,
+# colunar binário ou registros de tamanho fixo. Nos formatos binários o CSV
+# vira só importação (quando o arquivo binário ainda não existe) e exportação
+# (hash, download, zip); no colunar as listagens filtram e ordenam sobre uma
+# TabelaColunar.
+class RepositorioPersonagens:
+    def __init__(self, caminhoArquivo: str):
+        self.caminhoArquivo = caminhoArquivo
+        self.caminhoJournal = caminhoArquivo + ".journal"
+        self.formato = FormatoCSV(caminhoArquivo, CAMPOS_PERSONAGEM)
+        self.disposicao = (FormatosDeArquivo.CSV, 1)
+        self.versaoExportada = -1
+        # (chave do CSV copiado, caminho da cópia), da mais nova à mais antiga.
+        self.copiasParaDownload: List[Tuple[Tuple, str]] = []
+        self.copiasCriadas = 0
+        self.cacheTabelaColunar: Tuple[int, Tuple, Optional[TabelaColunar]] = (
+            -1,
+            (),
+            None,
+        )
+        self.modo = ModosDeArmazenamento.DIRETO
+        self.limiteCompactacao = 1000
+        self.personagens: Dict[int, RegistroPersonagem] = {}
+        self.indices = IndicesPersonagem()
+        self.registrosNoJournal = 0
+        self.assinaturaArquivo = None
+        self.carregado = False
+        self.versao = 0
+        self.versaoPersistida = 0
+        self.cacheInstantaneo: Tuple[int, Tuple[RegistroPersonagem, ...]] = (-1, ())
+        self.cacheEstatisticas: Tuple[int, Dict[Tuple, Dict]] = (-1, {})
+        self.escritasPendentes = 0
+        self.trava = threading.RLock()
+        self.travaDeArquivos = threading.Lock()
+        self.travaDeCompactacao = threading.Lock()
+        self.escritor = EscritorSerializado(self.persistirLote)
+        self.pedidoDeCompactacao = threading.Event()
+        self.compactador = None
+
+    def configurar(
+        self,
+        modo: ModosDeArmazenamento,
+        limiteCompactacao: int,
+        formato: FormatosDeArquivo = FormatosDeArquivo.CSV,
+        caminhoArquivo: Optional[str] = None,
+        particoes: int = 1,
+    ):
+        # Trocar de arquivo ou de formato espera a compactação e o escritor.
+        with self.travaDeCompactacao, self.travaDeArquivos, self.trava:
+            # Com o mesmo arquivo e outro formato ou outra quantidade de
+            # partições, os dados atuais vão para o formato novo antes da
+            # troca: o arquivo dele (o CSV exportado por consolidar, por
+            # exemplo) pode estar atrasado e seria carregado no lugar dos
+            # dados mais recentes. Um caminho novo é outro conjunto de dados
+            # e é só carregado.
+            migrar = (
+                self.carregado
+                and caminhoArquivo in (None, self.caminhoArquivo)
+                and (formato, particoes) != self.disposicao
+            )
+            if caminhoArquivo is not None:
+                self.caminhoArquivo = caminhoArquivo
+                self.caminhoJournal = caminhoArquivo + ".journal"
+            novoFormato = criarFormato(
+                formato, self.caminhoArquivo, CAMPOS_PERSONAGEM, particoes
+            )
+            if migrar:
+                self.sincronizar()
+                # Gravado antes da troca: se o formato novo recusar algum
+                # personagem, a configuração anterior continua valendo.
+                personagens = self.instantaneo()
+                novoFormato.reescrever(personagens)
+                registrarGravacao("reescrita", novoFormato.tamanho())
+            self.modo = modo
+            self.limiteCompactacao = limiteCompactacao
+            self.formato = novoFormato
+            self.disposicao = (formato, particoes)
+            if migrar:
+                # O journal e os lotes ainda na fila do escritor já estão no
+                # instantâneo gravado.
+                if os.path.exists(self.caminhoJournal):
+                    os.remove(self.caminhoJournal)
+                    sincronizador.diretorio(self.caminhoJournal)
+                    self.registrosNoJournal = 0
+                self.versaoPersistida = self.versao
+                logging.info(
+                    f"{len(personagens)} personagens migrados para o formato"
+                    f" {formato.value} com {particoes} partição(ões)"
+                )
+            self.versaoExportada = -1
+            self.carregado = False
+        if modo == ModosDeArmazenamento.JOURNAL and self.compactador is None:
+            self.compactador = threading.Thread(
+                target=self.executarCompactador,
+                name="compactador-journal",
+                daemon=True,
+            )
+            self.compactador.start()
+
+    def assinaturaAtual(self):
+        return (
+            self.formato.assinatura(),
+            assinaturaDoArquivo(self.caminhoJournal),
+        )
+
+    # Enquanto houver alterações na fila o arquivo está atrás da memória, então
+    # uma assinatura diferente nesse intervalo não dispara recarga.
+    def sincronizar(self):
+        if self.carregado and self.assinaturaAtual() == self.assinaturaArquivo:
+            return
+        with self.trava:
+            if self.escritasPendentes:
+                return
+            assinatura = self.assinaturaAtual()
+            if self.carregado and assinatura == self.assinaturaArquivo:
+                return
+            self.carregar(assinatura)
+
+    @medirOperacao("carregar")
+    def carregar(self, assinatura):
+        assinaturaBase, assinaturaJournal = assinatura
+        fonte = self.formato
+        importarCSV = (
+            assinaturaBase is None
+            and self.formato.caminho != self.caminhoArquivo
+            and os.path.exists(self.caminhoArquivo)
+        )
+        if importarCSV:
+            fonte = FormatoCSV(self.caminhoArquivo, CAMPOS_PERSONAGEM)
+        alterado = False
+        if assinaturaBase is not None or importarCSV:
+            alterado = fonte.recuperar()
+        personagens = {}
+        if assinaturaBase is not None or importarCSV:
+            for valores in fonte.carregarTuplas():
+                registro = RegistroPersonagem._make(valores)
+                if importarCSV:
+                    # Recusa o CSV antes de a memória mudar, em vez de falhar
+                    # só na reescrita para o formato novo.
+                    try:
+                        self.formato.validar(registro)
+                    except ValueError as e:
+                        raise ValueError(
+                            f"Personagem {registro.id} de {self.caminhoArquivo} não"
+                            f" pode ser importado: {e}"
+                        ) from e
+                personagens[registro.id] = registro
+        self.registrosNoJournal = 0
+        if assinaturaJournal is not None:
+            self.registrosNoJournal, cortado = self.reaplicarJournal(personagens)
+            alterado = alterado or cortado
+        bytesLidos = 0
+        if assinaturaBase is not None or importarCSV:
+            bytesLidos += fonte.tamanho()
+        if assinaturaJournal is not None:
+            bytesLidos += os.path.getsize(self.caminhoJournal)
+        registrarLeitura("carga", bytesLidos)
+        registrarVarredura("carga", len(personagens) + self.registrosNoJournal)
+        self.personagens = personagens
+        self.indices.reconstruir(personagens.values())
+        self.versao += 1
+        self.versaoPersistida = self.versao
+        # A recuperação pode ter mudado os arquivos depois da assinatura lida.
+        self.assinaturaArquivo = self.assinaturaAtual() if alterado else assinatura
+        self.carregado = True
+        logging.info(
+            f"{len(personagens)} personagens carregados de {fonte.caminho}"
+            f" ({self.registrosNoJournal} registros no journal)"
+        )
+        if (
+            importarCSV
+            or self.formato.precisaReescrever
+            or (self.registrosNoJournal and self.modo == ModosDeArmazenamento.DIRETO)
+        ):
+            self.reescreverArquivo(self.instantaneo())
+            self.assinaturaArquivo = self.assinaturaAtual()
+
+    # Reaplicar o journal inteiro é idempotente: o CSV sempre reflete um prefixo
+    # dos registros, então uma compactação interrompida não corrompe os dados.
+    # Registros que não conferem com a soma deles e vão até o fim do arquivo
+    # só podem ser um anexo interrompido por uma queda: o journal é cortado no
+    # início deles. Se um registro íntegro vem depois, o que não conferia é só
+    # ignorado. Devolve quantos registros foram reaplicados e se o journal foi
+    # cortado.
+    def reaplicarJournal(
+        self, personagens: Dict[int, RegistroPersonagem]
+    ) -> Tuple[int, bool]:
+        registros = 0
+        decodificador = compilarDecodificador(
+            ["operacao", *CAMPOS_PERSONAGEM], CAMPOS_PERSONAGEM
+        )
+        with open(self.caminhoJournal, mode="r", newline="") as file:
+            codificacao = file.encoding
+            texto = file.read()
+        conteudo = io.StringIO(texto)
+        fimDoUltimoIntegro = 0
+        corte = None
+        for row in csv.reader(iter(conteudo.readline, "")):
+            if row:
+                conferido = conferirRegistroDoJournal(row)
+                if conferido is None:
+                    if corte is None:
+                        corte = fimDoUltimoIntegro
+                    continue
+                if corte is not None:
+                    logging.warning(
+                        f"Registros que não conferem com a soma ignorados no"
+                        f" journal antes de {row}"
+                    )
+                    corte = None
+                row = conferido
+            fimDoUltimoIntegro = conteudo.tell()
+            try:
+                operacao = OperacoesDoJournal(row[0])
+                if operacao == OperacoesDoJournal.REMOCAO:
+                    personagens.pop(int(row[1]), None)
+                else:
+                    registro = RegistroPersonagem._make(decodificador(row))
+                    personagens[registro.id] = registro
+            except (ValueError, IndexError, KeyError) as e:
+                logging.warning(f"Registro inválido ignorado no journal: {row} ({e})")
+                continue
+            registros += 1
+        if corte is not None:
+            tamanho = len(texto[:corte].encode(codificacao))
+            descartados = os.path.getsize(self.caminhoJournal) - tamanho
+            os.truncate(self.caminhoJournal, tamanho)
+            logging.warning(
+                f"{self.caminhoJournal}: {descartados} bytes de um registro gravado"
+                " pela metade descartados"
+            )
+        return registros, corte is not None
+
+    def instantaneo(self) -> Tuple[RegistroPersonagem, ...]:
+        versao, personagens = self.cacheInstantaneo
+        if versao == self.versao:
+            return personagens
+        with self.trava:
+            personagens = tuple(self.personagens.values())
+            self.cacheInstantaneo = (self.versao, personagens)
+            return personagens
+
+    def buscar(self, idPersonagem: int) -> Optional[Personagem]:
+        self.sincronizar()
+        registro = self.personagens.get(idPersonagem)
+        return registro.paraPersonagem() if registro is not None else None
+
+    def listar(self) -> List[Personagem]:
+        self.sincronizar()
+        registros = self.instantaneo()
+        registrarVarredura("listar", len(registros))
+        return paraPersonagens(registros)
+
+    def contar(self) -> int:
+        self.sincronizar()
+        return len(self.personagens)
+
+    # Sobe a cada alteração e a cada carga do arquivo, inclusive quando outro
+    # processo o modificou, então identifica o estado dos dados lidos.
+    def versaoAtual(self) -> int:
+        self.sincronizar()
+        return self.versao
+
+    def maiorId(self) -> int:
+        self.sincronizar()
+        return max((personagem.id for personagem in self.instantaneo()), default=0)
+
+    def buscarPorTexto(
+        self, consulta: str, modo: ModosDeBusca, limite: int
+    ) -> List[Personagem]:
+        self.sincronizar()
+        with self.trava:
+            if not self.indices.texto.construido:
+                self.indices.texto.reconstruir(self.personagens.values())
+            ids, verificados = self.indices.texto.buscar(consulta, modo, limite)
+            registros = [self.personagens[idPersonagem] for idPersonagem in ids]
+        registrarVarredura("busca", verificados)
+        return paraPersonagens(registros)
+
+    def consultar(self, filtros: Dict[str, int | str]) -> List[RegistroPersonagem]:
+        return list(self.iterarConsulta(filtros))
+
+    # Os candidatos (e filtros inválidos) são resolvidos já na chamada, sob a
+    # trava, mas os filtros restantes são aplicados preguiçosamente enquanto o
+    # chamador consome o gerador devolvido.
+    def iterarConsulta(
+        self, filtros: Dict[str, int | str]
+    ) -> Iterator[RegistroPersonagem]:
+        self.sincronizar()
+        with self.trava:
+            filtros = dict(filtros)
+            if "id" in filtros:
+                idPersonagem = filtros.pop("id")
+                ids = {idPersonagem} if idPersonagem in self.personagens else set()
+                indexados, restantes = self.indices.planejar(filtros)
+                if indexados is not None:
+                    ids &= indexados
+            else:
+                ids, restantes = self.indices.planejar(filtros)
+            if ids is None:
+                personagens = self.instantaneo()
+            else:
+                personagens = [
+                    self.personagens[idPersonagem] for idPersonagem in sorted(ids)
+                ]
+        registrarVarredura("consulta", len(personagens))
+        return (
+            personagem
+            for personagem in personagens
+            if all(
+                atendeFiltro(personagem, campo, operador, valor)
+                for campo, operador, valor in restantes
+            )
+        )
+
+    def inserir(self, personagem: Personagem) -> Personagem:
+        return self.inserirVarios([personagem])[0]
+
+    def inserirVarios(self, personagens: List[Personagem]) -> List[Personagem]:
+        for personagem in personagens:
+            self.formato.validar(personagem)
+        with self.trava:
+            self.sincronizar()
+            reconstruirIndices = len(personagens) >= LOTE_PARA_RECONSTRUIR_INDICES
+            alteracoes = []
+            for personagem in personagens:
+                registro = RegistroPersonagem.dePersonagem(personagem)
+                registroAnterior = self.personagens.get(registro.id)
+                if not reconstruirIndices:
+                    if registroAnterior is not None:
+                        self.indices.remover(registroAnterior)
+                    self.indices.adicionar(registro)
+                self.personagens[registro.id] = registro
+                alteracoes.append(
+                    self.registrarAlteracao(OperacoesDoJournal.INSERCAO, registro)
+                )
+            if reconstruirIndices:
+                self.indices.reconstruir(self.personagens.values())
+            pendente = self.escritor.enviar(alteracoes)
+        pendente.result()
+        return personagens
+
+    def atualizar(
+        self, idPersonagem: int, personagem: Personagem
+    ) -> Optional[Personagem]:
+        self.formato.validar(personagem)
+        with self.trava:
+            self.sincronizar()
+            if idPersonagem not in self.personagens:
+                return None
+            personagem.id = idPersonagem
+            registro = RegistroPersonagem.dePersonagem(personagem)
+            self.indices.substituir(self.personagens[idPersonagem], registro)
+            self.personagens[idPersonagem] = registro
+            pendente = self.escritor.enviar(
+                [self.registrarAlteracao(OperacoesDoJournal.ATUALIZACAO, registro)]
+            )
+        pendente.result()
+        return personagem
+
+    # Atualiza os personagens cujo id existe e devolve também os ids que não
+    # foram encontrados.
+    def atualizarVarios(
+        self, personagens: List[Personagem]
+    ) -> Tuple[List[Personagem], List[int]]:
+        for personagem in personagens:
+            self.formato.validar(personagem)
+        atualizados = []
+        naoEncontrados = []
+        with self.trava:
+            self.sincronizar()
+            reconstruirIndices = len(personagens) >= LOTE_PARA_RECONSTRUIR_INDICES
+            alteracoes = []
+            for personagem in personagens:
+                registroAnterior = self.personagens.get(personagem.id)
+                if registroAnterior is None:
+                    naoEncontrados.append(personagem.id)
+                    continue
+                registro = RegistroPersonagem.dePersonagem(personagem)
+                if not reconstruirIndices:
+                    self.indices.substituir(registroAnterior, registro)
+                self.personagens[registro.id] = registro
+                atualizados.append(personagem)
+                alteracoes.append(
+                    self.registrarAlteracao(OperacoesDoJournal.ATUALIZACAO, registro)
+                )
+            if not alteracoes:
+                return atualizados, naoEncontrados
+            if reconstruirIndices:
+                self.indices.reconstruir(self.personagens.values())
+            pendente = self.escritor.enviar(alteracoes)
+        pendente.result()
+        return atualizados, naoEncontrados
+
+    def remover(self, idPersonagem: int) -> Optional[Personagem]:
+        with self.trava:
+            self.sincronizar()
+            registroRemovido = self.personagens.pop(idPersonagem, None)
+            if registroRemovido is None:
+                return None
+            self.indices.remover(registroRemovido)
+            pendente = self.escritor.enviar(
+                [self.registrarAlteracao(OperacoesDoJournal.REMOCAO, registroRemovido)]
+            )
+        pendente.result()
+        return registroRemovido.paraPersonagem()
+
+    def registrarAlteracao(
+        self, operacao: OperacoesDoJournal, registro: RegistroPersonagem
+    ) -> Alteracao:
+        self.versao += 1
+        self.escritasPendentes += 1
+        return Alteracao(operacao, registro, self.versao)
+
+    def instantaneoComTrava(self) -> Tuple[RegistroPersonagem, ...]:
+        with self.trava:
+            return self.instantaneo()
+
+    # Executado apenas pela thread do escritor. No modo direto os formatos
+    # particionados só gravam as partições dos ids do lote, os de registros
+    # fixos gravam cada alteração no lugar, um lote só de inserções é anexado
+    # ao CSV e qualquer outro lote reescreve o arquivo uma única vez a partir
+    # do instantâneo atual, que já contém todas as alterações do lote (e
+    # possivelmente de lotes seguintes, que são então descartados por já
+    # estarem gravados).
+    @medirOperacao("persistirLote")
+    def persistirLote(self, lote: List[Alteracao]):
+        try:
+            with self.travaDeArquivos:
+                alteracoes = [
+                    alteracao
+                    for alteracao in lote
+                    if alteracao.versao > self.versaoPersistida
+                ]
+                if not alteracoes:
+                    # Já gravadas pela reescrita de um lote anterior.
+                    with self.trava:
+                        self.escritasPendentes -= len(lote)
+                    return
+                if self.modo == ModosDeArmazenamento.JOURNAL:
+                    self.registrarNoJournal(alteracoes)
+                    self.versaoPersistida = alteracoes[-1].versao
+                elif (
+                    self.formato.particionado
+                    and self.assinaturaArquivo[0] is not None
+                ):
+                    quantidadeDeBytes = self.formato.gravarAlteracoes(
+                        [
+                            (alteracao.operacao.value, alteracao.personagem)
+                            for alteracao in alteracoes
+                        ],
+                        self.instantaneoComTrava,
+                    )
+                    registrarGravacao("particoes", quantidadeDeBytes)
+                    self.versaoPersistida = alteracoes[-1].versao
+                elif (
+                    self.formato.alteraNoLugar
+                    and self.assinaturaArquivo[0] is not None
+                ):
+                    quantidadeDeBytes = self.formato.aplicar(
+                        (alteracao.operacao.value, alteracao.personagem)
+                        for alteracao in alteracoes
+                    )
+                    registrarGravacao("noLugar", quantidadeDeBytes)
+                    self.versaoPersistida = alteracoes[-1].versao
+                elif (
+                    self.formato.permiteAnexar
+                    and self.assinaturaArquivo[0] is not None
+                    and all(
+                        alteracao.operacao == OperacoesDoJournal.INSERCAO
+                        for alteracao in alteracoes
+                    )
+                ):
+                    tamanhoAnterior = self.formato.tamanho()
+                    self.formato.anexar(
+                        [alteracao.personagem for alteracao in alteracoes]
+                    )
+                    registrarGravacao("anexo", self.formato.tamanho() - tamanhoAnterior)
+                    self.versaoPersistida = alteracoes[-1].versao
+                else:
+                    with self.trava:
+                        versao = self.versao
+                        personagens = self.instantaneo()
+                    self.reescreverArquivo(personagens)
+                    self.versaoPersistida = versao
+                with self.trava:
+                    self.assinaturaArquivo = self.assinaturaAtual()
+                    self.escritasPendentes -= len(lote)
+        except Exception:
+            # A memória ficou à frente do disco: força recarregar do arquivo.
+            with self.trava:
+                self.escritasPendentes -= len(lote)
+                self.carregado = False
+            raise
+
+    def registrarNoJournal(self, alteracoes: List[Alteracao]):
+        with open(self.caminhoJournal, mode="a", newline="") as file:
+            tamanhoAnterior = os.fstat(file.fileno()).st_size
+            writer = csv.writer(file)
+            for operacao, registro, _ in alteracoes:
+                if operacao == OperacoesDoJournal.REMOCAO:
+                    campos = [operacao.value, str(registro.id)]
+                else:
+                    campos = [operacao.value, *map(str, registro)]
+                writer.writerow([somaDoRegistro(campos), *campos])
+            sincronizador.arquivo(file)
+            registrarGravacao("journal", os.fstat(file.fileno()).st_size - tamanhoAnterior)
+        self.registrosNoJournal += len(alteracoes)
+        if self.registrosNoJournal >= self.limiteCompactacao:
+            self.pedidoDeCompactacao.set()
+
+    def reescreverArquivo(self, personagens: Iterable[RegistroPersonagem]):
+        self.formato.reescrever(personagens)
+        registrarGravacao("reescrita", self.formato.tamanho())
+        if os.path.exists(self.caminhoJournal):
+            os.remove(self.caminhoJournal)
+            sincronizador.diretorio(self.caminhoJournal)
+            self.registrosNoJournal = 0
+
+    # Garante que o CSV em disco reflita todos os dados, incorporando o journal
+    # pendente, antes de ele ser exportado (hash, download, zip). Nos formatos
+    # que não são CSV o arquivo é exportado de novo sempre que a versão muda.
+    def consolidar(self) -> str:
+        self.sincronizar()
+        if self.registrosNoJournal:
+            self.compactar()
+        if self.formato.caminho != self.caminhoArquivo:
+            with self.trava:
+                versao = self.versao
+                personagens = self.instantaneo()
+            if versao != self.versaoExportada:
+                with self.travaDeArquivos:
+                    FormatoCSV(self.caminhoArquivo, CAMPOS_PERSONAGEM).reescrever(
+                        personagens
+                    )
+                    registrarGravacao(
+                        "exportacao", os.path.getsize(self.caminhoArquivo)
+                    )
+                    self.versaoExportada = versao
+        return self.caminhoArquivo
+
+    # Cópia do CSV consolidado que nunca é alterada, para um download servir
+    # pelo caminho os mesmos bytes do ETag calculado sobre ela, mesmo que um
+    # anexo ou uma reescrita mude o CSV durante a resposta. A cópia é feita sob
+    # a trava de arquivos, que o escritor segura ao gravar, e reaproveitada
+    # enquanto o CSV não muda. Um link não serviria: anexos e escritas no lugar
+    # alteram o próprio arquivo. A cópia anterior fica para os downloads que
+    # ainda não a abriram; as mais antigas são removidas. Devolve o caminho do
+    # CSV e o da cópia.
+    def copiaParaDownload(self) -> Tuple[str, str]:
+        caminho = self.consolidar()
+        with self.travaDeArquivos:
+            estado = os.stat(caminho)
+            chave = (estado.st_ino, estado.st_size, estado.st_mtime_ns)
+            if self.copiasParaDownload:
+                chaveDaCopia, copia = self.copiasParaDownload[0]
+                if chaveDaCopia == chave and os.path.exists(copia):
+                    return caminho, copia
+            self.copiasCriadas += 1
+            copia = f"{caminho}.{os.getpid()}-{self.copiasCriadas}.download"
+            shutil.copyfile(caminho, copia)
+            registrarGravacao("download", estado.st_size)
+            self.copiasParaDownload.insert(0, (chave, copia))
+            antigas = self.copiasParaDownload[COPIAS_PARA_DOWNLOAD:]
+            del self.copiasParaDownload[COPIAS_PARA_DOWNLOAD:]
+        for _, antiga in antigas:
+            try:
+                os.remove(antiga)
+            except OSError:
+                # No Windows a cópia pode estar aberta por um download.
+                pass
+        return caminho, copia
+
+    def tabelaColunar(self) -> Tuple[Tuple[RegistroPersonagem, ...], TabelaColunar]:
+        versao, personagens, tabela = self.cacheTabelaColunar
+        if versao != self.versao or tabela is None:
+            with self.trava:
+                versao = self.versao
+                personagens = self.instantaneo()
+            tabela = TabelaColunar(personagens)
+            self.cacheTabelaColunar = (versao, personagens, tabela)
+        return personagens, tabela
 
+    # As estatísticas ficam guardadas por combinação de agrupamento e
+    # percentis até a próxima alteração, que muda a versão e descarta todas.
+    def estatisticas(
+        self, agrupamento: Tuple[str, ...], percentis: Tuple[float, ...]
+    ) -> Dict:
+        self.sincronizar()
+        with self.trava:
+            versao, resultados = self.cacheEstatisticas
+            if versao != self.versao:
+                resultados = {}
+                self.cacheEstatisticas = (self.versao, resultados)
+            registros = self.instantaneo()
+        chave = (agrupamento, percentis)
+        resultado = resultados.get(chave)
+        if resultado is None:
+            registrarVarredura("estatisticas", len(registros))
+            resultado = calcularEstatisticas(registros, agrupamento, percentis)
+            if len(resultados) >= 64:
+                resultados.clear()
+            resultados[chave] = resultado
+        return resultado
 
-# TODO: Implementar médotos auxiliares para manipulação do CSV
+    def consultarColunar(
+        self, filtros: Dict[str, int | str], ordenacao: str, descendente: bool
+    ) -> List[RegistroPersonagem]:
+        self.sincronizar()
+        personagens, tabela = self.tabelaColunar()
+        registrarVarredura("consultaColunar", tabela.tamanho)
+        posicoes = tabela.selecionar(filtros)
+        posicoes = tabela.ordenar(posicoes, ordenacao, descendente)
+        return [personagens[posicao] for posicao in posicoes]
+
+    def executarCompactador(self):
+        while True:
+            self.pedidoDeCompactacao.wait()
+            self.pedidoDeCompactacao.clear()
+            try:
+                self.compactar()
+            except Exception as e:
+                logging.error(f"Erro ao compactar o journal: {str(e)}")
+
+    # O CSV novo é escrito sem bloquear leitores nem o escritor, a partir do
+    # instantâneo; só a troca dos arquivos segura a trava de arquivos. Registros
+    # anexados ao journal durante a escrita são preservados no journal
+    # compactado, e reaplicá-los sobre o CSV novo é inofensivo. A compactação
+    # de fundo e a de consolidar() nunca rodam ao mesmo tempo.
+    @medirOperacao("compactar")
+    def compactar(self):
+        with self.travaDeCompactacao:
+            with self.travaDeArquivos:
+                if self.registrosNoJournal == 0:
+                    return
+                registrosCompactados = self.registrosNoJournal
+                posicaoNoJournal = os.path.getsize(self.caminhoJournal)
+            with self.trava:
+                personagens = self.instantaneo()
+
+            caminhoTemporario = self.formato.caminho + ".compactacao"
+            self.formato.escrever(caminhoTemporario, personagens)
+            registrarGravacao("compactacao", self.formato.tamanho(caminhoTemporario))
+
+            # A troca dos arquivos acontece sob as duas travas para que uma recarga
+            # nunca leia o arquivo antigo sem o journal que o completava.
+            with self.travaDeArquivos, self.trava:
+                with open(self.caminhoJournal, mode="r", newline="") as file:
+                    file.seek(posicaoNoJournal)
+                    registrosRestantes = file.read()
+                self.formato.substituir(caminhoTemporario)
+                if registrosRestantes:
+                    escreverComFsync(
+                        self.caminhoJournal + ".tmp",
+                        lambda file: file.write(registrosRestantes),
+                    )
+                    os.replace(self.caminhoJournal + ".tmp", self.caminhoJournal)
+                else:
+                    os.remove(self.caminhoJournal)
+                sincronizador.diretorio(self.caminhoJournal)
+                self.registrosNoJournal -= registrosCompactados
+                self.assinaturaArquivo = self.assinaturaAtual()
+            logging.info(
+                f"Journal compactado: {registrosCompactados} registros incorporados"
+                f" a {self.formato.caminho}"
+            )
+
+
+repositorio = RepositorioPersonagens(ARQUIVO_CSV)
+alocadorDeIds = AlocadorDeIds(ARQUIVO_CSV + ".proximoId")
+
+
+def iniciarAlocadorDeIds(proximoIdConfigurado: int = 1, tamanhoBloco: int = 100):
+    alocadorDeIds.caminhoMarca = repositorio.caminhoArquivo + ".proximoId"
+    alocadorDeIds.iniciar(
+        max(repositorio.maiorId() + 1, proximoIdConfigurado), tamanhoBloco
+    )
+
+
+def garantirAlocadorDeIdsIniciado():
+    if not alocadorDeIds.iniciado:
+        with repositorio.trava:
+            if not alocadorDeIds.iniciado:
+                dados = obterConfiguracao().data
+                iniciarAlocadorDeIds(dados.proximoId, dados.blocoDeIds)
+
+
+def alocarProximoId() -> int:
+    garantirAlocadorDeIdsIniciado()
+    return alocadorDeIds.alocar()
+
+
+def alocarIntervaloDeIds(quantidade: int) -> range:
+    garantirAlocadorDeIdsIniciado()
+    return alocadorDeIds.alocarIntervalo(quantidade)
+
+
+listaDePersonagens = TypeAdapter(List[Personagem])
+
+
+# As linhas do CSV em lote como dicionários de texto, validados depois pelo
+# pydantic de uma vez. Os campos que faltam numa linha vêm como None, para
+# que o pydantic aponte a linha incompleta.
+def lerLinhasCSVEmLote(conteudo: bytes) -> List[Dict]:
+    leitor = csv.reader(io.StringIO(conteudo.decode("utf-8"), newline=""))
+    cabecalho = next(leitor, [])
+    decodificador = compilarDecodificador(cabecalho, CAMPOS_PERSONAGEM, tipado=False)
+    linhas = list(map(decodificador, filter(None, leitor)))
+    # Um id vazio é um personagem novo.
+    for linha in linhas:
+        if "id" in linha and not linha["id"]:
+            del linha["id"]
+    return linhas
+
+
+def serializarPersonagens(personagens: List[Personagem]) -> bytes:
+    return listaDePersonagens.dump_json(personagens)
+
+
+# Lê um lote de personagens enviado como array JSON, NDJSON (um objeto por
+# linha) ou CSV com cabeçalho. Todo o lote é validado de uma vez pelo
+# TypeAdapter, que levanta ValidationError apontando a posição inválida.
+def lerPersonagensEmLote(conteudo: bytes, tipoDeConteudo: str) -> List[Personagem]:
+    tipoDeConteudo = tipoDeConteudo.split(";")[0].strip().lower()
+    if tipoDeConteudo in ("application/x-ndjson", "application/ndjson"):
+        linhas = [linha for linha in conteudo.splitlines() if linha.strip()]
+        return listaDePersonagens.validate_python([json.loads(l) for l in linhas])
+    if tipoDeConteudo == "text/csv":
+        return listaDePersonagens.validate_python(lerLinhasCSVEmLote(conteudo))
+    return listaDePersonagens.validate_json(conteudo)
+
+
+@medirOperacao("listar")
 def listarPersonagensDoCSV() -> List[Personagem]:
-    personagens = []
-    with open("personagens.csv", mode="r") as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            personagens.append(Personagem(**row))
-    return personagens
+    return repositorio.listar()
 
 
+@medirOperacao("ler")
 def lerPersonagemCSV(idPersonagem: int):
-    with open("personagens.csv", mode="r") as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            print(row)
-            if int(int(row["id"])) == idPersonagem:
-                return Personagem(**row)
-    return None
+    return repositorio.buscar(idPersonagem)
 
 
+@medirOperacao("inserir")
 def inserirPersonagemNoCSV(personagem: Personagem):
-    with open("personagens.csv", mode="a", newline="") as file:
-        writer = csv.DictWriter(file, fieldnames=personagem.model_dump().keys())
-        writer.writerow(personagem.model_dump())
-    return personagem
+    return repositorio.inserir(personagem)
 
 
+@medirOperacao("inserirEmLote")
+def inserirPersonagensNoCSV(personagens: List[Personagem]) -> List[Personagem]:
+    for personagem, idPersonagem in zip(
+        personagens, alocarIntervaloDeIds(len(personagens))
+    ):
+        personagem.id = idPersonagem
+    return repositorio.inserirVarios(personagens)
+
+
+@medirOperacao("atualizar")
 def atualizarPersonagemNoCSV(idPersonagem: int, personagem: Personagem):
-    linhas = []
-    with open("personagens.csv", mode="r") as file:
-        reader = csv.DictReader(file)
-        achouPersonagem = False
-        for row in reader:
-            if int(row["id"]) == idPersonagem:
-                row = personagem.model_dump()
-                achouPersonagem = True
-            linhas.append(row)
-        if not achouPersonagem:
-            return None
-
-    with open("personagens.csv", mode="w", newline="") as file:
-        writer = csv.DictWriter(file, fieldnames=personagem.model_dump().keys())
-        writer.writeheader()
-        writer.writerows(linhas)
-    return personagem
+    return repositorio.atualizar(idPersonagem, personagem)
+
+
+@medirOperacao("atualizarEmLote")
+def atualizarPersonagensNoCSV(
+    personagens: List[Personagem],
+) -> Tuple[List[Personagem], List[int]]:
+    if any(personagem.id is None for personagem in personagens):
+        raise ValueError("Todos os personagens da atualização em lote precisam de id")
+    return repositorio.atualizarVarios(personagens)
 
 
+@medirOperacao("remover")
 def deletarPersonagemDoCSV(idPersonagem: int):
-    linhas = []
-    personagemDeletado = None
-    with open("personagens.csv", mode="r") as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            if int(row["id"]) != idPersonagem:
-                linhas.append(row)
-            else:
-                personagemDeletado = Personagem(**row)
-    if len(linhas) == 0:
-        return None
-    with open("personagens.csv", mode="w", newline="") as file:
-        writer = csv.DictWriter(file, fieldnames=linhas[0].keys())
-        writer.writeheader()
-        writer.writerows(linhas)
-    return personagemDeletado
+    return repositorio.remover(idPersonagem)
 
 
-# TODO: Implementar métodos específicos para filtrar os dados de personagens
+@medirOperacao("listarComFiltros")
 def listarPersonagensDoCSVComFiltrosEOrdenacao(
     filtros: Dict[str, int | str] = {},
     ordenacao: str = "id",
     direcao: DirecoesDeOrdenacao = DirecoesDeOrdenacao.ASCENDENTE,
 ):
-    personagens = listarPersonagensDoCSV()
-    print(filtros)
-    for chave, valor in filtros.items():
-        personagens = [
-            personagem
-            for personagem in personagens
-            if getattr(personagem, chave) == valor
-        ]
-
-    personagens.sort(
-        key=lambda personagem: getattr(personagem, ordenacao),
+    validarCampoDeOrdenacao(ordenacao)
+    if repositorio.formato.colunar:
+        return paraPersonagens(
+            repositorio.consultarColunar(
+                filtros, ordenacao, direcao == DirecoesDeOrdenacao.DESCENTENDE
+            )
+        )
+    registros = repositorio.consultar(filtros)
+    registros.sort(
+        key=operator.attrgetter(ordenacao, "id"),
         reverse=direcao == DirecoesDeOrdenacao.DESCENTENDE,
     )
-    return personagens
+    return paraPersonagens(registros)
 
 
+def validarCampoDeOrdenacao(ordenacao: str):
+    if ordenacao not in CAMPOS_PERSONAGEM:
+        raise ValueError(f"Campo de ordenação inválido: {ordenacao}")
+
+
+PERSONAGENS_POR_PEDACO = 500
+
+
+# Inverte a comparação das chaves para o heap devolver a ordem decrescente.
+class ChaveInvertida:
+    __slots__ = ("chave",)
+
+    def __init__(self, chave):
+        self.chave = chave
+
+    def __lt__(self, outra: "ChaveInvertida") -> bool:
+        return outra.chave < self.chave
+
+
+# Monta o heap em tempo linear e devolve um registro por vez, então o primeiro
+# sai sem ordenar o resultado inteiro.
+def iterarEmOrdem(
+    registros: Iterable[RegistroPersonagem], ordenacao: str, descendente: bool
+) -> Iterator[RegistroPersonagem]:
+    chave = operator.attrgetter(ordenacao, "id")
+    if descendente:
+        fila = [(ChaveInvertida(chave(registro)), registro) for registro in registros]
+    else:
+        fila = [(chave(registro), registro) for registro in registros]
+    heapq.heapify(fila)
+    while fila:
+        yield heapq.heappop(fila)[1]
+
+
+def gerarPedacosNDJSON(registros: Iterable[RegistroPersonagem]) -> Iterator[bytes]:
+    pedaco = []
+    for registro in registros:
+        pedaco.append(registro.paraPersonagem().model_dump_json())
+        if len(pedaco) == PERSONAGENS_POR_PEDACO:
+            yield ("\n".join(pedaco) + "\n").encode()
+            pedaco = []
+    if pedaco:
+        yield ("\n".join(pedaco) + "\n").encode()
+
+
+# Listagem transmitida (formato=ndjson sem limit): os personagens saem do
+# gerador da consulta à medida que passam nos filtros, em pedaços de linhas
+# NDJSON. Sem ordenação pedida a ordem é a do armazenamento; com ela só o heap
+# fica em memória. Filtros e campo de ordenação inválidos levantam ValueError
+# aqui, antes de a resposta começar.
+def transmitirPersonagensEmNDJSON(
+    filtros: Dict[str, int | str],
+    ordenacao: Optional[str] = None,
+    direcao: DirecoesDeOrdenacao = DirecoesDeOrdenacao.ASCENDENTE,
+) -> Iterator[bytes]:
+    if ordenacao is not None:
+        validarCampoDeOrdenacao(ordenacao)
+    registros = repositorio.iterarConsulta(filtros)
+    if ordenacao is not None:
+        registros = iterarEmOrdem(
+            registros, ordenacao, direcao == DirecoesDeOrdenacao.DESCENTENDE
+        )
+    return gerarPedacosNDJSON(registros)
+
+
+# O cursor guarda a chave (valor do campo de ordenação, id) do último personagem
+# da página anterior; a próxima página continua estritamente depois dela.
+def codificarCursor(valor, idPersonagem: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([valor, idPersonagem]).encode()).decode()
+
+
+def decodificarCursor(cursor: str, ordenacao: str) -> Tuple:
+    try:
+        valor, idPersonagem = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError(f"Cursor inválido: {cursor}")
+    tipo = int if ordenacao in COLUNAS_INTEIRAS else str
+    if type(valor) is not tipo or type(idPersonagem) is not int:
+        raise ValueError(
+            f"Cursor inválido para a ordenação por {ordenacao}: {cursor}"
+        )
+    return (valor, idPersonagem)
+
+
+# Paginação por chave: os personagens passam por um gerador e só os limite + 1
+# primeiros da ordenação ficam em memória, num heap, independente do tamanho
+# do resultado filtrado.
+@medirOperacao("listarPagina")
+def listarPaginaDePersonagens(
+    filtros: Dict[str, int | str] = {},
+    ordenacao: str = "id",
+    direcao: DirecoesDeOrdenacao = DirecoesDeOrdenacao.ASCENDENTE,
+    limite: int = 100,
+    cursor: Optional[str] = None,
+) -> Tuple[List[Personagem], Optional[str]]:
+    validarCampoDeOrdenacao(ordenacao)
+    if limite <= 0:
+        raise ValueError(f"Limite inválido: {limite}")
+
+    chave = operator.attrgetter(ordenacao, "id")
+    descendente = direcao == DirecoesDeOrdenacao.DESCENTENDE
+    registros = repositorio.iterarConsulta(filtros)
+    if cursor is not None:
+        posicao = decodificarCursor(cursor, ordenacao)
+        if descendente:
+            registros = (r for r in registros if chave(r) < posicao)
+        else:
+            registros = (r for r in registros if chave(r) > posicao)
+
+    selecionar = heapq.nlargest if descendente else heapq.nsmallest
+    pagina = selecionar(limite + 1, registros, key=chave)
+    proximoCursor = None
+    if len(pagina) > limite:
+        pagina = pagina[:limite]
+        proximoCursor = codificarCursor(*chave(pagina[-1]))
+    return paraPersonagens(pagina), proximoCursor
+
+
+@medirOperacao("contar")
 def contarPersonagensDoCSV() -> int:
-    return len(listarPersonagensDoCSV())
+    return repositorio.contar()
+
+
+def versaoDosDados() -> int:
+    return repositorio.versaoAtual()
+
+
+@medirOperacao("estatisticas")
+def calcularEstatisticasDosPersonagens(
+    agruparPor: Optional[str] = None, percentis: Optional[str] = None
+) -> Dict:
+    return repositorio.estatisticas(
+        interpretarAgrupamento(agruparPor), interpretarPercentis(percentis)
+    )
+
+
+@medirOperacao("buscar")
+def buscarPersonagensPorNome(
+    consulta: str, modo: ModosDeBusca, limite: int
+) -> List[Personagem]:
+    if not 0 < limite <= LIMITE_MAXIMO_DA_BUSCA:
+        raise ValueError(
+            f"Limite inválido: {limite}, use um valor entre 1 e {LIMITE_MAXIMO_DA_BUSCA}"
+        )
+    if not consulta.strip():
+        raise ValueError("A busca precisa de um texto")
+    return repositorio.buscarPorTexto(consulta, modo, limite)
 
 
-def obterProximoId(config_file: str) -> str:
-    config = carregarYaml(config_file)
-    proximo_id = config["data"]["proximoId"]
-    return proximo_id
+@medirOperacao("consolidar")
+def caminhoCSVConsolidado() -> str:
+    return repositorio.consolidar()
 
 
-def incrementarProximoId(config_file: str):
-    config = carregarYaml(config_file)
-    config["data"]["proximoId"] += 1
-    salvarYaml(config_file, config)
+def copiaDoCSVParaDownload() -> Tuple[str, str]:
+    return repositorio.copiaParaDownload()
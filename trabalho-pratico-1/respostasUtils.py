@@ -0,0 +1,93 @@
+import secrets
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from metricasUtils import Contador, registro
+
+LIMITE_DE_RESPOSTAS = 256
+LIMITE_DE_BYTES_DAS_RESPOSTAS = 32 * 1024 * 1024
+
+# Muda a cada processo: a versão dos dados recomeça do zero quando o servidor
+# sobe de novo (ou em outro worker), e um ETag antigo não pode coincidir com
+# o de dados diferentes.
+INSTANCIA = secrets.token_hex(4)
+
+usosDoCache = registro.registrar(
+    Contador(
+        "personagens_cache_respostas_total",
+        "Respostas de leitura servidas do cache, geradas de novo ou respondidas "
+        "com 304",
+    )
+)
+
+
+# O ETag de uma resposta vale para um recurso (caminho e consulta, a mesma
+# chave do cacheDeRespostas) numa versão dos dados: o ETag de um personagem
+# nunca confere com o de outro nem com o de uma listagem.
+def etagDoRecurso(versao: int, chave: Tuple) -> str:
+    recurso = zlib.crc32(repr(chave).encode())
+    return f'"{INSTANCIA}-{versao}-{recurso:08x}"'
+
+
+# Corpos já serializados (com os cabeçalhos que os acompanham) de uma única
+# versão dos dados, por (endpoint, consulta). Quando a versão avança nenhuma
+# entrada anterior pode voltar a ser servida, então todas são descartadas; na
+# mesma versão as menos usadas saem primeiro quando passa do limite de
+# entradas ou de bytes.
+class CacheDeRespostas:
+    def __init__(
+        self,
+        limiteDeEntradas: int = LIMITE_DE_RESPOSTAS,
+        limiteDeBytes: int = LIMITE_DE_BYTES_DAS_RESPOSTAS,
+    ):
+        self.limiteDeEntradas = limiteDeEntradas
+        self.limiteDeBytes = limiteDeBytes
+        self.versao = -1
+        self.entradas: OrderedDict[Tuple, Tuple[bytes, Dict[str, str]]] = OrderedDict()
+        self.bytes = 0
+        self.trava = threading.Lock()
+
+    def obter(
+        self, versao: int, chave: Tuple
+    ) -> Optional[Tuple[bytes, Dict[str, str]]]:
+        with self.trava:
+            resposta = self.entradas.get(chave) if versao == self.versao else None
+            if resposta is not None:
+                self.entradas.move_to_end(chave)
+        usosDoCache.incrementar(resultado="acerto" if resposta else "falha")
+        return resposta
+
+    def guardar(
+        self, versao: int, chave: Tuple, corpo: bytes, cabecalhos: Dict[str, str]
+    ):
+        if len(corpo) > self.limiteDeBytes:
+            return
+        with self.trava:
+            # Uma requisição que começou antes da última alteração não
+            # guarda nada.
+            if versao < self.versao:
+                return
+            if versao > self.versao:
+                self.versao = versao
+                self.entradas.clear()
+                self.bytes = 0
+            anterior = self.entradas.pop(chave, None)
+            if anterior is not None:
+                self.bytes -= len(anterior[0])
+            self.entradas[chave] = (corpo, cabecalhos)
+            self.bytes += len(corpo)
+            while (
+                len(self.entradas) > self.limiteDeEntradas
+                or self.bytes > self.limiteDeBytes
+            ):
+                _, (removido, _) = self.entradas.popitem(last=False)
+                self.bytes -= len(removido)
+
+
+cacheDeRespostas = CacheDeRespostas()
+
+
+def registrarNaoModificado():
+    usosDoCache.incrementar(resultado="naoModificado")
@@ -0,0 +1,100 @@
+import os
+import tempfile
+import unittest
+
+from durabilidadeUtils import (
+    ModosDeDurabilidade,
+    SomaDoArquivo,
+    aplicarRemendos,
+    caminhoDaSoma,
+    caminhoDosRemendos,
+    finaisDosRemendos,
+    gravarSoma,
+    recuperarArquivo,
+    serializarRemendos,
+    sincronizador,
+    somasConhecidas,
+)
+
+CONTEUDO = b"id,nome\n1,Arthas\n2,Jaina\n"
+LINHA_NOVA = b"3,Thrall\n"
+
+
+class TesteRecuperacao(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.caminho = os.path.join(self.diretorio.name, "personagens.csv")
+        with open(self.caminho, mode="wb") as file:
+            file.write(CONTEUDO)
+        gravarSoma(self.caminho, SomaDoArquivo.calcular(self.caminho))
+
+    def tearDown(self):
+        sincronizador.modo = ModosDeDurabilidade.ESTRITO
+        sincronizador.sincronizarPendentes()
+        somasConhecidas.clear()
+        finaisDosRemendos.clear()
+        self.diretorio.cleanup()
+
+    def conteudo(self) -> bytes:
+        with open(self.caminho, mode="rb") as file:
+            return file.read()
+
+    def test_anexo_interrompido_e_refeito(self):
+        # Simula uma queda depois do .remendos e no meio do anexo.
+        anterior = SomaDoArquivo.calcular(self.caminho)
+        remendos = [(len(CONTEUDO), LINHA_NOVA)]
+        esperada = anterior.comRemendos(self.caminho, remendos)
+        with open(caminhoDosRemendos(self.caminho), mode="wb") as file:
+            file.write(serializarRemendos(anterior, esperada, remendos))
+        with open(self.caminho, mode="ab") as file:
+            file.write(LINHA_NOVA[:4])
+
+        self.assertTrue(recuperarArquivo(self.caminho))
+        self.assertEqual(self.conteudo(), CONTEUDO + LINHA_NOVA)
+
+    def test_arquivo_restaurado_nao_e_refeito(self):
+        aplicarRemendos(self.caminho, [(len(CONTEUDO), LINHA_NOVA)])
+        self.assertEqual(self.conteudo(), CONTEUDO + LINHA_NOVA)
+        # Como um git checkout com o servidor parado.
+        with open(self.caminho, mode="wb") as file:
+            file.write(CONTEUDO)
+
+        for _ in range(2):
+            somasConhecidas.clear()
+            self.assertFalse(recuperarArquivo(self.caminho))
+            self.assertEqual(self.conteudo(), CONTEUDO)
+
+    def test_remendos_esperam_a_sincronizacao_em_grupo(self):
+        # Sem a thread do sincronizador: a sincronização é feita à mão.
+        sincronizador.modo = ModosDeDurabilidade.AGRUPADO
+        remendos = caminhoDosRemendos(self.caminho)
+        aplicarRemendos(self.caminho, [(len(CONTEUDO), LINHA_NOVA)])
+        self.assertGreater(os.path.getsize(remendos), 0)
+        aplicarRemendos(self.caminho, [(len(CONTEUDO + LINHA_NOVA), LINHA_NOVA)])
+
+        sincronizador.sincronizarPendentes()
+        self.assertEqual(os.path.getsize(remendos), 0)
+        self.assertEqual(self.conteudo(), CONTEUDO + LINHA_NOVA * 2)
+
+    def test_lotes_agrupados_refeitos_com_a_soma_nova(self):
+        # Queda antes da sincronização em grupo: a .soma nova chegou ao disco,
+        # os bytes dos dois lotes não.
+        sincronizador.modo = ModosDeDurabilidade.AGRUPADO
+        aplicarRemendos(self.caminho, [(len(CONTEUDO), LINHA_NOVA)])
+        aplicarRemendos(self.caminho, [(0, b"9")])
+        with open(caminhoDaSoma(self.caminho), mode="rb") as file:
+            somaGravada = file.read()
+        with open(self.caminho, mode="wb") as file:
+            file.write(CONTEUDO)
+        sincronizador.acoes.clear()
+
+        somasConhecidas.clear()
+        finaisDosRemendos.clear()
+        self.assertTrue(recuperarArquivo(self.caminho, aceitarAlteracoes=False))
+        self.assertEqual(self.conteudo(), b"9" + CONTEUDO[1:] + LINHA_NOVA)
+        with open(caminhoDaSoma(self.caminho), mode="rb") as file:
+            self.assertEqual(file.read(), somaGravada)
+
+
+if __name__ == "__main__":
+    unittest.main()